@@ -1,10 +1,13 @@
 from __future__ import annotations
-from typing import Optional, Any
+from typing import Optional, Any, Callable, Iterator
 import os
 import time
 import traceback # error Then The debuggings
 import json
 import asyncio
+import contextvars
+import queue
+import threading
 
 # Load env if available
 try:
@@ -13,28 +16,50 @@ try:
 except Exception:
     pass
 
-# HTTP client
-try:
-    import requests
-    from requests.exceptions import RequestException, Timeout as RequestsTimeout
-except Exception:
-    requests = None
-    RequestException = RequestsTimeout = Exception
+# HTTP client (one pooled keep-alive client shared by every agent stage and report type)
+from llm_http import TRANSIENT_ERRORS, aclose_async_http_client, async_http_post, async_http_stream, get_http_stats, http_get, http_post, httpx
 
 # RAG retrieval (your module)
 try:
-    from rag_retrieval import retrieve_combined_data, retrieve_sales_data, retrieve_marketing_data
+    from rag_retrieval import (
+        retrieve_combined_data,
+        retrieve_sales_data,
+        retrieve_marketing_data,
+        retrieve_product_data,
+        retrieve_regional_data,
+        retrieve_custom_data,
+    )
 except Exception:
     # placeholder fallbacks in case import fails at runtime
-    def retrieve_combined_data(q, n_results=5):
+    def retrieve_combined_data(q, n_results=5, **kwargs):
         return f"[RAG missing] {q}"
 
-    def retrieve_sales_data(q, n_results=5):
+    def retrieve_sales_data(q, n_results=5, **kwargs):
         return f"[RAG missing] {q}"
 
-    def retrieve_marketing_data(q, n_results=5):
+    def retrieve_marketing_data(q, n_results=5, **kwargs):
         return f"[RAG missing] {q}"
 
+    retrieve_product_data = retrieve_regional_data = retrieve_custom_data = retrieve_combined_data
+
+# Async retrievers (run on rag_retrieval's bounded thread pool)
+try:
+    from rag_retrieval import (
+        retrieve_combined_data_async,
+        retrieve_sales_data_async,
+        retrieve_marketing_data_async,
+        retrieve_product_data_async,
+        retrieve_regional_data_async,
+        retrieve_custom_data_async,
+    )
+    ASYNC_RETRIEVAL_AVAILABLE = True
+except Exception:
+    ASYNC_RETRIEVAL_AVAILABLE = False
+
+# Token budgets per model (replaces fixed character truncation)
+from context_packer import context_token_budget, prompt_token_budget, truncate_to_tokens
+from llm_cache import cached_response, get_llm_cache_stats, response_key, store_response
+
 # Config
 GROQ_API_KEY = os.getenv("GROQ_API_KEY") or None
 # You can keep using the full chat/completions URL, but we also derive base_url for AutoGen.
@@ -74,14 +99,14 @@ except Exception:
 # -------------------------
 # Helpers
 # -------------------------
-def _truncate_context(context: str, max_chars: int = 14000) -> str:
-    if not context:
-        return context
-    if len(context) <= max_chars:
-        return context
-    head = context[: max_chars // 2]
-    tail = context[-(max_chars // 2) :]
-    return head + "\n\n[...context truncated...]\n\n" + tail
+SYSTEM_MESSAGE_MAX_TOKENS = int(os.getenv("LLM_SYSTEM_MESSAGE_MAX_TOKENS", "500"))
+# Streamed between the rejected draft and the revised report (stream_report_with_autogen_multiagent()).
+REVISION_NOTICE = "\n\n---\n_Critic requested changes; revising the report..._\n\n"
+
+
+def _fit_context(context: str, model: Optional[str] = None) -> str:
+    """Safety net for context that did not come through the rag_retrieval packer: keep head + tail within the model's context budget."""
+    return truncate_to_tokens(context, context_token_budget(model or MODEL_NAME), model)
 
 
 def _build_query_with_focus(query: str, analysis_focus: Optional[str] = None) -> str:
@@ -96,6 +121,48 @@ User analysis focus:
 {analysis_focus}"""
 
 
+def _retrieve_context(
+    retrieval_query: str,
+    report_type: str = "combined",
+    n_results: int = 8,
+    filters: Optional[dict] = None,
+    model: Optional[str] = None,
+) -> str:
+    """Fetch RAG context for a report type, pushing structured filters into the vector search.
+
+    product / regional / custom report types use the query-planning retrievers, which map
+    mentions in the query onto metadata predicates. The context is packed to `model`'s budget.
+    """
+    retriever = {
+        "sales": retrieve_sales_data,
+        "marketing": retrieve_marketing_data,
+        "product": retrieve_product_data,
+        "regional": retrieve_regional_data,
+        "custom": retrieve_custom_data,
+    }.get(report_type, retrieve_combined_data)
+    return retriever(retrieval_query, n_results=n_results, filters=filters, model=model)
+
+
+async def _retrieve_context_async(
+    retrieval_query: str,
+    report_type: str = "combined",
+    n_results: int = 8,
+    filters: Optional[dict] = None,
+    model: Optional[str] = None,
+) -> str:
+    """Async _retrieve_context: same context as the sync path, without blocking the event loop."""
+    if not ASYNC_RETRIEVAL_AVAILABLE:
+        return await asyncio.to_thread(_retrieve_context, retrieval_query, report_type, n_results, filters, model)
+    retriever = {
+        "sales": retrieve_sales_data_async,
+        "marketing": retrieve_marketing_data_async,
+        "product": retrieve_product_data_async,
+        "regional": retrieve_regional_data_async,
+        "custom": retrieve_custom_data_async,
+    }.get(report_type, retrieve_combined_data_async)
+    return await retriever(retrieval_query, n_results=n_results, filters=filters, model=model)
+
+
 def _build_analysis_prompt(query: str, context: str, analysis_focus: Optional[str] = None) -> str:
     analysis_focus = (analysis_focus or "").strip()
     focus_block = f"\n\nUser focus / special instruction:\n{analysis_focus}\n" if analysis_focus else ""
@@ -259,8 +326,8 @@ def _extract_result_text(result: Any) -> str:
 
 def _groq_models_list():
     """Attempt to GET /openai/v1/models from Groq (helpful when model selection fails)."""
-    if requests is None:
-        return None, "requests not installed", None
+    if httpx is None:
+        return None, "httpx not installed", None
     parsed_url = GROQ_API_URL
     base = None
     try:
@@ -270,7 +337,7 @@ def _groq_models_list():
         base = f"{p.scheme}://{p.netloc}"
         models_url = urljoin(base, "/openai/v1/models")
         headers = {"Authorization": f"Bearer {GROQ_API_KEY}"} if GROQ_API_KEY else {}
-        r = requests.get(models_url, headers=headers, timeout=20)
+        r = http_get(models_url, headers=headers, timeout=20)
         try:
             body = r.json()
         except Exception:
@@ -352,9 +419,68 @@ def _make_autogen_client(model: str):
     raise last_exc or RuntimeError("Failed to create AutoGen model client")
 
 
-async def _run_autogen_agent(agent, task: str) -> str:
-    result = await agent.run(task=task)
-    return _extract_result_text(result)
+async def _agent_has_history(agent) -> bool:
+    """True unless the agent's saved state shows an empty model context (unknown state counts as history)."""
+    save_state = getattr(agent, "save_state", None)
+    if save_state is None:
+        return True
+    try:
+        state = await save_state()
+    except Exception:
+        return True
+    return bool((state.get("llm_context") or {}).get("messages"))
+
+
+async def _run_autogen_agent(
+    agent,
+    task: str,
+    model: Optional[str] = None,
+    system_message: Optional[str] = None,
+    emit: Optional[Callable[[Optional[str]], None]] = None,
+) -> str:
+    """
+    agent.run(task) through the LLM response cache when `model` is given.
+    Only single-turn calls are cached: the key covers the system message and task, so an agent
+    that already holds earlier turns (which the model would also see) always runs live. A cache
+    hit leaves the agent's history empty, so its next call is single-turn again.
+    With `emit`, the agent runs via run_stream() and each model chunk is passed to emit as it arrives.
+    """
+    cache_key = None
+    if model and not await _agent_has_history(agent):
+        cache_key = response_key(model, system_message, task, TEMPERATURE, MAX_TOKENS)
+    cached = cached_response(cache_key) if cache_key else None
+    if cached is not None:
+        if emit:
+            emit(cached)
+        return cached
+    if emit and hasattr(agent, "run_stream"):
+        result, streamed = None, False
+        async for item in agent.run_stream(task=task):
+            if type(item).__name__ == "ModelClientStreamingChunkEvent":
+                emit(item.content)
+                streamed = True
+            elif hasattr(item, "stop_reason"):
+                result = item  # TaskResult comes last
+        text = _extract_result_text(result)
+        if not streamed:
+            emit(text)  # client streaming unsupported: show the stage's output in one piece
+    else:
+        text = _extract_result_text(await agent.run(task=task))
+        if emit:
+            emit(text)
+    if cache_key:
+        store_response(cache_key, model, text)
+    return text
+
+
+def _assistant_agent(name: str, model_client: Any, system_message: str, stream: bool = False):
+    """AssistantAgent, with token streaming from the model client when requested and supported."""
+    if stream:
+        try:
+            return AssistantAgent(name=name, model_client=model_client, system_message=system_message, model_client_stream=True)
+        except TypeError:
+            pass  # older AgentChat without model_client_stream
+    return AssistantAgent(name=name, model_client=model_client, system_message=system_message)
 
 
 async def _autogen_multiagent_pipeline(
@@ -362,74 +488,69 @@ async def _autogen_multiagent_pipeline(
     report_type: str = "combined",
     n_results: int = 8,
     analysis_focus: str = "",
+    filters: Optional[dict] = None,
+    emit: Optional[Callable[[Optional[str]], None]] = None,
 ) -> str:
     """
     AutoGen-based pipeline using AssistantAgent.run() (current AgentChat API).
     Sequence:
       Retriever -> Analyst -> Writer -> Critic -> Analyst Revision -> Writer -> Critic
+    Writer output is streamed to `emit` when given (see stream_report_with_autogen_multiagent()).
     """
     retrieval_query = _build_query_with_focus(query, analysis_focus)
 
-    if report_type == "sales":
-        context = retrieve_sales_data(retrieval_query, n_results=n_results)
-    elif report_type == "marketing":
-        context = retrieve_marketing_data(retrieval_query, n_results=n_results)
-    else:
-        context = retrieve_combined_data(retrieval_query, n_results=n_results)
-
-    context = _truncate_context(context, max_chars=14000)
-
     model_candidates = [MODEL_NAME] if MODEL_NAME else []
     model_candidates += [m for m in GROQ_FALLBACK_MODELS if m not in model_candidates]
     if not model_candidates:
         model_candidates = ["llama-3.3-70b-versatile"]
 
+    # Retrieval runs in the background while the model client and agents are set up; it is
+    # packed for the first candidate and trimmed further by _fit_context() on fallback.
+    retrieval = asyncio.ensure_future(
+        _retrieve_context_async(
+            retrieval_query, report_type=report_type, n_results=n_results, filters=filters, model=model_candidates[0]
+        )
+    )
+
     last_exc = None
     for candidate in model_candidates:
         model_client = None
         try:
             model_client = _make_autogen_client(candidate)
 
-            analyst = AssistantAgent(
-                name="data_analyst",
-                model_client=model_client,
-                system_message=(
-                    "You are a Senior Data Analyst specializing in sales and marketing analytics. "
-                    "Be precise, data-driven, and align your analysis to the user's focus."
-                ),
+            analyst_system = (
+                "You are a Senior Data Analyst specializing in sales and marketing analytics. "
+                "Be precise, data-driven, and align your analysis to the user's focus."
             )
-            writer = AssistantAgent(
-                name="report_writer",
-                model_client=model_client,
-                system_message=(
-                    "You are a Professional Report Writer specialized in business reporting. "
-                    "Write clear, actionable executive-level reports."
-                ),
+            writer_system = (
+                "You are a Professional Report Writer specialized in business reporting. "
+                "Write clear, actionable executive-level reports."
             )
-            critic = AssistantAgent(
-                name="report_critic",
-                model_client=model_client,
-                system_message=(
-                    "You are a strict but helpful senior critic for business reports. "
-                    "Judge factual consistency, missing insights, unsupported claims, clarity, professionalism, and actionability."
-                ),
+            critic_system = (
+                "You are a strict but helpful senior critic for business reports. "
+                "Judge factual consistency, missing insights, unsupported claims, clarity, professionalism, and actionability."
             )
+            analyst = AssistantAgent(name="data_analyst", model_client=model_client, system_message=analyst_system)
+            writer = _assistant_agent("report_writer", model_client, writer_system, stream=emit is not None)
+            critic = AssistantAgent(name="report_critic", model_client=model_client, system_message=critic_system)
+
+            context = _fit_context(await retrieval, model=candidate)
 
             # 1) Analyst creates initial findings
             analysis_prompt = _build_analysis_prompt(query, context, analysis_focus=analysis_focus)
-            analyst_findings = await _run_autogen_agent(analyst, analysis_prompt)
+            analyst_findings = await _run_autogen_agent(analyst, analysis_prompt, candidate, analyst_system)
             if not analyst_findings:
                 raise RuntimeError("AutoGen analyst returned empty output")
 
             # 2) Writer creates initial report
             report_prompt = _build_report_prompt(query, analyst_findings, analysis_focus=analysis_focus)
-            draft_report = await _run_autogen_agent(writer, report_prompt)
+            draft_report = await _run_autogen_agent(writer, report_prompt, candidate, writer_system, emit)
             if not draft_report:
                 raise RuntimeError("AutoGen writer returned empty output")
 
             # 3) Critic reviews the report
             critic_prompt = _build_critic_prompt(query, analyst_findings, draft_report, analysis_focus=analysis_focus)
-            critic_feedback = await _run_autogen_agent(critic, critic_prompt)
+            critic_feedback = await _run_autogen_agent(critic, critic_prompt, candidate, critic_system)
             if not critic_feedback:
                 critic_feedback = "STATUS: UNKNOWN"
 
@@ -445,13 +566,15 @@ async def _autogen_multiagent_pipeline(
                     critic_feedback=critic_feedback,
                     analysis_focus=analysis_focus,
                 )
-                revised_analyst_findings = await _run_autogen_agent(analyst, analyst_revision_prompt)
+                revised_analyst_findings = await _run_autogen_agent(analyst, analyst_revision_prompt, candidate, analyst_system)
                 if revised_analyst_findings:
                     analyst_findings = revised_analyst_findings.strip()
 
                     # 5) Writer rebuilds report from revised analyst findings
                     report_prompt = _build_report_prompt(query, analyst_findings, analysis_focus=analysis_focus)
-                    revised_report = await _run_autogen_agent(writer, report_prompt)
+                    if emit:
+                        emit(REVISION_NOTICE)
+                    revised_report = await _run_autogen_agent(writer, report_prompt, candidate, writer_system, emit)
                     if revised_report:
                         final_report = revised_report.strip()
 
@@ -459,6 +582,8 @@ async def _autogen_multiagent_pipeline(
                     critic_feedback = await _run_autogen_agent(
                         critic,
                         _build_critic_prompt(query, analyst_findings, final_report, analysis_focus=analysis_focus),
+                        candidate,
+                        critic_system,
                     ) or critic_feedback
 
             bundle = (
@@ -472,6 +597,8 @@ async def _autogen_multiagent_pipeline(
             last_exc = e
             print(f"[ReportGen] AutoGen candidate '{candidate}' failed: {e}")
             traceback.print_exc()
+            if emit:
+                emit(None)  # discard anything this candidate streamed
         finally:
             try:
                 if model_client is not None and hasattr(model_client, "close"):
@@ -479,19 +606,22 @@ async def _autogen_multiagent_pipeline(
             except Exception:
                 pass
 
+    if not retrieval.done():
+        retrieval.cancel()
     raise RuntimeError(f"AutoGen pipeline failed for all candidates. Last error: {last_exc}")
 
 
 # -------------------------
 # GROQ helper (OpenAI-compatible messages)
 # -------------------------
-def _groq_chat(prompt: str, system_message: Optional[str] = None, model: Optional[str] = MODEL_NAME) -> str:
-    """
-    Send an OpenAI-compatible `messages` payload to Groq.
-    Automatically attempts fallback models if Groq returns model_decommissioned or model_not_found.
-    """
-    if requests is None:
-        raise RuntimeError("requests package not installed. Install `requests` to use GROQ fallback.")
+class _ModelRejected(Exception):
+    """Groq reports the model as decommissioned / not found: move on to the next candidate."""
+
+
+def _groq_endpoint(model: Optional[str]) -> tuple:
+    """(api_key, api_url) after checking the client, credentials and model are configured."""
+    if httpx is None:
+        raise RuntimeError("httpx package not installed. Install `httpx` to use GROQ fallback.")
     api_key = GROQ_API_KEY or os.environ.get("GROQ_API_KEY", "")
     api_url = GROQ_API_URL or os.environ.get("GROQ_API_URL", "")
     if not api_key or not api_url:
@@ -504,157 +634,265 @@ def _groq_chat(prompt: str, system_message: Optional[str] = None, model: Optiona
             f"Attempted models list endpoint returned status={status} body={json.dumps(body, indent=2) if isinstance(body,(dict,list)) else body}\n"
             f"Models endpoint tried: {url}"
         )
+    return api_key, api_url
 
-    safe_prompt = _truncate_context(prompt, max_chars=14000)
-    safe_system = _truncate_context(system_message or "", max_chars=2000)
+
+def _groq_request(prompt: str, safe_system: str, candidate: str, api_key: str) -> tuple:
+    """(headers, payload) for one candidate; the prompt is fitted to that model's token budget (smaller models get less)."""
+    safe_prompt = truncate_to_tokens(prompt, prompt_token_budget(candidate) - SYSTEM_MESSAGE_MAX_TOKENS, candidate)
     messages = []
     if safe_system:
         messages.append({"role": "system", "content": safe_system})
     messages.append({"role": "user", "content": safe_prompt})
+    payload = {
+        "model": candidate,
+        "messages": messages,
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+    }
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    return headers, payload
+
+
+def _groq_cache_key(payload: dict) -> str:
+    """Response-cache key of a request payload (the fitted prompt actually sent, not the caller's)."""
+    system = next((m["content"] for m in payload["messages"] if m["role"] == "system"), "")
+    return response_key(payload["model"], system, payload["messages"][-1]["content"], payload["temperature"], payload["max_tokens"])
+
+
+def _groq_response_text(resp: Any, candidate: str) -> str:
+    """Completion text of a Groq response; raises _ModelRejected / RuntimeError on API errors."""
+    if resp.status_code >= 400:
+        try:
+            body = resp.json()
+        except Exception:
+            body = resp.text
+        # If model error suggests decommission or not found -> next candidate
+        code = None
+        if isinstance(body, dict):
+            err = body.get("error", {})
+            code = err.get("code") or err.get("type")
+        if code and ("model_decommissioned" in str(code) or "model_not_found" in str(code)):
+            print(f"[agent][_groq_chat] Groq rejected model '{candidate}': {body}")
+            raise _ModelRejected(candidate)
+        raise RuntimeError(
+            f"GROQ API error: status={resp.status_code} body={json.dumps(body) if isinstance(body,(dict,list)) else body}"
+        )
+    # parse success
+    resp_json = resp.json()
+    if isinstance(resp_json, dict) and "choices" in resp_json and isinstance(resp_json["choices"], list) and resp_json["choices"]:
+        choice = resp_json["choices"][0]
+        if isinstance(choice, dict) and "message" in choice and isinstance(choice["message"], dict):
+            return str(choice["message"].get("content", "")).strip()
+        if isinstance(choice, dict) and "text" in choice:
+            return str(choice.get("text", "")).strip()
+    # alternate shapes
+    if isinstance(resp_json, dict) and "outputs" in resp_json and isinstance(resp_json["outputs"], list) and resp_json["outputs"]:
+        out0 = resp_json["outputs"][0]
+        if isinstance(out0, dict):
+            for k in ("content", "text", "output"):
+                if k in out0:
+                    return str(out0[k]).strip()
+    return json.dumps(resp_json, indent=2)
+
+
+def _groq_exhausted(candidates: list, last_exc: Optional[Exception]) -> RuntimeError:
+    # exhausted candidates; include the models list for a helpful error
+    status, body, url = _groq_models_list()
+    return RuntimeError(
+        f"GROQ: all model candidates failed. Last exception: {last_exc}\n"
+        f"Attempted models: {candidates}\n"
+        f"Models endpoint returned status={status} body={json.dumps(body, indent=2) if isinstance(body,(dict,list)) else body}\n"
+        f"Please set GROQ_MODEL to a model you have access to (update .env)."
+    )
+
+
+def _groq_chat(prompt: str, system_message: Optional[str] = None, model: Optional[str] = MODEL_NAME) -> str:
+    """
+    Send an OpenAI-compatible `messages` payload to Groq.
+    Automatically attempts fallback models if Groq returns model_decommissioned or model_not_found.
+    """
+    api_key, api_url = _groq_endpoint(model)
+    safe_system = truncate_to_tokens(system_message or "", SYSTEM_MESSAGE_MAX_TOKENS)
 
     # candidate models: requested model then fallback list
     candidates = [model] + [m for m in GROQ_FALLBACK_MODELS if m != model]
 
     last_exc = None
     for candidate in candidates:
+        headers, payload = _groq_request(prompt, safe_system, candidate, api_key)
+        cache_key = _groq_cache_key(payload)
+        cached = cached_response(cache_key)
+        if cached is not None:
+            return cached
         attempt = 0
         while attempt < RETRY_COUNT:
             attempt += 1
-            payload = {
-                "model": candidate,
-                "messages": messages,
-                "max_tokens": MAX_TOKENS,
-                "temperature": TEMPERATURE,
-            }
-            headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
             try:
-                resp = requests.post(api_url, headers=headers, json=payload, timeout=60)
-                if resp.status_code >= 400:
-                    try:
-                        body = resp.json()
-                    except Exception:
-                        body = resp.text
-                    # If model error suggests decommission or not found -> break to next candidate
-                    code = None
-                    if isinstance(body, dict):
-                        err = body.get("error", {})
-                        code = err.get("code") or err.get("type")
-                    if code and ("model_decommissioned" in str(code) or "model_not_found" in str(code)):
-                        print(f"[agent][_groq_chat] Groq rejected model '{candidate}': {body}")
-                        break  # try next model candidate
-                    raise RuntimeError(
-                        f"GROQ API error: status={resp.status_code} body={json.dumps(body) if isinstance(body,(dict,list)) else body}"
-                    )
-                # parse success
-                resp_json = resp.json()
-                if isinstance(resp_json, dict) and "choices" in resp_json and isinstance(resp_json["choices"], list) and resp_json["choices"]:
-                    choice = resp_json["choices"][0]
-                    if isinstance(choice, dict) and "message" in choice and isinstance(choice["message"], dict):
-                        return str(choice["message"].get("content", "")).strip()
-                    if isinstance(choice, dict) and "text" in choice:
-                        return str(choice.get("text", "")).strip()
-                # alternate shapes
-                if isinstance(resp_json, dict) and "outputs" in resp_json and isinstance(resp_json["outputs"], list) and resp_json["outputs"]:
-                    out0 = resp_json["outputs"][0]
-                    if isinstance(out0, dict):
-                        for k in ("content", "text", "output"):
-                            if k in out0:
-                                return str(out0[k]).strip()
-                return json.dumps(resp_json, indent=2)
-            except (RequestsTimeout, RequestException) as e:
+                text = _groq_response_text(http_post(api_url, headers=headers, json=payload), candidate)
+                store_response(cache_key, candidate, text)
+                return text
+            except _ModelRejected:
+                break  # try next model candidate
+            except TRANSIENT_ERRORS as e:
                 last_exc = e
                 print(f"[agent][_groq_chat] Attempt {attempt} transient error for model {candidate}: {e}")
-                if attempt >= RETRY_COUNT:
-                    break
-                time.sleep(RETRY_BACKOFF ** (attempt - 1))
-                continue
             except Exception as e:
                 last_exc = e
                 print(f"[agent][_groq_chat] Attempt {attempt} error for model {candidate}: {e}")
-                if attempt >= RETRY_COUNT:
-                    break
-                time.sleep(RETRY_BACKOFF ** (attempt - 1))
-                continue
+            if attempt >= RETRY_COUNT:
+                break
+            time.sleep(RETRY_BACKOFF ** (attempt - 1))
         # next candidate
         print(f"[agent][_groq_chat] Trying next model candidate after '{candidate}' (if any)")
-    # exhausted candidates; return models list for helpful error
-    status, body, url = _groq_models_list()
-    raise RuntimeError(
-        f"GROQ: all model candidates failed. Last exception: {last_exc}\n"
-        f"Attempted models: {candidates}\n"
-        f"Models endpoint returned status={status} body={json.dumps(body, indent=2) if isinstance(body,(dict,list)) else body}\n"
-        f"Please set GROQ_MODEL to a model you have access to (update .env)."
-    )
+    raise _groq_exhausted(candidates, last_exc)
+
+
+async def _groq_chat_async(prompt: str, system_message: Optional[str] = None, model: Optional[str] = MODEL_NAME) -> str:
+    """_groq_chat on the event loop's pooled httpx.AsyncClient: same model fallback and retries, asyncio.sleep backoff."""
+    api_key, api_url = _groq_endpoint(model)
+    safe_system = truncate_to_tokens(system_message or "", SYSTEM_MESSAGE_MAX_TOKENS)
+
+    candidates = [model] + [m for m in GROQ_FALLBACK_MODELS if m != model]
+
+    last_exc = None
+    for candidate in candidates:
+        headers, payload = _groq_request(prompt, safe_system, candidate, api_key)
+        cache_key = _groq_cache_key(payload)
+        cached = cached_response(cache_key)
+        if cached is not None:
+            return cached
+        attempt = 0
+        while attempt < RETRY_COUNT:
+            attempt += 1
+            try:
+                text = _groq_response_text(await async_http_post(api_url, headers=headers, json=payload), candidate)
+                store_response(cache_key, candidate, text)
+                return text
+            except _ModelRejected:
+                break
+            except TRANSIENT_ERRORS as e:
+                last_exc = e
+                print(f"[agent][_groq_chat_async] Attempt {attempt} transient error for model {candidate}: {e}")
+            except Exception as e:
+                last_exc = e
+                print(f"[agent][_groq_chat_async] Attempt {attempt} error for model {candidate}: {e}")
+            if attempt >= RETRY_COUNT:
+                break
+            await asyncio.sleep(RETRY_BACKOFF ** (attempt - 1))
+        print(f"[agent][_groq_chat_async] Trying next model candidate after '{candidate}' (if any)")
+    raise await asyncio.to_thread(_groq_exhausted, candidates, last_exc)
+
+
+def _groq_stream_delta(event: Any) -> str:
+    """Text of one SSE chunk (OpenAI-compatible `choices[0].delta.content`)."""
+    if isinstance(event, dict) and event.get("choices"):
+        delta = event["choices"][0].get("delta") or {}
+        return str(delta.get("content") or "")
+    return ""
+
+
+async def _groq_chat_stream_async(
+    prompt: str,
+    emit: Optional[Callable[[Optional[str]], None]],
+    system_message: Optional[str] = None,
+    model: Optional[str] = MODEL_NAME,
+) -> str:
+    """
+    _groq_chat_async with `stream: true`: every content delta is passed to emit as it arrives and the
+    full text is returned (and cached). A retry or model fallback after partial output emits None first.
+    """
+    if emit is None:
+        return await _groq_chat_async(prompt, system_message=system_message, model=model)
+    api_key, api_url = _groq_endpoint(model)
+    safe_system = truncate_to_tokens(system_message or "", SYSTEM_MESSAGE_MAX_TOKENS)
+
+    candidates = [model] + [m for m in GROQ_FALLBACK_MODELS if m != model]
+
+    last_exc = None
+    for candidate in candidates:
+        headers, payload = _groq_request(prompt, safe_system, candidate, api_key)
+        cache_key = _groq_cache_key(payload)
+        cached = cached_response(cache_key)
+        if cached is not None:
+            emit(cached)
+            return cached
+        attempt = 0
+        while attempt < RETRY_COUNT:
+            attempt += 1
+            parts: list = []
+            try:
+                async with async_http_stream("POST", api_url, headers=headers, json={**payload, "stream": True}) as resp:
+                    if resp.status_code >= 400:
+                        await resp.aread()
+                        _groq_response_text(resp, candidate)  # raises with the API error
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        delta = _groq_stream_delta(json.loads(data))
+                        if delta:
+                            parts.append(delta)
+                            emit(delta)
+                text = "".join(parts).strip()
+                store_response(cache_key, candidate, text)
+                return text
+            except _ModelRejected:
+                break
+            except TRANSIENT_ERRORS as e:
+                last_exc = e
+                print(f"[agent][_groq_chat_stream_async] Attempt {attempt} transient error for model {candidate}: {e}")
+            except Exception as e:
+                last_exc = e
+                print(f"[agent][_groq_chat_stream_async] Attempt {attempt} error for model {candidate}: {e}")
+            if parts:
+                emit(None)  # the retry / next candidate starts the text over
+            if attempt >= RETRY_COUNT:
+                break
+            await asyncio.sleep(RETRY_BACKOFF ** (attempt - 1))
+        print(f"[agent][_groq_chat_stream_async] Trying next model candidate after '{candidate}' (if any)")
+    raise await asyncio.to_thread(_groq_exhausted, candidates, last_exc)
 
 
 # -------------------------
 # Main multi-agent flow
 # -------------------------
-def generate_report_with_autogen_multiagent(
+async def _groq_multiagent_pipeline(
     query: str,
     report_type: str = "combined",
     n_results: int = 8,
     analysis_focus: str = "",
+    filters: Optional[dict] = None,
+    emit: Optional[Callable[[Optional[str]], None]] = None,
 ) -> str:
-    """
-    Best-effort multi-agent report generation.
-
-    Preferred path:
-      AutoGen AgentChat AssistantAgent.run()  -> Analyst -> Writer -> Critic -> Analyst revision -> Writer -> Critic
-
-    Fallback:
-      Groq chat completions path with the same analyst/writer/critic stages
-    """
-    print("\n[ReportGen] Starting Multi-Agent Analysis...")
-
-    # 1) Try current AutoGen AgentChat API first
-    if AUTOGEN_AVAILABLE:
-        try:
-            return asyncio.run(
-                _autogen_multiagent_pipeline(
-                    query=query,
-                    report_type=report_type,
-                    n_results=n_results,
-                    analysis_focus=analysis_focus,
-                )
-            )
-        except Exception as e:
-            print(f"[ReportGen] AutoGen pipeline failed (falling back to GROQ): {e}")
-            traceback.print_exc()
-
-    # 2) GROQ fallback
-    print("[ReportGen] Using GROQ fallback for analysis + report generation...")
-    if not (GROQ_API_KEY or os.environ.get("GROQ_API_KEY")):
-        raise RuntimeError("Neither AutoGen nor GROQ configured. Set GROQ_API_KEY and GROQ_API_URL in .env")
-
+    """GROQ chat-completions pipeline with the same analyst/writer/critic stages, fully async; writer output streams to `emit`."""
     retrieval_query = _build_query_with_focus(query, analysis_focus)
 
-    if report_type == "sales":
-        context = retrieve_sales_data(retrieval_query, n_results=n_results)
-    elif report_type == "marketing":
-        context = retrieve_marketing_data(retrieval_query, n_results=n_results)
-    else:
-        context = retrieve_combined_data(retrieval_query, n_results=n_results)
+    context = await _retrieve_context_async(
+        retrieval_query, report_type=report_type, n_results=n_results, filters=filters, model=MODEL_NAME
+    )
 
-    context = _truncate_context(context, max_chars=14000)
+    context = _fit_context(context, model=MODEL_NAME)
 
     analyst_system = "You are a Senior Data Analyst specializing in sales and marketing analytics. Be precise and analytical."
     analysis_prompt = _build_analysis_prompt(query, context, analysis_focus=analysis_focus)
 
-    analyst_findings = _groq_chat(analysis_prompt, system_message=analyst_system, model=MODEL_NAME)
+    analyst_findings = await _groq_chat_async(analysis_prompt, system_message=analyst_system, model=MODEL_NAME)
     if not analyst_findings:
         raise RuntimeError("GROQ returned empty analyst findings")
 
     writer_system = "You are a Professional Report Writer specialized in business reporting. Write clear, actionable executive-level reports."
     report_prompt = _build_report_prompt(query, analyst_findings, analysis_focus=analysis_focus)
 
-    final_report = _groq_chat(report_prompt, system_message=writer_system, model=MODEL_NAME)
+    final_report = await _groq_chat_stream_async(report_prompt, emit, system_message=writer_system, model=MODEL_NAME)
     if not final_report:
         raise RuntimeError("GROQ returned empty final report")
 
     critic_system = "You are a strict but helpful senior critic for business reports."
     critic_prompt = _build_critic_prompt(query, analyst_findings, final_report, analysis_focus=analysis_focus)
-    critic_feedback = _groq_chat(critic_prompt, system_message=critic_system, model=MODEL_NAME)
+    critic_feedback = await _groq_chat_async(critic_prompt, system_message=critic_system, model=MODEL_NAME)
     if not critic_feedback:
         critic_feedback = "STATUS: UNKNOWN"
 
@@ -667,25 +905,195 @@ def generate_report_with_autogen_multiagent(
             critic_feedback=critic_feedback,
             analysis_focus=analysis_focus,
         )
-        revised_analyst_findings = _groq_chat(analyst_revision_prompt, system_message=analyst_system, model=MODEL_NAME)
+        revised_analyst_findings = await _groq_chat_async(analyst_revision_prompt, system_message=analyst_system, model=MODEL_NAME)
         if revised_analyst_findings:
             analyst_findings = revised_analyst_findings.strip()
 
             report_prompt = _build_report_prompt(query, analyst_findings, analysis_focus=analysis_focus)
-            revised_report = _groq_chat(report_prompt, system_message=writer_system, model=MODEL_NAME)
+            if emit:
+                emit(REVISION_NOTICE)
+            revised_report = await _groq_chat_stream_async(report_prompt, emit, system_message=writer_system, model=MODEL_NAME)
             if revised_report:
                 final_report = revised_report.strip()
 
-            critic_feedback = _groq_chat(
+            critic_feedback = await _groq_chat_async(
                 _build_critic_prompt(query, analyst_findings, final_report, analysis_focus=analysis_focus),
                 system_message=critic_system,
                 model=MODEL_NAME,
             ) or critic_feedback
 
-    print("[ReportGen] GROQ flow complete with critic review.")
+    http, cache = get_http_stats(), get_llm_cache_stats()
+    print(
+        f"[ReportGen] GROQ flow complete with critic review "
+        f"(HTTP pool: {http['requests']} requests, {http['reused_connections']} on reused connections; "
+        f"LLM cache: {cache.get('hits', 0)} hits)."
+    )
     return f"{final_report}\n\n---\nCritic Review\n{critic_feedback.strip()}"
 
 
+async def generate_report_with_autogen_multiagent_async(
+    query: str,
+    report_type: str = "combined",
+    n_results: int = 8,
+    analysis_focus: str = "",
+    filters: Optional[dict] = None,
+    emit: Optional[Callable[[Optional[str]], None]] = None,
+) -> str:
+    """
+    Async generate_report_with_autogen_multiagent(): AutoGen first, then the GROQ fallback.
+
+    Both pipelines await network I/O on the caller's event loop, so several reports can
+    run concurrently in one process (e.g. asyncio.gather over report types).
+
+    `emit` receives the writer / revision stage text as it is generated; None means
+    "discard what was emitted so far" (a model or pipeline fallback starts over).
+    """
+    print("\n[ReportGen] Starting Multi-Agent Analysis...")
+
+    # 1) Try current AutoGen AgentChat API first
+    if AUTOGEN_AVAILABLE:
+        try:
+            return await _autogen_multiagent_pipeline(
+                query=query,
+                report_type=report_type,
+                n_results=n_results,
+                analysis_focus=analysis_focus,
+                filters=filters,
+                emit=emit,
+            )
+        except Exception as e:
+            print(f"[ReportGen] AutoGen pipeline failed (falling back to GROQ): {e}")
+            traceback.print_exc()
+            if emit:
+                emit(None)
+
+    # 2) GROQ fallback
+    print("[ReportGen] Using GROQ fallback for analysis + report generation...")
+    if not (GROQ_API_KEY or os.environ.get("GROQ_API_KEY")):
+        raise RuntimeError("Neither AutoGen nor GROQ configured. Set GROQ_API_KEY and GROQ_API_URL in .env")
+
+    return await _groq_multiagent_pipeline(
+        query=query,
+        report_type=report_type,
+        n_results=n_results,
+        analysis_focus=analysis_focus,
+        filters=filters,
+        emit=emit,
+    )
+
+
+async def _closing_http_clients(coro: Any) -> Any:
+    """Await coro, then close the loop's pooled async HTTP client before asyncio.run() ends the loop."""
+    try:
+        return await coro
+    finally:
+        await aclose_async_http_client()
+
+
+def generate_report_with_autogen_multiagent(
+    query: str,
+    report_type: str = "combined",
+    n_results: int = 8,
+    analysis_focus: str = "",
+    filters: Optional[dict] = None,
+) -> str:
+    """
+    Best-effort multi-agent report generation.
+
+    `filters` (region, quarter, product, channel, segment, numeric ranges) are applied
+    as metadata filters during retrieval; see rag_retrieval.build_where_clause().
+
+    Preferred path:
+      AutoGen AgentChat AssistantAgent.run()  -> Analyst -> Writer -> Critic -> Analyst revision -> Writer -> Critic
+
+    Fallback:
+      Groq chat completions path with the same analyst/writer/critic stages
+
+    Synchronous wrapper around generate_report_with_autogen_multiagent_async().
+    """
+    return asyncio.run(
+        _closing_http_clients(
+            generate_report_with_autogen_multiagent_async(
+                query,
+                report_type=report_type,
+                n_results=n_results,
+                analysis_focus=analysis_focus,
+                filters=filters,
+            )
+        )
+    )
+
+
+# -------------------------
+# Streaming
+# -------------------------
+class ReportStream:
+    """
+    Iterator over the report text as the writer / revision stages generate it.
+
+    The pipeline runs on a background thread with its own event loop (started on the first
+    next()); iteration ends when the report is done, and `result` then holds the same bundle
+    generate_report_with_autogen_multiagent() returns. Pipeline errors are re-raised from the
+    iterator. Works directly with Streamlit's st.write_stream().
+    """
+
+    _DONE = object()
+
+    def __init__(self, query: str, **kwargs: Any):
+        self.query = query
+        self.result: Optional[str] = None
+        self._kwargs = kwargs
+        self._context = contextvars.copy_context()  # e.g. bypass_llm_cache() of the caller
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+
+    def _run(self) -> None:
+        try:
+            self.result = asyncio.run(
+                _closing_http_clients(
+                    generate_report_with_autogen_multiagent_async(self.query, emit=self._queue.put, **self._kwargs)
+                )
+            )
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._queue.put(self._DONE)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._thread is not None:
+            raise RuntimeError("ReportStream can only be iterated once")
+        self._thread = threading.Thread(target=self._context.run, args=(self._run,), daemon=True, name="report-stream")
+        self._thread.start()
+        emitted = False
+        while True:
+            item = self._queue.get()
+            if item is self._DONE:
+                break
+            if item is None:
+                if emitted:
+                    yield "\n\n---\n_Generation interrupted; starting over..._\n\n"
+                    emitted = False
+                continue
+            if item:
+                emitted = True
+                yield item
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def stream_report_with_autogen_multiagent(
+    query: str,
+    report_type: str = "combined",
+    n_results: int = 8,
+    analysis_focus: str = "",
+    filters: Optional[dict] = None,
+) -> ReportStream:
+    """Streaming generate_report_with_autogen_multiagent(): iterate for tokens, then read `.result`."""
+    return ReportStream(query, report_type=report_type, n_results=n_results, analysis_focus=analysis_focus, filters=filters)
+
+
 # Backwards-compatible wrapper expected by older code
 def generate_report_with_rag(
     query: str,
@@ -701,6 +1109,9 @@ def generate_report_with_rag(
     )
 
 
+CUSTOM_ANALYST_SYSTEM = "You are a data analyst. Be precise and base your analysis on the context."
+
+
 def generate_custom_report(prompt_with_context: str, analysis_focus: str = "") -> str:
     """Single-step custom prompt (analyst-like)."""
     prompt_with_context = (prompt_with_context or "").strip()
@@ -716,14 +1127,11 @@ User focus / special instruction:
     if AUTOGEN_AVAILABLE:
         try:
             async def _run() -> str:
-                client = _make_autogen_client(MODEL_NAME or GROQ_FALLBACK_MODELS[0])
+                model = MODEL_NAME or GROQ_FALLBACK_MODELS[0]
+                client = _make_autogen_client(model)
                 try:
-                    analyst = AssistantAgent(
-                        name="data_analyst",
-                        model_client=client,
-                        system_message="You are a data analyst. Be precise and base your analysis on the context.",
-                    )
-                    return await _run_autogen_agent(analyst, prompt_with_context)
+                    analyst = AssistantAgent(name="data_analyst", model_client=client, system_message=CUSTOM_ANALYST_SYSTEM)
+                    return await _run_autogen_agent(analyst, prompt_with_context, model, CUSTOM_ANALYST_SYSTEM)
                 finally:
                     try:
                         if hasattr(client, "close"):
@@ -735,11 +1143,7 @@ User focus / special instruction:
         except Exception:
             pass
 
-    return _groq_chat(
-        prompt_with_context,
-        system_message="You are a data analyst. Be precise and base your analysis on the context.",
-        model=MODEL_NAME,
-    )
+    return _groq_chat(prompt_with_context, system_message=CUSTOM_ANALYST_SYSTEM, model=MODEL_NAME)
 
 
 # Quick test when run directly
@@ -0,0 +1,303 @@
+"""
+aggregates.py - precomputed group-by statistics over the ingested records.
+
+Built by vector_db during ingestion from the columnar metadata index and saved
+next to the Chroma files as <collection>.aggregates.npz. Each record type gets
+one cube at its finest grain (sales: region x quarter x product x segment,
+marketing: channel x quarter x segment) holding record counts and measure
+sums. Any slice the retrievers ask for is a boolean mask over the cells plus a
+bincount roll-up, so totals for "North America" or "Q3 2024 email campaigns"
+cost microseconds regardless of how many rows were ingested.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import CHROMA_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# record type -> (group-by dimensions, summed measures)
+CUBES: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "sales": (
+        ("region", "quarter", "product", "customer_segment"),
+        ("revenue", "units_sold"),
+    ),
+    "marketing": (
+        ("channel", "quarter", "target_segment"),
+        ("budget", "impressions", "clicks", "conversions"),
+    ),
+}
+
+DEFAULT_MAX_ROWS = 8
+
+
+def index_path(collection_name: str, base_dir: str = CHROMA_DB_PATH) -> str:
+    return os.path.join(base_dir, f"{collection_name}.aggregates.npz")
+
+
+def _money(value: float) -> str:
+    return f"${value:,.0f}"
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return numerator / denominator if denominator else None
+
+
+def _percent(value: Optional[float]) -> str:
+    return "N/A" if value is None else f"{value * 100:.2f}%"
+
+
+class AggregateCube:
+    """Counts and measure sums for every observed combination of the dimensions."""
+
+    def __init__(
+        self,
+        record_type: str,
+        dimensions: Sequence[str],
+        vocab: Dict[str, List[str]],
+        codes: Dict[str, np.ndarray],
+        counts: np.ndarray,
+        sums: Dict[str, np.ndarray],
+    ):
+        self.record_type = record_type
+        self.dimensions = tuple(dimensions)
+        self.vocab = vocab
+        self.codes = codes
+        self.counts = counts
+        self.sums = sums
+
+    def __len__(self) -> int:
+        return int(self.counts.shape[0])
+
+    @classmethod
+    def from_index(cls, index: Any, record_type: str) -> Optional["AggregateCube"]:
+        """Group the metadata-index rows of one record type into cells; None if it has no rows."""
+        dimensions, measures = CUBES[record_type]
+        type_codes, type_vocab = index.codes("type")
+        if record_type not in type_vocab:
+            return None
+        rows = type_codes == type_vocab.index(record_type)
+        if not rows.any():
+            return None
+
+        vocab: Dict[str, List[str]] = {}
+        stacked: List[np.ndarray] = []
+        for dim in dimensions:
+            try:
+                dim_codes, dim_vocab = index.codes(dim)
+            except KeyError:
+                dim_codes, dim_vocab = np.zeros(len(index), dtype=np.int32), [""]
+            vocab[dim] = list(dim_vocab)
+            stacked.append(dim_codes[rows])
+
+        cells, inverse = np.unique(np.stack(stacked, axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(cells)).astype(np.int64)
+
+        sums: Dict[str, np.ndarray] = {}
+        for measure in measures:
+            try:
+                column = index.column(measure)[rows]
+            except KeyError:
+                column = np.zeros(int(rows.sum()))
+            sums[measure] = np.bincount(inverse, weights=np.nan_to_num(column), minlength=len(cells))
+
+        codes = {dim: cells[:, i].astype(np.int32) for i, dim in enumerate(dimensions)}
+        return cls(record_type, dimensions, vocab, codes, counts, sums)
+
+    # -------------------------
+    # Slicing
+    # -------------------------
+    def mask(self, selection: Optional[Dict[str, Sequence[str]]] = None) -> np.ndarray:
+        """Cells whose dimension values are all in the selection ({dimension: [values]})."""
+        keep = np.ones(len(self), dtype=bool)
+        for dim, values in (selection or {}).items():
+            if dim not in self.codes:
+                raise KeyError(f"'{dim}' is not a dimension of the {self.record_type} aggregates")
+            lookup = {v: i for i, v in enumerate(self.vocab[dim])}
+            wanted = [lookup[v] for v in values if v in lookup]
+            keep &= np.isin(self.codes[dim], np.asarray(wanted, dtype=np.int32))
+        return keep
+
+    def totals(self, selection: Optional[Dict[str, Sequence[str]]] = None) -> Dict[str, float]:
+        keep = self.mask(selection)
+        totals = {"count": int(self.counts[keep].sum())}
+        totals.update({m: float(s[keep].sum()) for m, s in self.sums.items()})
+        return totals
+
+    def rollup(self, dimension: str, selection: Optional[Dict[str, Sequence[str]]] = None) -> List[Tuple[str, Dict[str, float]]]:
+        """Totals per value of one dimension within the selection, sorted by the first measure (largest first)."""
+        keep = self.mask(selection)
+        codes = self.codes[dimension][keep]
+        size = len(self.vocab[dimension])
+        counts = np.bincount(codes, weights=self.counts[keep], minlength=size)
+        sums = {m: np.bincount(codes, weights=s[keep], minlength=size) for m, s in self.sums.items()}
+
+        primary = next(iter(self.sums))
+        rows = [
+            (self.vocab[dimension][code], {"count": int(counts[code]), **{m: float(s[code]) for m, s in sums.items()}})
+            for code in np.flatnonzero(counts)
+        ]
+        return sorted(rows, key=lambda row: row[1][primary], reverse=True)
+
+
+class Aggregates:
+    """The per-record-type cubes of one collection."""
+
+    def __init__(self, cubes: Dict[str, AggregateCube]):
+        self.cubes = cubes
+
+    @classmethod
+    def from_index(cls, index: Any) -> "Aggregates":
+        cubes = {}
+        for record_type in CUBES:
+            cube = AggregateCube.from_index(index, record_type)
+            if cube is not None:
+                cubes[record_type] = cube
+        return cls(cubes)
+
+    def get(self, record_type: str) -> Optional[AggregateCube]:
+        return self.cubes.get(record_type)
+
+    # -------------------------
+    # Prompt formatting
+    # -------------------------
+    def summarize(
+        self,
+        record_type: str,
+        selection: Optional[Dict[str, Sequence[str]]] = None,
+        max_rows: int = DEFAULT_MAX_ROWS,
+    ) -> Optional[str]:
+        """Totals for the selection plus a roll-up along every dimension it does not pin to one value."""
+        cube = self.cubes.get(record_type)
+        if cube is None:
+            return None
+        selection = {d: list(v) for d, v in (selection or {}).items() if v}
+        totals = cube.totals(selection)
+        if not totals["count"]:
+            return None
+
+        scope = "; ".join(f"{d}={', '.join(v)}" for d, v in selection.items()) or "all records"
+        lines = [f"{record_type.upper()} [{scope}] ({totals['count']} records): {self._describe(record_type, totals)}"]
+        for dim in cube.dimensions:
+            if len(selection.get(dim, ())) == 1:
+                continue
+            rows = cube.rollup(dim, selection)
+            if len(rows) < 2:
+                continue
+            shown = [f"{label or 'N/A'}: {self._describe(record_type, stats, brief=True)}" for label, stats in rows[:max_rows]]
+            more = f" (+{len(rows) - max_rows} more)" if len(rows) > max_rows else ""
+            lines.append(f"   by {dim}: " + " | ".join(shown) + more)
+        return "\n".join(lines)
+
+    @staticmethod
+    def _describe(record_type: str, stats: Dict[str, float], brief: bool = False) -> str:
+        count = stats["count"]
+        if record_type == "sales":
+            revenue, units = stats["revenue"], stats["units_sold"]
+            if brief:
+                return f"{_money(revenue)} revenue, {units:,.0f} units ({count})"
+            return (
+                f"revenue {_money(revenue)}, units {units:,.0f}, "
+                f"avg revenue/sale {_money(revenue / count)}, avg price/unit {_money(_ratio(revenue, units) or 0)}"
+            )
+
+        budget, clicks, conversions = stats["budget"], stats["clicks"], stats["conversions"]
+        ctr = _ratio(clicks, stats["impressions"])
+        cvr = _ratio(conversions, clicks)
+        cpa = _ratio(budget, conversions)
+        cpa_text = "N/A" if cpa is None else _money(cpa)
+        if brief:
+            return f"{_money(budget)} budget, CTR {_percent(ctr)}, CVR {_percent(cvr)}, CPA {cpa_text} ({count})"
+        return (
+            f"budget {_money(budget)}, impressions {stats['impressions']:,.0f}, clicks {clicks:,.0f}, "
+            f"conversions {conversions:,.0f}, CTR {_percent(ctr)}, CVR {_percent(cvr)}, CPA {cpa_text}"
+        )
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def save(self, path: str) -> None:
+        arrays: Dict[str, np.ndarray] = {}
+        layout: Dict[str, Any] = {}
+        for record_type, cube in self.cubes.items():
+            layout[record_type] = {"dimensions": list(cube.dimensions), "vocab": cube.vocab, "measures": list(cube.sums)}
+            arrays[f"{record_type}__count"] = cube.counts
+            for dim, codes in cube.codes.items():
+                arrays[f"{record_type}__dim__{dim}"] = codes
+            for measure, sums in cube.sums.items():
+                arrays[f"{record_type}__sum__{measure}"] = sums
+        arrays["layout"] = np.asarray(json.dumps(layout))
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Aggregates":
+        with np.load(path, allow_pickle=False) as data:
+            layout = json.loads(str(data["layout"]))
+            cubes = {}
+            for record_type, spec in layout.items():
+                cubes[record_type] = AggregateCube(
+                    record_type,
+                    spec["dimensions"],
+                    spec["vocab"],
+                    codes={d: data[f"{record_type}__dim__{d}"] for d in spec["dimensions"]},
+                    counts=data[f"{record_type}__count"],
+                    sums={m: data[f"{record_type}__sum__{m}"] for m in spec["measures"]},
+                )
+            return cls(cubes)
+
+
+def build_aggregates(index: Any) -> Aggregates:
+    """Aggregate cubes for a MetadataIndex (see metadata_index.py)."""
+    return Aggregates.from_index(index)
+
+
+# -------------------------
+# Process-wide cache of loaded aggregates
+# -------------------------
+_LOADED: Dict[str, Tuple[float, Aggregates]] = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def get_aggregates(collection_name: str) -> Optional[Aggregates]:
+    """Load (or reuse) the saved aggregates for a collection; None if absent."""
+    path = index_path(collection_name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _LOADED_LOCK:
+        cached = _LOADED.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            aggregates = Aggregates.load(path)
+        except Exception as e:
+            logger.warning("Failed to load aggregates %s: %s", path, e)
+            return None
+        _LOADED[path] = (mtime, aggregates)
+        return aggregates
+
+
+def save_aggregates(collection_name: str, aggregates: Aggregates) -> None:
+    path = index_path(collection_name)
+    aggregates.save(path)
+    with _LOADED_LOCK:
+        try:
+            _LOADED[path] = (os.path.getmtime(path), aggregates)
+        except OSError:
+            _LOADED.pop(path, None)
@@ -6,6 +6,7 @@ import shutil
 
 # === Project imports (must exist in your repo) ===
 from agent import generate_report_with_autogen_multiagent  # optional, keep if used elsewhere
+from llm_cache import bypass_llm_cache
 from report_generator import (
     generate_sales_performance_report,
     generate_marketing_campaign_report,
@@ -86,6 +87,11 @@ telegram_target_override = st.sidebar.text_input(
 )
 
 st.sidebar.markdown("---")
+bypass_cache = st.sidebar.checkbox(
+    "Regenerate (ignore cached LLM responses)",
+    value=False,
+    help="Unchanged data and prompts are normally answered from the LLM response cache.",
+)
 generate_btn = st.sidebar.button("🚀 Generate Report")
 
 # -------------------------
@@ -170,23 +176,33 @@ def _send_telegram(report_paths, chart_paths):
 if generate_btn:
     with st.spinner("Generating report... this may take a few seconds ⏳"):
         try:
-            # Explicitly call correct generator signatures to avoid wrong kwarg names.
-            if report_type == "Sales Performance":
-                report_text = generate_sales_performance_report(region=region or None, quarter=quarter or None)
-            elif report_type == "Marketing Campaign":
-                report_text = generate_marketing_campaign_report(channel=channel or None, quarter=quarter or None)
-            elif report_type == "Quarterly Summary":
-                report_text = generate_quarterly_summary_report(quarter)
-            elif report_type == "Product Analysis":
-                report_text = generate_product_analysis_report(product)
-            elif report_type == "Regional Analysis":
-                report_text = generate_regional_analysis_report(region)
-            elif report_type == "Custom Query":
-                # IMPORTANT: call with positional arg (your function appears to expect the custom query as positional)
-                report_text = generate_custom_analysis_report(custom_query)
-            else:
-                st.error("Invalid report type selected")
-                report_text = None
+            with bypass_llm_cache(bypass_cache):
+                # Explicitly call correct generator signatures to avoid wrong kwarg names.
+                if report_type == "Sales Performance":
+                    report_text = generate_sales_performance_report(region=region or None, quarter=quarter or None, stream=True)
+                elif report_type == "Marketing Campaign":
+                    report_text = generate_marketing_campaign_report(channel=channel or None, quarter=quarter or None, stream=True)
+                elif report_type == "Quarterly Summary":
+                    report_text = generate_quarterly_summary_report(quarter, stream=True)
+                elif report_type == "Product Analysis":
+                    report_text = generate_product_analysis_report(product, stream=True)
+                elif report_type == "Regional Analysis":
+                    report_text = generate_regional_analysis_report(region, stream=True)
+                elif report_type == "Custom Query":
+                    # IMPORTANT: call with positional arg (your function appears to expect the custom query as positional)
+                    report_text = generate_custom_analysis_report(custom_query, stream=True)
+                else:
+                    st.error("Invalid report type selected")
+                    report_text = None
+
+                # Show the writer's tokens as they arrive; the final bundle replaces them below.
+                if report_text is not None and not isinstance(report_text, str):
+                    live = st.empty()
+                    with live.container():
+                        st.markdown("## ✍️ Writing report...")
+                        st.write_stream(report_text)
+                    report_text = report_text.result
+                    live.empty()
 
             if not report_text:
                 st.error("Report generator returned empty result.")
@@ -0,0 +1,217 @@
+"""
+benchmark_quantization.py - recall vs. memory of the NumPy store's vector dtypes.
+
+Scales the data/*.json corpus up synthetically (new records resampled from the
+observed field values and rendered with the same description templates),
+embeds it, and loads the vectors into float32, float16 and int8
+NumpyVectorBackend stores. Each store answers the same queries; recall@k is
+measured against exact float32 search, alongside the bytes a query has to scan
+and the bytes of the float16 re-rank copy int8 keeps on disk.
+
+    python benchmark_quantization.py --scale 50 --queries 200 --k 10
+    python benchmark_quantization.py --embedder hash    # no model download, quick smoke run
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from config import MARKETING_DATA_PATH, SALES_DATA_PATH
+from vector_backends import NumpyVectorBackend
+
+SALES_FIELDS = ("product", "category", "region", "quarter", "customer_segment", "sales_rep")
+MARKETING_FIELDS = ("campaign_name", "channel", "quarter", "target_segment")
+QUERY_TEMPLATES = (
+    "{product} revenue in {region} for {quarter}",
+    "{customer_segment} sales of {product} by {sales_rep}",
+    "How did {channel} campaigns perform for {target_segment} in {quarter}?",
+    "{campaign_name} conversions and budget",
+    "top performing {category} products in {region}",
+)
+_SCAN_FILES = ("vectors.npy", "scales.npy", "sq_norms.npy")
+
+
+# -------------------------
+# Synthetic corpus
+# -------------------------
+def _load(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _vocab(records: Sequence[Dict[str, Any]], fields: Sequence[str]) -> Dict[str, List[str]]:
+    return {f: sorted({str(r[f]) for r in records if r.get(f)}) for f in fields}
+
+
+def _numeric_range(records: Sequence[Dict[str, Any]], field: str) -> Tuple[int, int]:
+    values = [int(r[field]) for r in records if isinstance(r.get(field), (int, float))]
+    return (min(values), max(values)) if values else (0, 1)
+
+
+def synthesize_corpus(scale: int, seed: int = 7) -> Tuple[List[str], List[str], List[Dict[str, Any]], Dict[str, List[str]]]:
+    """ids, documents, metadatas for scale x the source corpus, plus the field vocabularies."""
+    rng = random.Random(seed)
+    sales, marketing = _load(SALES_DATA_PATH), _load(MARKETING_DATA_PATH)
+    sales_vocab, marketing_vocab = _vocab(sales, SALES_FIELDS), _vocab(marketing, MARKETING_FIELDS)
+    revenue, units = _numeric_range(sales, "revenue"), _numeric_range(sales, "units_sold")
+    budget, impressions = _numeric_range(marketing, "budget"), _numeric_range(marketing, "impressions")
+
+    ids, documents, metadatas = [], [], []
+    for copy in range(scale):
+        for i in range(len(sales)):
+            row = {f: rng.choice(v) for f, v in sales_vocab.items()}
+            row.update(revenue=rng.randint(*revenue), units_sold=rng.randint(*units))
+            documents.append(
+                f"{row['product']} generated ${row['revenue']:,} in {row['quarter']} with {row['units_sold']} units sold "
+                f"in {row['region']} {row['customer_segment']} segment by {row['sales_rep']}."
+            )
+            ids.append(f"sales_X{copy:04d}_{i:05d}")
+            metadatas.append({"type": "sales", **row})
+        for i in range(len(marketing)):
+            row = {f: rng.choice(v) for f, v in marketing_vocab.items()}
+            row.update(budget=rng.randint(*budget), impressions=rng.randint(*impressions))
+            row["clicks"] = int(row["impressions"] * rng.uniform(0.005, 0.05))
+            row["conversions"] = int(row["clicks"] * rng.uniform(0.005, 0.03))
+            documents.append(
+                f"{row['campaign_name']} ran via {row['channel']} in {row['quarter']} with ${row['budget']:,} budget, "
+                f"achieving {row['impressions']:,} impressions, {row['clicks']:,} clicks and {row['conversions']:,} "
+                f"conversions in {row['target_segment']} segment."
+            )
+            ids.append(f"marketing_X{copy:04d}_{i:05d}")
+            metadatas.append({"type": "marketing", **row})
+    return ids, documents, metadatas, {**sales_vocab, **marketing_vocab}
+
+
+def synthesize_queries(vocab: Dict[str, List[str]], count: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    return [rng.choice(QUERY_TEMPLATES).format(**{f: rng.choice(v) for f, v in vocab.items()}) for _ in range(count)]
+
+
+# -------------------------
+# Embedding
+# -------------------------
+def hash_embedder(dim: int = 384) -> Callable[[List[str]], np.ndarray]:
+    """Deterministic token-hashing embedder (unit vectors) for runs without the model."""
+
+    def embed(texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower()):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                out[row, int.from_bytes(digest[:4], "little") % dim] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1.0, norms)
+
+    return embed
+
+
+def model_embedder() -> Callable[[List[str]], np.ndarray]:
+    from vector_db import get_embedding_function
+
+    fn = get_embedding_function()
+    if fn is None:
+        raise RuntimeError("No local embedding model is configured; use --embedder hash")
+    return lambda texts: np.asarray(fn(texts), dtype=np.float32)
+
+
+def embed_all(embed: Callable[[List[str]], np.ndarray], texts: Sequence[str], batch_size: int = 512) -> np.ndarray:
+    chunks = [embed(list(texts[i : i + batch_size])) for i in range(0, len(texts), batch_size)]
+    return np.vstack(chunks).astype(np.float32)
+
+
+# -------------------------
+# Measurement
+# -------------------------
+def _exact_distances(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    return np.einsum("ij,ij->i", vectors, vectors) - 2.0 * (vectors @ query) + float(query @ query)
+
+
+def kth_distances(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Exact float32 distance of the k-th nearest neighbour of every query."""
+    return np.array([np.partition(_exact_distances(vectors, q), k - 1)[k - 1] for q in queries])
+
+
+def _measure(store: NumpyVectorBackend, vectors: np.ndarray, queries: np.ndarray, kth: np.ndarray, positions: Dict[str, int], k: int) -> Dict[str, float]:
+    """Recall@k counting any hit no farther than the exact k-th neighbour (ties are common)."""
+    started = time.perf_counter()
+    results = [store.query(query_embeddings=queries[qi : qi + 1], n_results=k, include=[])["ids"][0] for qi in range(len(queries))]
+    elapsed = time.perf_counter() - started
+    hits = 0
+    for qi, returned in enumerate(results):
+        rows = vectors[[positions[i] for i in returned]]
+        hits += int((_exact_distances(rows, queries[qi]) <= kth[qi] + 1e-5).sum())
+    return {"recall": hits / (k * len(queries)), "ms_per_query": 1000.0 * elapsed / len(queries)}
+
+
+def run(scale: int, query_count: int, k: int, embedder: str, rerank_factors: Sequence[int]) -> List[Dict[str, Any]]:
+    ids, documents, metadatas, vocab = synthesize_corpus(scale)
+    embed = hash_embedder() if embedder == "hash" else model_embedder()
+    print(f"Embedding {len(documents):,} synthetic records ({embedder})...")
+    vectors = embed_all(embed, documents)
+    queries = embed_all(embed, synthesize_queries(vocab, query_count))
+    kth = kth_distances(vectors, queries, k)
+    positions = {record_id: i for i, record_id in enumerate(ids)}
+    raw_bytes = vectors.nbytes
+
+    rows: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="quant-bench-") as tmp:
+        for dtype in ("float32", "float16", "int8"):
+            store = NumpyVectorBackend(f"bench_{dtype}", os.path.join(tmp, dtype), dtype=dtype, rerank_factor=max(rerank_factors)).initialize()
+            store.upsert(ids, documents=documents, metadatas=metadatas, embeddings=vectors)
+            sizes = store.footprint()
+            scan = sum(sizes.get(f, 0) for f in _SCAN_FILES)
+            for factor in (rerank_factors if dtype == "int8" else (0,)):
+                store.rerank_factor = factor
+                label = dtype if dtype != "int8" else (f"int8 + rerank x{factor}" if factor else "int8 (no rerank)")
+                rows.append(
+                    {
+                        "config": label,
+                        "scan_mib": scan / 2**20,
+                        "rerank_mib": sizes.get("rerank.npy", 0) / 2**20 if factor else 0.0,
+                        "scan_reduction": raw_bytes / scan,
+                        **_measure(store, vectors, queries, kth, positions, k),
+                    }
+                )
+    print(f"{len(ids):,} vectors x {vectors.shape[1]} dims; raw float32 = {raw_bytes / 2**20:.1f} MiB; {query_count} queries, recall@{k}")
+    return rows
+
+
+def _print_table(rows: List[Dict[str, Any]]) -> None:
+    print(f"{'config':<22}{'scan MiB':>10}{'rerank MiB':>12}{'reduction':>11}{'recall':>9}{'ms/query':>10}")
+    for r in rows:
+        print(
+            f"{r['config']:<22}{r['scan_mib']:>10.1f}{r['rerank_mib']:>12.1f}"
+            f"{r['scan_reduction']:>10.1f}x{r['recall']:>9.3f}{r['ms_per_query']:>10.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall vs. memory of float32 / float16 / int8 NumPy vector stores")
+    parser.add_argument("--scale", type=int, default=50, help="Corpus multiplier (50 = 100k records)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model")
+    parser.add_argument("--rerank-factors", default="0,1,2,4,8", help="Comma-separated int8 re-rank factors")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    factors = sorted({int(f) for f in args.rerank_factors.split(",") if f.strip()})
+    rows = run(args.scale, args.queries, args.k, args.embedder, factors)
+    _print_table(rows)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
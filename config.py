@@ -14,6 +14,43 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 CHROMA_DB_PATH = "./chroma_db"
 COLLECTION_NAME = "sales_marketing_data"
 
+# Vector store backend: "chroma" (default) or "numpy" (in-process, memory-mapped vectors)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").strip().lower()
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32").strip().lower()  # numpy backend: "float32", "float16" or "int8"
+# int8 stores: re-rank the best n_results * factor int8 hits against a float16 copy (0 = no copy, 4x smaller on disk too)
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+
+# Optional time partitioning: "quarter" = one collection per quarter, searched only when a query can match it
+PARTITION_FIELDS = ("quarter",)
+VECTOR_PARTITION_BY = os.getenv("VECTOR_PARTITION_BY", "").strip().lower()  # "" (off) or "quarter"
+PARTITION_ARCHIVE_PATH = os.getenv("PARTITION_ARCHIVE_PATH", os.path.join(CHROMA_DB_PATH, "archive"))
+
+# Source data + ingestion batching
+SALES_DATA_PATH = os.getenv("SALES_DATA_PATH", "data/sales_data.json")
+MARKETING_DATA_PATH = os.getenv("MARKETING_DATA_PATH", "data/marketing_data.json")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))  # records per upsert
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "0"))  # 0 = embed inside Chroma upsert
+INGEST_EMBED_MODE = os.getenv("INGEST_EMBED_MODE", "thread")  # "thread" or "process"
+
+# Per-record content hashes from the last ingestion (enables incremental re-runs)
+INGEST_MANIFEST_PATH = os.path.join(CHROMA_DB_PATH, "ingest_manifest.json")
+
+# Embedding model (loaded lazily on the first query / upsert)
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "").strip() or None  # e.g. "cpu", "cuda"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))  # texts per encode() call
+
+# Persistent embedding cache keyed by (model, sha256(text))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(CHROMA_DB_PATH, "embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Persistent LLM response cache keyed by (model, system message, prompt hash, temperature, max_tokens)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(CHROMA_DB_PATH, "llm_cache.sqlite3"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))  # 0 = never expire
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
 # AutoGen Configuration
 AUTOGEN_CONFIG = {
     "config_list": [
@@ -33,6 +70,9 @@ RECIPIENT_EMAIL = os.getenv("RECIPIENT_EMAIL", "")
 # Scheduler Configuration
 SCHEDULE_TIME = "09:00"  # 9 AM IST
 TIMEZONE = "Asia/Kolkata"
+# Daily job: reports generated at once (each is its own LLM chain) and the per-report time limit
+SCHEDULER_REPORT_CONCURRENCY = int(os.getenv("SCHEDULER_REPORT_CONCURRENCY", "3"))
+SCHEDULER_REPORT_TIMEOUT_SECONDS = float(os.getenv("SCHEDULER_REPORT_TIMEOUT_SECONDS", "600"))
 
 # Telegram Configuration
 TELEGRAM_API_ID = int(os.getenv("TELEGRAM_API_ID", "20250063"))
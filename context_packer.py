@@ -0,0 +1,221 @@
+"""
+context_packer.py - token-budget-aware packing of retrieved context.
+
+Replaces character truncation: retrieved items are packed greedily by
+relevance under a per-model token budget, near-identical records are
+deduplicated, and the caller learns how many items were left out and why.
+
+Token counts use tiktoken's cl100k_base encoding when it is installed (a
+close approximation for the Llama-family models served by Groq) and a
+character/word heuristic otherwise.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken  # type: ignore
+except Exception:
+    tiktoken = None
+
+DEFAULT_MODEL = os.getenv("GROQ_MODEL", os.getenv("MODEL_NAME", "")) or None
+
+# Whole-prompt input budgets. Groq limits tokens per minute per request on the free/dev
+# tiers, and the completion (OPENAI_MAX_TOKENS) counts against the same limit.
+MODEL_PROMPT_BUDGETS: Dict[str, int] = {
+    "llama-3.3-70b-versatile": 9000,
+    "llama-3.1-8b-instant": 3500,
+    "groq/compound": 6000,
+    "groq/compound-mini": 6000,
+}
+for _entry in os.getenv("LLM_PROMPT_TOKEN_BUDGETS", "").split(","):
+    if "=" in _entry:
+        _model, _budget = _entry.rsplit("=", 1)
+        MODEL_PROMPT_BUDGETS[_model.strip()] = int(_budget)
+
+DEFAULT_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "4500"))
+# Prompt tokens kept free for instructions, focus and query around the retrieved context.
+CONTEXT_RESERVE_TOKENS = int(os.getenv("RAG_CONTEXT_RESERVE_TOKENS", "1200"))
+# Word 3-shingle Jaccard similarity at or above which two records count as duplicates.
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.9"))
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_ENCODING = None
+
+
+# -------------------------
+# Token counting
+# -------------------------
+def _encoding():
+    global _ENCODING
+    if _ENCODING is None and tiktoken is not None:
+        try:
+            _ENCODING = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.debug("tiktoken encoding unavailable (%s); using heuristic token counts", e)
+            _ENCODING = False
+    return _ENCODING or None
+
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """Approximate prompt tokens for text (model is accepted for future per-model tokenizers)."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # BPE vocabularies average ~4 chars/token on English prose; numbers and punctuation split finer.
+    return max(len(text) // 4, int(len(_WORD_RE.findall(text)) * 1.1)) + 1
+
+
+def prompt_token_budget(model: Optional[str] = None) -> int:
+    model = model or DEFAULT_MODEL
+    return MODEL_PROMPT_BUDGETS.get(model or "", DEFAULT_PROMPT_TOKEN_BUDGET)
+
+
+def context_token_budget(model: Optional[str] = None) -> int:
+    """Tokens available for retrieved context once the prompt reserve is taken out."""
+    return max(256, prompt_token_budget(model) - CONTEXT_RESERVE_TOKENS)
+
+
+def _fit_count(n: int, fits) -> int:
+    """Largest k in [0, n] for which fits(k) holds (fits must be monotone in k)."""
+    low, high = 0, n
+    while low < high:
+        mid = (low + high + 1) // 2
+        if fits(mid):
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None, marker: str = "\n\n[...context truncated...]\n\n") -> str:
+    """Keep whole lines from the head and tail of text within max_tokens (the middle is dropped).
+
+    Context lines are records, so values are never cut in half. If not even the first and
+    last line fit, the text is cut after the last whole word that does. Every candidate is
+    measured with estimate_tokens(), so the result never exceeds max_tokens.
+    """
+    if not text or estimate_tokens(text, model) <= max_tokens:
+        return text
+
+    lines = text.splitlines(keepends=True)
+
+    def head_and_tail(k: int) -> str:
+        return "".join(lines[:k]).rstrip("\n") + marker + "".join(lines[-k:]).lstrip("\n")
+
+    keep = _fit_count(len(lines) // 2, lambda k: estimate_tokens(head_and_tail(k), model) <= max_tokens)
+    if keep:
+        return head_and_tail(keep)
+
+    words = re.findall(r"\S+\s*", text)
+    for suffix in (marker.rstrip(), ""):
+        keep = _fit_count(len(words), lambda k: estimate_tokens("".join(words[:k]).rstrip() + suffix, model) <= max_tokens)
+        if keep:
+            return "".join(words[:keep]).rstrip() + suffix
+    return ""
+
+
+# -------------------------
+# Near-duplicate detection
+# -------------------------
+def _shingles(text: str, size: int = 3) -> frozenset:
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) <= size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i : i + size]) for i in range(len(words) - size + 1))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# -------------------------
+# Packing
+# -------------------------
+class PackResult:
+    """Outcome of pack(): kept (item, text) pairs in relevance order plus drop accounting."""
+
+    def __init__(self, kept: List[Tuple[Any, str]], tokens_used: int, budget: int, dropped_budget: int, dropped_duplicates: int):
+        self.kept = kept
+        self.tokens_used = tokens_used
+        self.budget = budget
+        self.dropped_budget = dropped_budget
+        self.dropped_duplicates = dropped_duplicates
+
+    @property
+    def dropped(self) -> int:
+        return self.dropped_budget + self.dropped_duplicates
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.kept)} kept, {self.dropped} dropped "
+            f"({self.dropped_budget} over the {self.budget}-token budget, {self.dropped_duplicates} near-duplicates); "
+            f"{self.tokens_used} tokens"
+        )
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "kept": len(self.kept),
+            "dropped": self.dropped,
+            "dropped_budget": self.dropped_budget,
+            "dropped_duplicates": self.dropped_duplicates,
+            "tokens_used": self.tokens_used,
+            "budget": self.budget,
+        }
+
+
+def pack(
+    items: Sequence[Tuple[Any, str, float, Optional[str]]],
+    budget: int,
+    model: Optional[str] = None,
+    dedup_threshold: float = DEDUP_THRESHOLD,
+    max_items: int = 0,
+    overhead: int = 0,
+) -> PackResult:
+    """Greedily keep (item, rendered_text, score, dedup_key) tuples by score under budget tokens.
+
+    Items are visited from the highest score down; one that does not fit is skipped and
+    smaller, lower-scored items may still fill the gap. An item whose dedup_key (e.g. a
+    record id) was already kept, or whose text is a near-duplicate of a kept item, is
+    dropped. If even the best item does not fit, it is kept truncated so the context is
+    never empty. max_items > 0 caps the number of kept items; overhead is charged per kept
+    item for headers the caller renders afterwards.
+    """
+    ordered = sorted(enumerate(items), key=lambda pair: (-float(pair[1][2] or 0.0), pair[0]))
+    kept: List[Tuple[Any, str]] = []
+    kept_keys = set()
+    kept_shingles: List[frozenset] = []
+    used = dropped_budget = dropped_duplicates = 0
+
+    for _, (item, text, _score, key) in ordered:
+        shingles = _shingles(text)
+        if (key is not None and key in kept_keys) or any(_jaccard(shingles, s) >= dedup_threshold for s in kept_shingles):
+            dropped_duplicates += 1
+            continue
+        if max_items and len(kept) >= max_items:
+            dropped_budget += 1
+            continue
+        cost = estimate_tokens(text, model) + overhead
+        if used + cost > budget:
+            if kept:
+                dropped_budget += 1
+                continue
+            text = truncate_to_tokens(text, budget - overhead, model)
+            cost = estimate_tokens(text, model) + overhead
+        kept.append((item, text))
+        kept_shingles.append(shingles)
+        if key is not None:
+            kept_keys.add(key)
+        used += cost
+
+    return PackResult(kept, used, budget, dropped_budget, dropped_duplicates)
@@ -0,0 +1,182 @@
+"""
+embedding_cache.py - persistent embedding cache keyed by (model, sha256(text)).
+
+Vectors are stored as float32 blobs in SQLite (WAL mode) with a
+last-used timestamp, so the cache is shared across processes and runs and
+evicts least-recently-used entries once it grows past `max_entries`.
+Hits only touch memory; their last-used times are written in batches
+(on the next put, on close, or every _TOUCH_FLUSH hits).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, text_hash)
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+# SQLite caps the number of bound parameters per statement.
+_SQL_CHUNK = 500
+
+# Pending last-used updates written in one transaction once this many pile up.
+_TOUCH_FLUSH = 1000
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """Disk-backed LRU cache of embedding vectors."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[Tuple[str, str], float] = {}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors aligned with `texts` (None for misses)."""
+        hashes = [text_hash(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique), _SQL_CHUNK):
+                chunk = unique[i : i + _SQL_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = _unpack(blob)
+
+            if found:
+                now = time.time()
+                self._touched.update(((model, h), now) for h in found)
+                if len(self._touched) >= _TOUCH_FLUSH:
+                    self._flush_touched_locked()
+                    self._conn.commit()
+
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = {text_hash(t): (model, text_hash(t), _pack(v), now) for t, v in zip(texts, vectors)}
+        if not rows:
+            return
+
+        with self._lock:
+            self._flush_touched_locked()
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                list(rows.values()),
+            )
+            self._conn.commit()
+            self._evict_locked()
+
+    def _flush_touched_locked(self) -> None:
+        """Write pending last-used times (the caller commits)."""
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = MAX(last_used, ?) WHERE model = ? AND text_hash = ?",
+            [(used, model, h) for (model, h), used in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _count_locked(self) -> int:
+        # Counted in SQL, not per process: other processes share the file.
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _evict_locked(self) -> None:
+        overflow = self._count_locked() - self.max_entries
+        if overflow <= 0:
+            return
+        cur = self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (overflow,),
+        )
+        self._conn.commit()
+        self.evictions += cur.rowcount
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": self._count_locked(),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched_locked()
+            self._conn.commit()
+            self._conn.close()
+
+
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide cache instance, opened on first use."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = EmbeddingCache()
+        return _CACHE
@@ -0,0 +1,232 @@
+"""
+lexical_index.py - in-process BM25 inverted index over the record descriptions.
+
+Built by vector_db during ingestion from the same record stream as the
+metadata index (so row positions line up) and saved next to the Chroma files
+as <collection>.bm25.npz. Postings are stored CSR-style (term offsets into
+flat doc/tf arrays) so loading is a handful of array reads and scoring is a
+few vectorized NumPy adds per query term.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import CHROMA_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3})")
+
+
+def index_path(collection_name: str, base_dir: str = CHROMA_DB_PATH) -> str:
+    return os.path.join(base_dir, f"{collection_name}.bm25.npz")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens; "$21,691" -> "21691" so amounts match exactly."""
+    return _TOKEN_RE.findall(_THOUSANDS_RE.sub("", (text or "").lower()))
+
+
+class LexicalIndexBuilder:
+    def __init__(self):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self._extra: List[str] = []
+        self._positions: Dict[str, int] = {}
+
+    def add(self, record_id: str, text: str, extra: str = "") -> None:
+        """Index `text` (stored and returned) plus `extra` terms (indexed only, e.g. the record id)."""
+        row = self._positions.get(record_id)
+        if row is None:
+            self._positions[record_id] = len(self.ids)
+            self.ids.append(record_id)
+            self.texts.append(text or "")
+            self._extra.append(extra or "")
+        else:
+            self.texts[row] = text or ""
+            self._extra[row] = extra or ""
+
+    def build(self) -> "LexicalIndex":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = np.zeros(len(self.ids), dtype=np.float32)
+        for row, text in enumerate(self.texts):
+            tokens = tokenize(f"{text} {self._extra[row]}")
+            lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((row, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        docs = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.float32)
+        for i, term in enumerate(terms):
+            entries = postings[term]
+            docs[offsets[i] : offsets[i + 1]] = [d for d, _ in entries]
+            tfs[offsets[i] : offsets[i + 1]] = [tf for _, tf in entries]
+
+        return LexicalIndex(list(self.ids), list(self.texts), terms, offsets, docs, tfs, lengths, extras=list(self._extra))
+
+
+class LexicalIndex:
+    """Read-only BM25 index."""
+
+    def __init__(
+        self,
+        ids: List[str],
+        texts: List[str],
+        terms: List[str],
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        lengths: np.ndarray,
+        extras: Optional[List[str]] = None,
+    ):
+        self.ids = ids
+        self.texts = texts
+        self.extras = extras if extras is not None else [""] * len(ids)
+        self._terms = {t: i for i, t in enumerate(terms)}
+        self._offsets = offsets
+        self._docs = docs
+        self._tfs = tfs
+        self._lengths = lengths
+        self._avgdl = float(lengths.mean()) if len(lengths) else 0.0
+        self._positions = {record_id: i for i, record_id in enumerate(ids)}
+        self._aligned: Optional[Tuple[Any, bool]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text(self, record_id: str) -> Optional[str]:
+        row = self._positions.get(record_id)
+        return None if row is None else self.texts[row]
+
+    def indexed_text(self, record_id: str) -> Optional[str]:
+        """Everything that was tokenized for a record: its text plus the extra terms (e.g. the record id)."""
+        row = self._positions.get(record_id)
+        return None if row is None else f"{self.texts[row]} {self.extras[row]}"
+
+    def aligned_with(self, other: Any) -> bool:
+        """True if `other` (a MetadataIndex) has the same ids in the same row order.
+
+        The answer is kept for the last index compared, held by reference, so a reloaded
+        index is always checked again.
+        """
+        if self._aligned is None or self._aligned[0] is not other:
+            self._aligned = (other, other.ids == self.ids)
+        return self._aligned[1]
+
+    def scores(self, query: str) -> np.ndarray:
+        n = len(self.ids)
+        scores = np.zeros(n, dtype=np.float32)
+        if not n:
+            return scores
+        norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self._lengths / max(self._avgdl, 1e-9))
+        for term in set(tokenize(query)):
+            t = self._terms.get(term)
+            if t is None:
+                continue
+            start, end = self._offsets[t], self._offsets[t + 1]
+            rows = self._docs[start:end]
+            tf = self._tfs[start:end]
+            df = end - start
+            idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tf * (BM25_K1 + 1.0) / (tf + norm[rows])
+        return scores
+
+    def search(self, query: str, k: int = 10, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """Top-k (id, score) with a positive score, optionally restricted to a row mask."""
+        scores = self.scores(query)
+        if mask is not None:
+            scores = np.where(mask, scores, 0.0)
+        hits = np.flatnonzero(scores > 0)
+        if not len(hits):
+            return []
+        k = min(k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def save(self, path: str) -> None:
+        terms = sorted(self._terms, key=self._terms.get)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                ids=np.asarray(self.ids, dtype=str),
+                texts=np.asarray(json.dumps(self.texts)),
+                extras=np.asarray(json.dumps(self.extras)),
+                terms=np.asarray(json.dumps(terms)),
+                offsets=self._offsets,
+                docs=self._docs,
+                tfs=self._tfs,
+                lengths=self._lengths,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                ids=data["ids"].tolist(),
+                texts=json.loads(str(data["texts"])),
+                terms=json.loads(str(data["terms"])),
+                offsets=data["offsets"],
+                docs=data["docs"],
+                tfs=data["tfs"],
+                lengths=data["lengths"],
+                extras=json.loads(str(data["extras"])) if "extras" in data.files else None,
+            )
+
+
+# -------------------------
+# Process-wide cache of loaded indexes
+# -------------------------
+_LOADED: Dict[str, Tuple[float, LexicalIndex]] = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def get_lexical_index(collection_name: str) -> Optional[LexicalIndex]:
+    """Load (or reuse) the saved BM25 index for a collection; None if absent."""
+    path = index_path(collection_name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _LOADED_LOCK:
+        cached = _LOADED.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            index = LexicalIndex.load(path)
+        except Exception as e:
+            logger.warning("Failed to load lexical index %s: %s", path, e)
+            return None
+        _LOADED[path] = (mtime, index)
+        return index
+
+
+def save_lexical_index(collection_name: str, index: LexicalIndex) -> None:
+    path = index_path(collection_name)
+    index.save(path)
+    with _LOADED_LOCK:
+        try:
+            _LOADED[path] = (os.path.getmtime(path), index)
+        except OSError:
+            _LOADED.pop(path, None)
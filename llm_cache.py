@@ -0,0 +1,202 @@
+"""
+llm_cache.py - persistent LLM response cache keyed by (model, system message, prompt hash, temperature, max_tokens).
+
+Completions are stored in SQLite (WAL mode) so Streamlit reruns, scheduler
+runs and separate processes share them. An entry expires `ttl_seconds` after
+it was written; beyond `max_entries` the least-recently-used entries are
+evicted. `bypass_llm_cache()` skips lookups for the calls made inside it (the
+fresh responses still replace the cached ones), and LLM_CACHE_ENABLED=false
+turns the cache off entirely.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from config import LLM_CACHE_ENABLED, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+CREATE INDEX IF NOT EXISTS responses_created ON responses (created);
+"""
+
+# Set by bypass_llm_cache(); a context variable so it follows asyncio tasks and to_thread calls.
+_BYPASS: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+def response_key(
+    model: Optional[str],
+    system_message: Optional[str],
+    prompt: str,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+) -> str:
+    prompt_hash = hashlib.sha256((prompt or "").encode("utf-8")).hexdigest()
+    raw = json.dumps([model or "", system_message or "", prompt_hash, temperature, max_tokens])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Disk-backed TTL + LRU cache of completion texts."""
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _fresh_after(self, now: float) -> float:
+        return now - self.ttl_seconds if self.ttl_seconds > 0 else float("-inf")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE cache_key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, created = row
+            if created < self._fresh_after(now):
+                self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (key,))
+                self._conn.commit()
+                self._entries -= 1
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE cache_key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return response
+
+    def put(self, key: str, model: Optional[str], response: str) -> None:
+        now = time.time()
+        with self._lock:
+            before = self._conn.execute("SELECT COUNT(*) FROM responses WHERE cache_key = ?", (key,)).fetchone()[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, model, response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model or "", response, now, now),
+            )
+            self._entries += 1 - before
+            self._conn.commit()
+            self._evict_locked(now)
+
+    def _evict_locked(self, now: float) -> None:
+        cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (self._fresh_after(now),))
+        self._entries -= cur.rowcount
+        self.expired += cur.rowcount
+        overflow = self._entries - self.max_entries
+        if overflow > 0:
+            cur = self._conn.execute(
+                "DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._entries -= cur.rowcount
+            self.evictions += cur.rowcount
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": self._entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._entries = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_CACHE: Optional[LLMResponseCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Process-wide cache instance, opened on first use."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = LLMResponseCache()
+        return _CACHE
+
+
+@contextlib.contextmanager
+def bypass_llm_cache(bypass: bool = True) -> Iterator[None]:
+    """Skip cache lookups for LLM calls made inside the block (fresh responses are still stored)."""
+    token = _BYPASS.set(bypass)
+    try:
+        yield
+    finally:
+        _BYPASS.reset(token)
+
+
+def cached_response(key: str) -> Optional[str]:
+    """The cached completion for `key`, or None on a miss, while bypassed or when the cache is off/unavailable."""
+    if not LLM_CACHE_ENABLED or _BYPASS.get():
+        return None
+    try:
+        return get_llm_cache().get(key)
+    except Exception as e:
+        logger.warning("LLM response cache unavailable: %s", e)
+        return None
+
+
+def store_response(key: str, model: Optional[str], response: str) -> None:
+    if not LLM_CACHE_ENABLED or not response:
+        return
+    try:
+        get_llm_cache().put(key, model, response)
+    except Exception as e:
+        logger.warning("Failed to store LLM response in cache: %s", e)
+
+
+def get_llm_cache_stats() -> Dict[str, Any]:
+    if not LLM_CACHE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **get_llm_cache().stats()}
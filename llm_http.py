@@ -0,0 +1,243 @@
+"""
+llm_http.py - shared keep-alive HTTP client for the Groq (OpenAI-compatible) API.
+
+One module-level httpx.Client is reused by every agent stage and report type,
+so the analyst / writer / critic calls of a report share pooled TCP+TLS
+connections instead of reconnecting per call. Async callers get one
+httpx.AsyncClient per event loop (pooled connections cannot cross loops).
+HTTP/2 is used when the `h2` package is installed. Pool size and timeouts come
+from the environment, and connection reuse is counted through httpcore's trace
+hook (get_http_stats()).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import contextlib
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import httpx  # type: ignore
+except Exception:
+    httpx = None
+
+try:
+    import h2  # type: ignore  # noqa: F401
+
+    _H2_AVAILABLE = True
+except Exception:
+    _H2_AVAILABLE = False
+
+POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("LLM_HTTP_READ_TIMEOUT", "60"))
+# "auto" = HTTP/2 when h2 is installed; "false" forces HTTP/1.1 keep-alive.
+HTTP2 = os.getenv("LLM_HTTP2", "auto").strip().lower()
+
+# Connection/timeout failures worth retrying (HTTP error statuses are handled by the caller).
+TRANSIENT_ERRORS = (httpx.TransportError,) if httpx is not None else ()
+
+_CLIENT: Optional[Any] = None
+_CLIENT_LOCK = threading.Lock()
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+def _http2_enabled() -> bool:
+    return _H2_AVAILABLE and HTTP2 not in ("0", "false", "no", "off")
+
+
+def _limits() -> Any:
+    return httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE, keepalive_expiry=KEEPALIVE_EXPIRY)
+
+
+def _timeout() -> Any:
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+# -------------------------
+# Connection-reuse metrics
+# -------------------------
+class _HttpStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = self.errors = self.new_connections = self.tls_handshakes = 0
+            self.seconds = 0.0
+            self.http_versions: Dict[str, int] = {}
+
+    async def atrace(self, event: str, info: Dict[str, Any]) -> None:
+        self.trace(event, info)
+
+    def trace(self, event: str, info: Dict[str, Any]) -> None:
+        """httpcore trace hook: every completed TCP connect is a connection the pool could not reuse."""
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    def record(self, seconds: float, http_version: Optional[str] = None, error: bool = False) -> None:
+        with self._lock:
+            self.requests += 1
+            self.seconds += seconds
+            if error:
+                self.errors += 1
+            if http_version:
+                self.http_versions[http_version] = self.http_versions.get(http_version, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0,
+                "tls_handshakes": self.tls_handshakes,
+                "avg_request_ms": round(1000.0 * self.seconds / self.requests, 1) if self.requests else 0.0,
+                "http_versions": dict(self.http_versions),
+                "pool_size": POOL_SIZE,
+                "http2": _http2_enabled(),
+            }
+
+
+_STATS = _HttpStats()
+
+
+def get_http_stats() -> Dict[str, Any]:
+    """Requests sent, new vs. reused connections, TLS handshakes and HTTP versions since start/reset."""
+    return _STATS.snapshot()
+
+
+def reset_http_stats() -> None:
+    _STATS.reset()
+
+
+# -------------------------
+# Shared client
+# -------------------------
+def get_http_client() -> Any:
+    """The process-wide pooled httpx.Client (created on first use)."""
+    global _CLIENT
+    if httpx is None:
+        raise RuntimeError("httpx package not installed. Install `httpx` to call the GROQ API.")
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT.is_closed:
+            _CLIENT = httpx.Client(http2=_http2_enabled(), limits=_limits(), timeout=_timeout())
+            logger.info("Opened pooled LLM HTTP client (pool=%s, http2=%s)", POOL_SIZE, _http2_enabled())
+        return _CLIENT
+
+
+def http_request(method: str, url: str, **kwargs: Any) -> Any:
+    """Send a request on the pooled client; timeouts default to the configured ones."""
+    client = get_http_client()
+    extensions = dict(kwargs.pop("extensions", None) or {})
+    extensions.setdefault("trace", _STATS.trace)
+    started = time.perf_counter()
+    try:
+        response = client.request(method, url, extensions=extensions, **kwargs)
+    except Exception:
+        _STATS.record(time.perf_counter() - started, error=True)
+        raise
+    _STATS.record(time.perf_counter() - started, response.http_version, error=response.status_code >= 400)
+    return response
+
+
+def http_post(url: str, **kwargs: Any) -> Any:
+    return http_request("POST", url, **kwargs)
+
+
+def http_get(url: str, **kwargs: Any) -> Any:
+    return http_request("GET", url, **kwargs)
+
+
+def close_http_client() -> None:
+    """Close the pooled client (the next request reopens it)."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            try:
+                _CLIENT.close()
+            except Exception as e:
+                logger.debug("Error closing LLM HTTP client: %s", e)
+            _CLIENT = None
+
+
+atexit.register(close_http_client)
+
+
+# -------------------------
+# Async client (one per event loop)
+# -------------------------
+def get_async_http_client() -> Any:
+    """The pooled httpx.AsyncClient of the running event loop (created on first use)."""
+    if httpx is None:
+        raise RuntimeError("httpx package not installed. Install `httpx` to call the GROQ API.")
+    loop = asyncio.get_running_loop()
+    with _CLIENT_LOCK:
+        client = _ASYNC_CLIENTS.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(http2=_http2_enabled(), limits=_limits(), timeout=_timeout())
+            _ASYNC_CLIENTS[loop] = client
+        return client
+
+
+async def async_http_request(method: str, url: str, **kwargs: Any) -> Any:
+    """Async http_request() on the running loop's pooled client."""
+    client = get_async_http_client()
+    extensions = dict(kwargs.pop("extensions", None) or {})
+    extensions.setdefault("trace", _STATS.atrace)
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, extensions=extensions, **kwargs)
+    except Exception:
+        _STATS.record(time.perf_counter() - started, error=True)
+        raise
+    _STATS.record(time.perf_counter() - started, response.http_version, error=response.status_code >= 400)
+    return response
+
+
+async def async_http_post(url: str, **kwargs: Any) -> Any:
+    return await async_http_request("POST", url, **kwargs)
+
+
+@contextlib.asynccontextmanager
+async def async_http_stream(method: str, url: str, **kwargs: Any) -> AsyncIterator[Any]:
+    """Streamed async request (e.g. SSE); the body is read inside the block and the request is recorded on exit."""
+    client = get_async_http_client()
+    extensions = dict(kwargs.pop("extensions", None) or {})
+    extensions.setdefault("trace", _STATS.atrace)
+    started = time.perf_counter()
+    http_version, error = None, True
+    try:
+        async with client.stream(method, url, extensions=extensions, **kwargs) as response:
+            http_version = response.http_version
+            yield response
+            error = response.status_code >= 400
+    finally:
+        _STATS.record(time.perf_counter() - started, http_version, error=error)
+
+
+async def aclose_async_http_client() -> None:
+    """Close the running loop's client; call before the loop ends (e.g. at the end of asyncio.run)."""
+    with _CLIENT_LOCK:
+        client = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.debug("Error closing async LLM HTTP client: %s", e)
@@ -0,0 +1,340 @@
+"""
+metadata_index.py - compact columnar side index of record metadata.
+
+Categorical fields (type, region, quarter, ...) are dictionary-encoded into
+int32 code arrays and numeric fields (revenue, budget, ...) are float64
+arrays, so counts, breakdowns and candidate-id pre-filters are answered
+with vectorized NumPy instead of pulling every metadata dict out of Chroma.
+
+The index is rebuilt by vector_db during ingestion and saved next to the
+Chroma files as <collection>.metadata.npz.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import CHROMA_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# Fields written by vector_db._sales_record / _marketing_record.
+CATEGORICAL_FIELDS = (
+    "type",
+    "product",
+    "category",
+    "region",
+    "quarter",
+    "customer_segment",
+    "sales_rep",
+    "campaign_name",
+    "channel",
+    "target_segment",
+)
+NUMERIC_FIELDS = (
+    "revenue",
+    "units_sold",
+    "budget",
+    "impressions",
+    "clicks",
+    "conversions",
+)
+
+_MISSING = ""
+
+
+def index_path(collection_name: str, base_dir: str = CHROMA_DB_PATH) -> str:
+    return os.path.join(base_dir, f"{collection_name}.metadata.npz")
+
+
+def _to_float(value: Any) -> float:
+    if value is None or value == "" or isinstance(value, bool):
+        return float("nan")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class MetadataIndexBuilder:
+    """Append-only builder; call build() to get a MetadataIndex."""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self._vocab: Dict[str, Dict[str, int]] = {f: {_MISSING: 0} for f in CATEGORICAL_FIELDS}
+        self._codes: Dict[str, array] = {f: array("i") for f in CATEGORICAL_FIELDS}
+        self._numeric: Dict[str, array] = {f: array("d") for f in NUMERIC_FIELDS}
+        self._positions: Dict[str, int] = {}
+
+    def add(self, record_id: str, metadata: Dict[str, Any]) -> None:
+        row = self._positions.get(record_id)
+        if row is None:
+            row = len(self.ids)
+            self._positions[record_id] = row
+            self.ids.append(record_id)
+            for codes in self._codes.values():
+                codes.append(0)
+            for values in self._numeric.values():
+                values.append(float("nan"))
+
+        for field in CATEGORICAL_FIELDS:
+            value = metadata.get(field)
+            value = _MISSING if value is None else str(value)
+            vocab = self._vocab[field]
+            code = vocab.get(value)
+            if code is None:
+                code = vocab[value] = len(vocab)
+            self._codes[field][row] = code
+
+        for field in NUMERIC_FIELDS:
+            self._numeric[field][row] = _to_float(metadata.get(field))
+
+    def build(self) -> "MetadataIndex":
+        vocab = {f: [None] * len(v) for f, v in self._vocab.items()}
+        for field, mapping in self._vocab.items():
+            for value, code in mapping.items():
+                vocab[field][code] = value
+        return MetadataIndex(
+            ids=list(self.ids),
+            codes={f: np.frombuffer(a, dtype=np.int32).copy() for f, a in self._codes.items()},
+            numeric={f: np.frombuffer(a, dtype=np.float64).copy() for f, a in self._numeric.items()},
+            vocab=vocab,
+        )
+
+
+class MetadataIndex:
+    """Read-only columnar view of every record's metadata."""
+
+    def __init__(
+        self,
+        ids: List[str],
+        codes: Dict[str, np.ndarray],
+        numeric: Dict[str, np.ndarray],
+        vocab: Dict[str, List[str]],
+    ):
+        self.ids = ids
+        self._ids_array = np.asarray(ids, dtype=object)
+        self._codes = codes
+        self._numeric = numeric
+        self._vocab = vocab
+        self._lookup = {f: {v: i for i, v in enumerate(values)} for f, values in vocab.items()}
+        self._positions = {record_id: i for i, record_id in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, Dict[str, Any]]]) -> "MetadataIndex":
+        builder = MetadataIndexBuilder()
+        for record_id, metadata in records:
+            builder.add(record_id, metadata)
+        return builder.build()
+
+    # -------------------------
+    # Filtering
+    # -------------------------
+    def mask(self, where: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Boolean row mask for a Chroma-style where clause.
+
+        Supports $and/$or and $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte.
+        """
+        n = len(self.ids)
+        if not where:
+            return np.ones(n, dtype=bool)
+
+        masks = []
+        for key, cond in where.items():
+            if key == "$and":
+                masks.append(np.logical_and.reduce([self.mask(c) for c in cond]) if cond else np.ones(n, dtype=bool))
+            elif key == "$or":
+                masks.append(np.logical_or.reduce([self.mask(c) for c in cond]) if cond else np.zeros(n, dtype=bool))
+            else:
+                masks.append(self._field_mask(key, cond))
+        return np.logical_and.reduce(masks)
+
+    def _field_mask(self, field: str, cond: Any) -> np.ndarray:
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+
+        n = len(self.ids)
+        result = np.ones(n, dtype=bool)
+        for op, value in cond.items():
+            if field in self._codes:
+                m = self._categorical_op(field, op, value)
+            elif field in self._numeric:
+                m = self._numeric_op(field, op, value)
+            else:
+                # Unknown fields never match positively.
+                m = np.ones(n, dtype=bool) if op in ("$ne", "$nin") else np.zeros(n, dtype=bool)
+            result &= m
+        return result
+
+    def _categorical_op(self, field: str, op: str, value: Any) -> np.ndarray:
+        codes = self._codes[field]
+        lookup = self._lookup[field]
+
+        def _codes_for(values):
+            return [lookup[str(v)] for v in values if str(v) in lookup]
+
+        if op == "$eq":
+            code = lookup.get(str(value))
+            return codes == code if code is not None else np.zeros(len(codes), dtype=bool)
+        if op == "$ne":
+            code = lookup.get(str(value))
+            return codes != code if code is not None else np.ones(len(codes), dtype=bool)
+        if op == "$in":
+            return np.isin(codes, _codes_for(value))
+        if op == "$nin":
+            return ~np.isin(codes, _codes_for(value))
+        raise ValueError(f"Operator {op} is not supported on categorical field '{field}'")
+
+    def _numeric_op(self, field: str, op: str, value: Any) -> np.ndarray:
+        col = self._numeric[field]
+        with np.errstate(invalid="ignore"):
+            if op == "$eq":
+                return col == _to_float(value)
+            if op == "$ne":
+                return col != _to_float(value)
+            if op == "$gt":
+                return col > _to_float(value)
+            if op == "$gte":
+                return col >= _to_float(value)
+            if op == "$lt":
+                return col < _to_float(value)
+            if op == "$lte":
+                return col <= _to_float(value)
+            if op == "$in":
+                return np.isin(col, [_to_float(v) for v in value])
+            if op == "$nin":
+                return ~np.isin(col, [_to_float(v) for v in value])
+        raise ValueError(f"Unsupported operator {op}")
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def count(self, where: Optional[Dict[str, Any]] = None) -> int:
+        return int(self.mask(where).sum())
+
+    def breakdown(self, field: str, where: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+        """Row counts per value of a categorical field."""
+        if field not in self._codes:
+            raise KeyError(f"'{field}' is not a categorical field")
+        codes = self._codes[field][self.mask(where)]
+        counts = np.bincount(codes, minlength=len(self._vocab[field]))
+        return {
+            self._vocab[field][code]: int(c)
+            for code, c in enumerate(counts)
+            if c and self._vocab[field][code] != _MISSING
+        }
+
+    def candidate_ids(self, where: Optional[Dict[str, Any]] = None) -> List[str]:
+        return self._ids_array[self.mask(where)].tolist()
+
+    def positions(self, where: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        return np.flatnonzero(self.mask(where))
+
+    def vocabulary(self, field: str) -> List[str]:
+        """Distinct non-empty values of a categorical field."""
+        return [v for v in self._vocab.get(field, []) if v != _MISSING]
+
+    def column(self, field: str) -> np.ndarray:
+        """Raw numeric column, or decoded categorical column as an object array."""
+        if field in self._numeric:
+            return self._numeric[field]
+        return np.asarray(self._vocab[field], dtype=object)[self._codes[field]]
+
+    def codes(self, field: str) -> Tuple[np.ndarray, List[str]]:
+        return self._codes[field], self._vocab[field]
+
+    def get_metadata(self, record_id: str) -> Optional[Dict[str, Any]]:
+        row = self._positions.get(record_id)
+        if row is None:
+            return None
+        meta: Dict[str, Any] = {}
+        for field, codes in self._codes.items():
+            value = self._vocab[field][codes[row]]
+            if value != _MISSING:
+                meta[field] = value
+        for field, col in self._numeric.items():
+            value = col[row]
+            if not np.isnan(value):
+                meta[field] = int(value) if float(value).is_integer() else float(value)
+        return meta
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def save(self, path: str) -> None:
+        arrays: Dict[str, np.ndarray] = {
+            "ids": np.asarray(self.ids, dtype=str),
+            "vocab": np.asarray(json.dumps(self._vocab)),
+        }
+        for field, codes in self._codes.items():
+            arrays[f"cat__{field}"] = codes
+        for field, col in self._numeric.items():
+            arrays[f"num__{field}"] = col
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MetadataIndex":
+        with np.load(path, allow_pickle=False) as data:
+            vocab = json.loads(str(data["vocab"]))
+            return cls(
+                ids=data["ids"].tolist(),
+                codes={f: data[f"cat__{f}"] for f in CATEGORICAL_FIELDS if f"cat__{f}" in data},
+                numeric={f: data[f"num__{f}"] for f in NUMERIC_FIELDS if f"num__{f}" in data},
+                vocab=vocab,
+            )
+
+
+# -------------------------
+# Process-wide cache of loaded indexes
+# -------------------------
+_LOADED: Dict[str, Tuple[float, MetadataIndex]] = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def get_metadata_index(collection_name: str) -> Optional[MetadataIndex]:
+    """Load (or reuse) the saved index for a collection; None if absent.
+
+    Reloads automatically when another process rewrites the file.
+    """
+    path = index_path(collection_name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _LOADED_LOCK:
+        cached = _LOADED.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            index = MetadataIndex.load(path)
+        except Exception as e:
+            logger.warning("Failed to load metadata index %s: %s", path, e)
+            return None
+        _LOADED[path] = (mtime, index)
+        return index
+
+
+def save_metadata_index(collection_name: str, index: MetadataIndex) -> None:
+    path = index_path(collection_name)
+    index.save(path)
+    with _LOADED_LOCK:
+        try:
+            _LOADED[path] = (os.path.getmtime(path), index)
+        except OSError:
+            _LOADED.pop(path, None)
@@ -1,8 +1,18 @@
 from __future__ import annotations # Forward class definition
 from typing import Any, Dict, List, Optional, Union, Tuple
+import asyncio
+import copy
+import functools
 import json
 import logging
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -18,12 +28,93 @@ except Exception:
     initialize_chromadb = None
     logger.debug("vector_db adapter not found; retrieval functions will return placeholders.")
 
+# Process-wide collection pool (optional; older adapters only expose initialize_chromadb)
+try:
+    from vector_db import get_pooled_collection  # type: ignore
+except Exception:
+    get_pooled_collection = None
+
+# Stored record embeddings (optional) used for MMR re-ranking
+try:
+    from vector_db import get_embeddings  # type: ignore
+except Exception:
+    get_embeddings = None
+
+# Collection version counter (optional) used to invalidate cached results after ingestion
+try:
+    from vector_db import get_collection_version  # type: ignore
+except Exception:
+    get_collection_version = None
+
+# Time partitions (optional): the catalog tells which per-quarter collections exist
+try:
+    from vector_db import get_partition_catalog  # type: ignore
+except Exception:
+    get_partition_catalog = None
+
+from context_packer import context_token_budget, estimate_tokens, pack, truncate_to_tokens
+
+# Columnar metadata index (optional) used to resolve partial filter values such as "Q1" or "asia"
+try:
+    from metadata_index import get_metadata_index  # type: ignore
+except Exception:
+    get_metadata_index = None
+
+# Precomputed group-by aggregates (optional) appended to the prompt context
+try:
+    from aggregates import get_aggregates  # type: ignore
+except Exception:
+    get_aggregates = None
+
+# BM25 index (optional) fused with the vector results
+try:
+    from lexical_index import get_lexical_index  # type: ignore
+except Exception:
+    get_lexical_index = None
+
 # -------------------------
 # Configuration helpers
 # -------------------------
 DEFAULT_N_RESULTS = int(os.getenv("RAG_DEFAULT_N_RESULTS", "5"))
-DEFAULT_MAX_CONTENT_CHARS = int(os.getenv("RAG_MAX_CONTENT_CHARS", "2000"))
-DEFAULT_CONTEXT_MAX_ITEMS = int(os.getenv("RAG_CONTEXT_MAX_ITEMS", "5"))
+# Optional hard cap on packed items (0 = limited only by the token budget, see context_packer.py)
+DEFAULT_CONTEXT_MAX_ITEMS = int(os.getenv("RAG_CONTEXT_MAX_ITEMS", "0"))
+# Share of the context budget the aggregate statistics may take before records are packed
+AGGREGATE_BUDGET_SHARE = float(os.getenv("RAG_AGGREGATE_BUDGET_SHARE", "0.4"))
+
+# Query-result cache (LRU + TTL), invalidated when ingestion bumps the collection version
+RESULT_CACHE_ENABLED = os.getenv("RAG_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RAG_CACHE_MAX_ENTRIES", "256"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RAG_CACHE_TTL_SECONDS", "900"))
+
+# Aggregate statistics appended to the context (totals + per-dimension roll-ups for the query's slice)
+AGGREGATES_ENABLED = os.getenv("RAG_AGGREGATES_ENABLED", "true").lower() in ("1", "true", "yes")
+AGGREGATE_MAX_ROWS = int(os.getenv("RAG_AGGREGATE_MAX_ROWS", "8"))
+
+# MMR re-ranking: fetch RAG_MMR_POOL_FACTOR x n_results candidates, keep a diverse n_results.
+# lambda = 1.0 is pure relevance, lower values trade relevance for diversity.
+MMR_ENABLED = os.getenv("RAG_MMR_ENABLED", "true").lower() in ("1", "true", "yes")
+MMR_POOL_FACTOR = int(os.getenv("RAG_MMR_POOL_FACTOR", "3"))
+MMR_LAMBDAS: Dict[str, float] = {
+    "sales": 0.7,
+    "marketing": 0.7,
+    "combined": 0.6,
+    "product": 0.5,
+    "regional": 0.6,
+    "custom": 0.7,
+    "all": 0.6,
+}
+for _entry in os.getenv("RAG_MMR_LAMBDAS", "").split(","):
+    if "=" in _entry:
+        _report_type, _value = _entry.split("=", 1)
+        MMR_LAMBDAS[_report_type.strip()] = float(_value)
+
+# Worker threads behind the *_async retrievers (bounds concurrent Chroma / embedding work)
+ASYNC_RETRIEVAL_WORKERS = int(os.getenv("RAG_ASYNC_WORKERS", "4"))
+
+# Hybrid retrieval: "hybrid" fuses BM25 + vector results, "vector" / "lexical" use one side only
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid").strip().lower()
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+HYBRID_POOL_FACTOR = int(os.getenv("RAG_HYBRID_POOL_FACTOR", "2"))
 
 # Optional collection overrides (useful if your vector DB stores different domains separately)
 COLLECTION_OVERRIDES = {
@@ -109,7 +200,12 @@ def _call_query_vectordb(collection: Any, query: str, n_results: int, filter_dic
 
 # It only initializes ChromaDB and returns the collection (database/table) that will be searched.
 def _get_collection(collection_name: Optional[str] = None) -> Any:
-    """Initialize chromadb and return the most appropriate collection object."""
+    """Return the pooled collection (a PartitionRouter if it is partitioned), or initialize chromadb if the adapter has no pool."""
+    if get_pooled_collection is not None:
+        router = _partition_router(collection_name)
+        if router is not None:
+            return router
+        return get_pooled_collection(collection_name)
     if initialize_chromadb is None:
         return None
     init_result = initialize_chromadb()
@@ -124,6 +220,707 @@ def _get_collection(collection_name: Optional[str] = None) -> Any:
     return collection
 
 
+def stored_values(field: str, report_type: str = "combined") -> Optional[List[str]]:
+    """Distinct stored values of a metadata field for a report type's collection; None if there is no metadata index."""
+    if get_metadata_index is None:
+        return None
+    collection = _get_collection(COLLECTION_OVERRIDES.get(report_type))
+    index = get_metadata_index(getattr(collection, "name", "") or "") if collection is not None else None
+    return index.vocabulary(field) if index is not None else None
+
+
+# -------------------------
+# Partition routing
+# -------------------------
+def _where_values(where: Optional[Dict[str, Any]], field: str) -> Optional[set]:
+    """Values of `field` a where clause can match, or None if it does not constrain the field."""
+    if not where:
+        return None
+    constrained: Optional[set] = None
+    for key, cond in where.items():
+        values: Optional[set] = None
+        if key == "$or":
+            branches = [_where_values(sub, field) for sub in cond]
+            values = None if any(b is None for b in branches) else set().union(*branches)
+        elif key == "$and":
+            for sub in cond:
+                sub_values = _where_values(sub, field)
+                if sub_values is not None:
+                    values = sub_values if values is None else values & sub_values
+        elif key == field:
+            for op, operand in (cond.items() if isinstance(cond, dict) else [("$eq", cond)]):
+                if op in ("$eq", "$in"):
+                    allowed = {str(v) for v in operand} if op == "$in" else {str(operand)}
+                    values = allowed if values is None else values & allowed
+        if values is not None:
+            constrained = values if constrained is None else constrained & values
+    return constrained
+
+
+def _column(answer: Dict[str, Any], key: str, query_index: int) -> Optional[List[Any]]:
+    value = answer.get(key)
+    if value is None or len(value) <= query_index:
+        return None
+    return list(value[query_index]) if value[query_index] is not None else None
+
+
+class PartitionRouter:
+    """Read-only collection over per-quarter partitions (see vector_db.ingest_partitioned_files).
+
+    query() / get() / count() visit only the partitions the where clause can match, so a
+    "Q3 2024" report searches one quarter's vectors instead of every record. Side indexes
+    (metadata, BM25, aggregates) and the version counter stay under the parent name.
+    """
+
+    def __init__(self, name: str, field: str, partitions: Dict[str, str]):
+        self.name = name
+        self.field = field
+        self.partitions = partitions
+
+    def __repr__(self) -> str:
+        return f"PartitionRouter(name={self.name!r}, field={self.field!r}, partitions={sorted(self.partitions)})"
+
+    def route(self, where: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Partition values to search for a where clause."""
+        wanted = _where_values(where, self.field)
+        return sorted(v for v in self.partitions if wanted is None or v in wanted)
+
+    def _collections(self, where: Optional[Dict[str, Any]]) -> List[Any]:
+        values = self.route(where)
+        logger.debug("Partition routing for %s: %s of %s partitions", self.name, len(values), len(self.partitions))
+        return [get_pooled_collection(self.partitions[v]) for v in values]
+
+    def count(self) -> int:
+        return sum(c.count() for c in self._collections(None))
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 10, where=None, include=None) -> Dict[str, Any]:
+        include = list(include) if include is not None else ["metadatas", "documents", "distances"]
+        params: Dict[str, Any] = {"n_results": n_results, "include": include if "distances" in include else include + ["distances"]}
+        if query_embeddings is not None:
+            params["query_embeddings"] = query_embeddings
+            n_queries = len(query_embeddings)
+        else:
+            params["query_texts"] = [query_texts] if isinstance(query_texts, str) else query_texts
+            n_queries = len(params["query_texts"])
+        if where:
+            params["where"] = where
+        answers = [c.query(**params) for c in self._collections(where)]
+
+        # Distances are comparable across partitions (same model, same space): merge by distance.
+        out: Dict[str, Any] = {key: [] for key in ["ids"] + include}
+        for qi in range(n_queries):
+            ranked = sorted(
+                (d, ai, j) for ai, a in enumerate(answers) for j, d in enumerate(_column(a, "distances", qi) or [])
+            )[:n_results]
+            for key in out:
+                columns = [_column(a, key, qi) for a in answers]
+                out[key].append([columns[ai][j] if columns[ai] is not None else None for _, ai, j in ranked])
+        out["included"] = include
+        return out
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None) -> Dict[str, Any]:
+        include = list(include) if include is not None else ["metadatas", "documents"]
+        out: Dict[str, Any] = {key: [] for key in ["ids"] + include}
+        for collection in self._collections(where):
+            page = collection.get(ids=ids, where=where, include=include)
+            for key in out:
+                values = page.get(key)
+                out[key].extend(list(values) if values is not None else [None] * len(page.get("ids") or []))
+        start = offset or 0
+        stop = None if limit is None else start + limit
+        out = {key: values[start:stop] for key, values in out.items()}
+        out["included"] = include
+        return out
+
+
+def _partition_router(collection_name: Optional[str] = None) -> Optional[PartitionRouter]:
+    if get_partition_catalog is None:
+        return None
+    catalog = get_partition_catalog(collection_name)
+    if catalog is None:
+        return None
+    active = {v: e["collection"] for v, e in catalog["partitions"].items() if e.get("state") == "active"}
+    return PartitionRouter(catalog.get("collection") or collection_name or "", catalog.get("partition_by", "quarter"), active)
+
+
+# -------------------------
+# Structured metadata filters
+# -------------------------
+# Retriever filter keys -> metadata field per record type (see vector_db._sales_record/_marketing_record).
+FILTER_FIELDS: Dict[str, Dict[str, str]] = {
+    "region": {"sales": "region"},
+    "quarter": {"sales": "quarter", "marketing": "quarter"},
+    "product": {"sales": "product"},
+    "category": {"sales": "category"},
+    "sales_rep": {"sales": "sales_rep"},
+    "channel": {"marketing": "channel"},
+    "campaign_name": {"marketing": "campaign_name"},
+    "segment": {"sales": "customer_segment", "marketing": "target_segment"},
+    "revenue": {"sales": "revenue"},
+    "units_sold": {"sales": "units_sold"},
+    "budget": {"marketing": "budget"},
+    "impressions": {"marketing": "impressions"},
+    "clicks": {"marketing": "clicks"},
+    "conversions": {"marketing": "conversions"},
+}
+NUMERIC_FILTERS = {"revenue", "units_sold", "budget", "impressions", "clicks", "conversions"}
+RECORD_TYPES = ("sales", "marketing")
+
+
+def _clean_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Drop empty values and reject unknown filter keys."""
+    cleaned: Dict[str, Any] = {}
+    for key, value in (filters or {}).items():
+        if value is None or value == "" or value == [] or value == {}:
+            continue
+        if key not in FILTER_FIELDS:
+            raise ValueError(f"Unknown retrieval filter '{key}'. Supported: {sorted(FILTER_FIELDS)}")
+        cleaned[key] = value
+    return cleaned
+
+
+def _resolve_categorical(field: str, value: Any, index: Any) -> Any:
+    """Map user input onto stored values: case-insensitive, and prefix/word matches ("Q1" -> "Q1 2023", "Q1 2024")."""
+    if index is None or isinstance(value, dict):
+        return value
+    vocab = index.vocabulary(field)
+    if not vocab:
+        return value
+
+    wanted = value if isinstance(value, (list, tuple, set)) else [value]
+    resolved: List[str] = []
+    for item in wanted:
+        needle = str(item).strip().lower()
+        exact = [v for v in vocab if v.lower() == needle]
+        if exact:
+            resolved.extend(exact)
+            continue
+        partial = [v for v in vocab if v.lower().startswith(needle + " ") or f" {needle}" in f" {v.lower()}"]
+        resolved.extend(partial or [str(item)])
+
+    resolved = list(dict.fromkeys(resolved))
+    if len(resolved) == 1 and not isinstance(value, (list, tuple, set)):
+        return resolved[0]
+    return resolved
+
+
+def _field_clauses(field: str, value: Any, numeric: bool) -> List[Dict[str, Any]]:
+    """Turn one filter value into Chroma clauses (one operator per clause)."""
+    if isinstance(value, dict):
+        return [{field: {op: operand}} for op, operand in value.items()]
+    if numeric and isinstance(value, tuple) and len(value) == 2:
+        low, high = value
+        clauses = []
+        if low is not None:
+            clauses.append({field: {"$gte": low}})
+        if high is not None:
+            clauses.append({field: {"$lte": high}})
+        return clauses
+    if isinstance(value, (list, tuple, set)):
+        values = list(value)
+        return [{field: {"$in": values}}] if len(values) != 1 else [{field: {"$eq": values[0]}}]
+    return [{field: {"$eq": value}}]
+
+
+def _and(clauses: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _campaigns_for_products(products: Any, index: Any) -> List[str]:
+    """Marketing rows carry no product field; campaign names embed it ("Market Expansion Cloud Storage Pro")."""
+    if index is None:
+        return []
+    wanted = [str(p).lower() for p in (products if isinstance(products, (list, tuple, set)) else [products])]
+    return [c for c in index.vocabulary("campaign_name") if any(p and p in c.lower() for p in wanted)]
+
+
+def _type_clauses(
+    record_type: str,
+    filters: Dict[str, Any],
+    index: Any = None,
+    strict: bool = True,
+) -> Optional[List[Dict[str, Any]]]:
+    """Clauses for one record type, or None if the type cannot satisfy the filters.
+
+    strict=False skips filters the type has no field for instead of excluding the type.
+    """
+    clauses: List[Dict[str, Any]] = [{"type": {"$eq": record_type}}]
+    for key, value in filters.items():
+        field = FILTER_FIELDS[key].get(record_type)
+        if field is None and key == "product" and record_type == "marketing" and not isinstance(value, dict):
+            campaigns = _campaigns_for_products(_resolve_categorical("product", value, index), index)
+            if campaigns:
+                clauses.extend(_field_clauses("campaign_name", campaigns, False))
+                continue
+        if field is None:
+            if strict:
+                return None
+            continue
+        numeric = key in NUMERIC_FILTERS
+        if not numeric:
+            value = _resolve_categorical(field, value, index)
+        clauses.extend(_field_clauses(field, value, numeric))
+    return clauses
+
+
+def build_where_clause(
+    filter_type: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    index: Any = None,
+    strict: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """Build a Chroma `where` clause from a record type and structured filters.
+
+    filters values may be a scalar (equality), a list ($in), a (low, high) tuple for numeric
+    fields ($gte/$lte, either end may be None) or an explicit operator dict such as
+    {"$gt": 10000}. With strict=True a filter on a field a record type does not have
+    (e.g. region for marketing) excludes that record type; strict=False ignores it for
+    that type. A product filter matches marketing rows by campaign name. `index` (a
+    MetadataIndex) lets partial values like "Q1" or "europe" resolve to stored values.
+    """
+    filters = _clean_filters(filters)
+    types = [filter_type] if filter_type in RECORD_TYPES else list(RECORD_TYPES)
+
+    if not filters:
+        return {"type": filter_type} if filter_type else None
+
+    branches: List[Dict[str, Any]] = []
+    for record_type in types:
+        clauses = _type_clauses(record_type, filters, index=index, strict=strict)
+        if clauses:
+            branches.append(_and(clauses))
+
+    if not branches:
+        # No record type can satisfy every filter; match nothing rather than everything.
+        return {"type": {"$eq": "__no_match__"}}
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+# -------------------------
+# Query planning for product / regional / custom retrieval
+# -------------------------
+# Free-text mentions are matched against the stored vocabulary of these fields.
+_PLANNER_FIELDS = {
+    "product": "product",
+    "region": "region",
+    "channel": "channel",
+    "category": "category",
+    "sales_rep": "sales_rep",
+    "campaign_name": "campaign_name",
+}
+_QUARTER_RE = re.compile(r"\bq([1-4])\b(?:\s*(?:of\s+)?(20\d\d))?", re.IGNORECASE)
+_YEAR_RE = re.compile(r"\b(20\d\d)\b")
+
+
+def _mentions(text: str, values: List[str]) -> List[str]:
+    """Vocabulary values mentioned in text (whole words, case-insensitive), longest match wins."""
+    lowered = text.lower()
+    found = [v for v in values if v and re.search(r"(?<!\w)" + re.escape(v.lower()) + r"(?!\w)", lowered)]
+    return [v for v in found if not any(v != other and v.lower() in other.lower() for other in found)]
+
+
+def plan_query(query: str, index: Any = None) -> Dict[str, Any]:
+    """Extract structured filters (product, region, quarter, channel, segment, ...) from free text."""
+    if index is None or not query:
+        return {}
+
+    planned: Dict[str, Any] = {}
+    for key, field in _PLANNER_FIELDS.items():
+        hits = _mentions(query, index.vocabulary(field))
+        if hits:
+            planned[key] = hits
+
+    segments = _mentions(query, list(dict.fromkeys(index.vocabulary("customer_segment") + index.vocabulary("target_segment"))))
+    if segments:
+        planned["segment"] = segments
+
+    quarters = index.vocabulary("quarter")
+    wanted: List[str] = []
+    for number, year in _QUARTER_RE.findall(query):
+        prefix = f"Q{number} {year}" if year else f"Q{number} "
+        wanted.extend(q for q in quarters if q.startswith(prefix) or q == prefix.strip())
+    if not wanted:
+        for year in _YEAR_RE.findall(query):
+            wanted.extend(q for q in quarters if q.endswith(year))
+    if wanted:
+        planned["quarter"] = list(dict.fromkeys(wanted))
+
+    # Campaign names contain product names; keep the product predicate and drop the duplicate.
+    if "product" in planned and "campaign_name" in planned:
+        planned.pop("campaign_name")
+    return planned
+
+
+def build_planned_where(
+    query: str,
+    filters: Optional[Dict[str, Any]] = None,
+    index: Any = None,
+    keep_unscoped_types: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """Where clause for a free-form query: planned mentions plus explicit filters (which win).
+
+    Each record type is constrained by the predicates it has fields for. A type with no
+    applicable predicate is dropped, unless keep_unscoped_types is set (e.g. regional
+    reports keep marketing rows even though they carry no region).
+    """
+    merged = dict(plan_query(query, index))
+    merged.update(_clean_filters(filters))
+    if not merged:
+        return None
+
+    branches: List[Dict[str, Any]] = []
+    for record_type in RECORD_TYPES:
+        clauses = _type_clauses(record_type, merged, index=index, strict=False) or []
+        if len(clauses) > 1 or keep_unscoped_types:
+            branches.append(_and(clauses))
+
+    if not branches:
+        return None
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+def _has_documents(results: Any) -> bool:
+    if not isinstance(results, dict):
+        return bool(results)
+    return bool(_extract_nested(results.get("documents")))
+
+
+# -------------------------
+# Hybrid lexical + vector search
+# -------------------------
+# Record ids (S0001 / M0001) and quoted phrases are exact lookups: answer them from BM25 alone.
+_EXACT_QUERY_RE = re.compile(r'\b[SM]\d{4}\b|"[^"]+"', re.IGNORECASE)
+_PHRASE_RE = re.compile(r'"([^"]+)"')
+
+
+def _lexical_search(collection: Any, query: str, n_results: int, where: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """BM25 search restricted by the where clause (via the metadata index). None if unavailable."""
+    if get_lexical_index is None:
+        return None
+    name = getattr(collection, "name", "") or ""
+    lexical = get_lexical_index(name)
+    if lexical is None:
+        return None
+
+    meta_index = get_metadata_index(name) if get_metadata_index is not None else None
+    if meta_index is not None and not lexical.aligned_with(meta_index):
+        meta_index = None
+    if where and meta_index is None:
+        return None
+
+    mask = meta_index.mask(where) if where else None
+    phrases = [p.lower() for p in _PHRASE_RE.findall(query)]
+    hits = lexical.search(query, k=n_results * (4 if phrases else 1), mask=mask)
+    if phrases:
+        hits = [(rid, sc) for rid, sc in hits if all(p in (lexical.indexed_text(rid) or "").lower() for p in phrases)]
+    hits = hits[:n_results]
+
+    top = hits[0][1] if hits else 1.0
+    ids = [rid for rid, _ in hits]
+    return {
+        "ids": [ids],
+        "documents": [[lexical.text(rid) for rid in ids]],
+        "metadatas": [[(meta_index.get_metadata(rid) if meta_index is not None else None) or {} for rid in ids]],
+        "distances": [[1.0 - score / top for _, score in hits]],
+    }
+
+
+def _reciprocal_rank_fusion(result_sets: List[Dict[str, Any]], n_results: int) -> Dict[str, Any]:
+    """Fuse ranked result dicts by reciprocal rank: score(d) = sum 1 / (RRF_K + rank)."""
+    fused: Dict[str, float] = {}
+    rows: Dict[str, Tuple[Any, Any]] = {}
+    for results in result_sets:
+        ids = _extract_nested(results.get("ids"))
+        docs = _extract_nested(results.get("documents"))
+        metas = _extract_nested(results.get("metadatas"))
+        for rank, rid in enumerate(ids):
+            fused[rid] = fused.get(rid, 0.0) + 1.0 / (RRF_K + rank + 1)
+            if rid not in rows:
+                rows[rid] = (docs[rank] if rank < len(docs) else None, metas[rank] if rank < len(metas) else {})
+
+    ranked = sorted(fused, key=fused.get, reverse=True)[:n_results]
+    top = fused[ranked[0]] if ranked else 1.0
+    return {
+        "ids": [ranked],
+        "documents": [[rows[rid][0] for rid in ranked]],
+        "metadatas": [[rows[rid][1] for rid in ranked]],
+        "distances": [[1.0 - fused[rid] / top for rid in ranked]],
+    }
+
+
+def _search(collection: Any, query: str, safe_query: str, n_results: int, where: Optional[Dict[str, Any]]) -> Any:
+    """Vector, lexical or hybrid (RRF-fused) search depending on RETRIEVAL_MODE."""
+    lexical = None
+    if RETRIEVAL_MODE in ("hybrid", "lexical"):
+        try:
+            lexical = _lexical_search(collection, safe_query, n_results * HYBRID_POOL_FACTOR, where)
+        except Exception as e:
+            logger.warning("Lexical search failed; using vector search only: %s", e)
+
+    if lexical is not None and (RETRIEVAL_MODE == "lexical" or _EXACT_QUERY_RE.search(query or "")):
+        if _has_documents(lexical):
+            return _reciprocal_rank_fusion([lexical], n_results)
+
+    if lexical is None or RETRIEVAL_MODE == "vector":
+        return _call_query_vectordb(collection, safe_query, n_results=n_results, filter_dict=where)
+
+    vector = _call_query_vectordb(collection, safe_query, n_results=n_results * HYBRID_POOL_FACTOR, filter_dict=where)
+    if not isinstance(vector, dict) or not vector.get("ids"):
+        return vector
+    return _reciprocal_rank_fusion([vector, lexical], n_results)
+
+
+# -------------------------
+# MMR re-ranking
+# -------------------------
+def _attach_embeddings(collection: Any, results: Any) -> Any:
+    """Add the stored embeddings of the result ids (results["embeddings"]) for MMR; unchanged if unavailable."""
+    if get_embeddings is None or not isinstance(results, dict) or results.get("embeddings"):
+        return results
+    ids = _extract_nested(results.get("ids"))
+    if not ids:
+        return results
+    try:
+        vectors = get_embeddings(collection, ids)
+    except Exception as e:
+        logger.debug("Embeddings unavailable for MMR: %s", e)
+        return results
+    if vectors is not None:
+        results = dict(results)
+        results["embeddings"] = [vectors]
+    return results
+
+
+def mmr_select(relevance: np.ndarray, embeddings: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """Maximal marginal relevance: greedily pick argmax lambda*rel - (1-lambda)*max cos(doc, picked)."""
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    similarity = vectors @ vectors.T
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    chosen = [int(np.argmax(relevance))]
+    max_sim = similarity[chosen[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[chosen[0]] = False
+    while len(chosen) < min(k, n):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * max_sim
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        chosen.append(pick)
+        available[pick] = False
+        np.maximum(max_sim, similarity[pick], out=max_sim)
+    return chosen
+
+
+def _mmr_order(dists: List[Any], embeddings: List[Any], k: int, lambda_mult: float) -> Optional[List[int]]:
+    """Candidate order after MMR, or None if the embeddings do not line up with the candidates."""
+    if len(embeddings) != len(dists) or not len(dists):
+        return None
+    try:
+        distances = np.asarray([float(d) for d in dists], dtype=np.float32)
+    except (TypeError, ValueError):
+        return None
+    # Min-max scaled so it works for any distance (L2, cosine, RRF-derived).
+    spread = float(distances.max() - distances.min())
+    relevance = 1.0 - (distances - distances.min()) / spread if spread > 0 else np.ones_like(distances)
+    return mmr_select(relevance, np.asarray(embeddings, dtype=np.float32), k, lambda_mult)
+
+
+# -------------------------
+# Aggregate statistics
+# -------------------------
+# Totals / breakdown / ranking questions get the roll-ups even when nothing narrows the slice.
+_AGGREGATE_QUERY_RE = re.compile(
+    r"\b(?:totals?|sum|overall|average|avg|mean|how (?:many|much)|count|number of|break ?downs?|"
+    r"(?:by|per|each|across) (?:region|product|quarter|channel|segment)s?|compare|comparison|trends?|share|"
+    r"top|highest|lowest|best|worst|most|least|rank(?:ing)?|aggregates?|summary|summari[sz]e)\b",
+    re.IGNORECASE,
+)
+_RECORD_TYPE_QUERY_RE = {
+    "sales": re.compile(r"\b(?:sales?|revenue|units|orders?)\b", re.IGNORECASE),
+    "marketing": re.compile(r"\b(?:marketing|campaigns?|ctr|conversions?|impressions|clicks)\b", re.IGNORECASE),
+}
+
+
+def _aggregate_record_types(query: str, filter_type: Optional[str]) -> Tuple[str, ...]:
+    """Record types in scope: the explicit type, else the types the query names, else both."""
+    if filter_type in RECORD_TYPES:
+        return (filter_type,)
+    named = tuple(t for t in RECORD_TYPES if _RECORD_TYPE_QUERY_RE[t].search(query or ""))
+    return named or RECORD_TYPES
+
+
+def _aggregate_selection(record_type: str, filters: Dict[str, Any], cube: Any, index: Any) -> Optional[Dict[str, List[str]]]:
+    """Map filters onto one cube's dimensions; None if the cube cannot represent them.
+
+    Filters on a field the record type has but the cube does not group by (sales_rep,
+    campaign_name, numeric ranges, ...) would make the totals wrong, so the cube is skipped.
+    Filters on fields the record type lacks (region for marketing) are ignored, unless none
+    of the filters applies to this type at all.
+    """
+    selection: Dict[str, List[str]] = {}
+    applicable = False
+    for key, value in filters.items():
+        field = FILTER_FIELDS[key].get(record_type)
+        if field is None:
+            continue
+        applicable = True
+        if field not in cube.dimensions:
+            return None
+        if isinstance(value, dict):
+            if set(value) - {"$eq", "$in"}:
+                return None
+            value = value.get("$eq", value.get("$in"))
+        resolved = _resolve_categorical(field, value, index)
+        selection[field] = [str(v) for v in (resolved if isinstance(resolved, (list, tuple, set)) else [resolved])]
+    if filters and not applicable:
+        return None
+    return selection
+
+
+def build_aggregate_context(
+    query: str = "",
+    filters: Optional[Dict[str, Any]] = None,
+    filter_type: Optional[str] = None,
+    collection_name: Optional[str] = None,
+) -> str:
+    """Precomputed totals and roll-ups for the slice the query/filters describe ("" if unavailable).
+
+    Predicates are planned from the query text (see plan_query()) and explicit filters win,
+    so "sales in North America" gets North America revenue by quarter, product and segment
+    computed over every ingested row rather than over the handful of retrieved documents.
+    Without filters or planned predicates, only aggregate-style questions ("total revenue",
+    "top channels") get the all-records roll-ups, and only for the record types in scope.
+    """
+    if not AGGREGATES_ENABLED or get_aggregates is None:
+        return ""
+    try:
+        collection = _get_collection(collection_name)
+        name = getattr(collection, "name", "") or ""
+        aggregates = get_aggregates(name)
+        if aggregates is None:
+            return ""
+        index = get_metadata_index(name) if get_metadata_index is not None else None
+
+        merged = dict(plan_query(query, index))
+        merged.update(_clean_filters(filters))
+        if not merged and not _AGGREGATE_QUERY_RE.search(query or ""):
+            return ""
+
+        sections: List[str] = []
+        for record_type in _aggregate_record_types(query, filter_type):
+            cube = aggregates.get(record_type)
+            if cube is None:
+                continue
+            selection = _aggregate_selection(record_type, merged, cube, index)
+            if selection is None:
+                continue
+            summary = aggregates.summarize(record_type, selection, max_rows=AGGREGATE_MAX_ROWS)
+            if summary:
+                sections.append(summary)
+    except Exception as e:
+        logger.warning("Aggregate context unavailable: %s", e)
+        return ""
+
+    if not sections:
+        return ""
+    return "Aggregate statistics (computed over all matching records, not only the retrieved ones):\n" + "\n".join(sections)
+
+
+# -------------------------
+# Query-result cache
+# -------------------------
+class _ResultCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key: Tuple) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def put(self, key: Tuple, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": RESULT_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_RESULT_CACHE = _ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS)
+
+
+def get_retrieval_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the query-result cache (for tuning size and TTL)."""
+    return _RESULT_CACHE.stats()
+
+
+def clear_retrieval_cache() -> None:
+    _RESULT_CACHE.clear()
+
+
+def _normalize_query(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def _result_cache_key(collection: Any, safe_query: str, n_results: int, filter_type: Optional[str], filters: Optional[Dict[str, Any]], plan: Optional[str]) -> Tuple:
+    name = getattr(collection, "name", "") or ""
+    version = get_collection_version(name) if get_collection_version is not None else 0
+    return (
+        _normalize_query(safe_query),
+        filter_type,
+        json.dumps(filters or {}, sort_keys=True, default=str),
+        plan,
+        int(n_results),
+        name,
+        version,
+        RETRIEVAL_MODE,
+    )
+
+
 # -------------------------
 # Retrieval and formatting
 # -------------------------
@@ -134,14 +931,31 @@ def retrieve_relevant_context(
     filter_type: Optional[str] = None,
     analysis_focus: Optional[str] = None,
     collection_name: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    plan: Optional[str] = None,
+    mmr_lambda: Optional[float] = None,
 ) -> Optional[Dict[str, Any]]:
-    """Retrieve raw results from the vector DB. Returns a dict or None on failure."""
+    """Retrieve raw results from the vector DB. Returns a dict or None on failure.
+
+    `filters` (region, quarter, product, channel, segment, numeric ranges, ...) are pushed
+    into the Chroma `where` clause; see build_where_clause(). plan="scoped" / "unscoped"
+    additionally plans predicates from the query text (see build_planned_where()). If the
+    filtered search finds nothing, the result carries the where clause under
+    "no_match_filters" and format_retrieval_results() reports that no records match it;
+    predicates are never dropped to find something else.
+
+    Results are cached per (normalized query, filters, n_results, collection version); a
+    new ingestion bumps the version and so invalidates earlier entries.
+
+    With mmr_lambda set (and RAG_MMR_ENABLED), MMR_POOL_FACTOR x n_results candidates are
+    returned together with their stored embeddings; format_retrieval_results() then picks
+    a diverse n_results from them.
+    """
     if initialize_chromadb is None or query_vectordb is None:
         logger.warning("vector_db functions not available; cannot fetch real context.")
         return None
 
     safe_query = _coerce_query(query, analysis_focus=analysis_focus)
-    filter_dict = {"type": filter_type} if filter_type else None
 
     try:
         collection = _get_collection(collection_name)
@@ -152,25 +966,66 @@ def retrieve_relevant_context(
         logger.exception("Failed to initialize vector DB collection: %s", e)
         return None
 
+    use_mmr = MMR_ENABLED and mmr_lambda is not None
+    pool_size = n_results * max(1, MMR_POOL_FACTOR) if use_mmr else n_results
+
+    cache_key = None
+    if RESULT_CACHE_ENABLED:
+        try:
+            cache_key = _result_cache_key(collection, safe_query, pool_size, filter_type, filters, plan) + (use_mmr,)
+            cached = _RESULT_CACHE.get(cache_key)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            logger.debug("Result cache lookup failed: %s", e)
+            cache_key = None
+
+    index = None
+    if (filters or plan) and get_metadata_index is not None:
+        try:
+            index = get_metadata_index(getattr(collection, "name", "") or "")
+        except Exception:
+            index = None
+    if plan:
+        filter_dict = build_planned_where(query, filters, index=index, keep_unscoped_types=(plan == "unscoped"))
+    else:
+        filter_dict = build_where_clause(filter_type, filters, index=index)
+
     try:
-        results = _call_query_vectordb(collection, safe_query, n_results=n_results, filter_dict=filter_dict)
+        results = _search(collection, query, safe_query, pool_size, filter_dict)
+        if filter_dict and not _has_documents(results):
+            logger.info("No records match filter %s.", filter_dict)
+            results = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]], "no_match_filters": filter_dict}
+        if use_mmr:
+            results = _attach_embeddings(collection, results)
 
         # Normalize common shapes for downstream formatting.
         if results is None:
             return None
         if isinstance(results, dict):
-            return results
-        if isinstance(results, list):
+            normalized = results
+        elif isinstance(results, list):
             # Accept either a list of docs, list of dicts, or list of tuples.
-            return {"documents": [results], "metadatas": [[]], "distances": [[]]}
+            normalized = {"documents": [results], "metadatas": [[]], "distances": [[]]}
+        else:
+            # Some adapters return a raw string or single object
+            normalized = {"documents": [[str(results)]], "metadatas": [[{}]], "distances": [[0.0]]}
 
-        # Some adapters return a raw string or single object
-        return {"documents": [[str(results)]], "metadatas": [[{}]], "distances": [[0.0]]}
+        if cache_key is not None:
+            _RESULT_CACHE.put(cache_key, normalized)
+        return normalized
     except Exception as e:
         logger.exception("Vector DB query failed: %s", e)
         return None
 
 
+def _no_match_message(where: Dict[str, Any]) -> str:
+    return (
+        f"No records match the requested filters ({json.dumps(where, default=str)}). "
+        "The data contains no rows for this slice; do not substitute records from other slices."
+    )
+
+
 def _extract_nested(block: Any) -> List[Any]:
     """Handle shapes like [[...]] or [...] and always return a flat list."""
     if block is None:
@@ -182,8 +1037,17 @@ def _extract_nested(block: Any) -> List[Any]:
     return [block]
 
 # It Then formats the retrieved results into a consistent structure and includes the existing metadata with each document.
-def format_retrieval_results(results: Optional[Dict[str, Any]]) -> Union[str, List[Dict[str, Any]]]:
-    """Normalize and format raw retrieval results into a list of items or a string message."""
+def format_retrieval_results(
+    results: Optional[Dict[str, Any]],
+    n_results: Optional[int] = None,
+    mmr_lambda: Optional[float] = None,
+) -> Union[str, List[Dict[str, Any]]]:
+    """Normalize and format raw retrieval results into a list of items or a string message.
+
+    n_results keeps only the first n items. With mmr_lambda and per-result embeddings in
+    `results` (see retrieve_relevant_context()), those n are chosen by maximal marginal
+    relevance over the whole candidate pool instead.
+    """
     if not results:
         return "No relevant information found."
 
@@ -215,10 +1079,20 @@ def format_retrieval_results(results: Optional[Dict[str, Any]]) -> Union[str, Li
                         break
 
         if not docs:
+            if isinstance(results, dict) and results.get("no_match_filters"):
+                return _no_match_message(results["no_match_filters"])
             return "No relevant information found."
 
+        order: Optional[List[int]] = None
+        if mmr_lambda is not None and n_results and isinstance(results, dict) and len(docs) > n_results:
+            embeddings = _extract_nested(results.get("embeddings"))
+            order = _mmr_order(dists, embeddings, n_results, mmr_lambda) if len(dists) == len(docs) else None
+        if order is None:
+            order = list(range(len(docs)))[: n_results or None]
+
         formatted: List[Dict[str, Any]] = []
-        for i, doc in enumerate(docs):
+        for i in order:
+            doc = docs[i]
             if doc is None:
                 continue
 
@@ -246,79 +1120,145 @@ def format_retrieval_results(results: Optional[Dict[str, Any]]) -> Union[str, Li
         logger.exception("Failed to format retrieval results: %s", e)
         return "No relevant information found."
 
+def _render_item(item: Dict[str, Any]) -> str:
+    """Content plus a one-line metadata summary for one formatted item (no rank header)."""
+    lines = [f"   {item.get('content', '')}"]
+
+    meta = item.get("metadata", {}) or {}
+    meta_parts: List[str] = []
+
+    item_type = str(item.get("type", "")).lower()
+    if item_type == "sales":
+        product = meta.get("product") or meta.get("product_name") or "N/A"
+        revenue = _safe_currency(meta.get("revenue"))
+        region = meta.get("region", "N/A")
+        quarter = meta.get("quarter", "N/A")
+        meta_parts.extend([
+            f"Product: {product}",
+            f"Revenue: {revenue}",
+            f"Region: {region}",
+            f"Quarter: {quarter}",
+        ])
+    elif item_type == "marketing":
+        campaign = meta.get("campaign_name") or meta.get("campaign") or "N/A"
+        channel = meta.get("channel", "N/A")
+        budget = _safe_currency(meta.get("budget"))
+        conversions = meta.get("conversions", "N/A")
+        meta_parts.extend([
+            f"Campaign: {campaign}",
+            f"Channel: {channel}",
+            f"Budget: {budget}",
+            f"Conversions: {conversions}",
+        ])
+    else:
+        if isinstance(meta, dict):
+            if "source" in meta:
+                meta_parts.append(f"Source: {meta['source']}")
+            if "id" in meta:
+                meta_parts.append(f"ID: {meta['id']}")
+            if "region" in meta:
+                meta_parts.append(f"Region: {meta['region']}")
+            if "quarter" in meta:
+                meta_parts.append(f"Quarter: {meta['quarter']}")
+            if "product" in meta:
+                meta_parts.append(f"Product: {meta['product']}")
+            if "campaign_name" in meta:
+                meta_parts.append(f"Campaign: {meta['campaign_name']}")
+
+    if meta_parts:
+        lines.append("   " + " | ".join(meta_parts))
+    return "\n".join(lines)
+
+
+def _item_header(rank: int, item: Dict[str, Any]) -> str:
+    typ = str(item.get("type", "unknown")).upper()
+    score = item.get("relevance_score", 1.0)
+    return f"\n{rank}. [{typ}] (Relevance: {score:.2f})"
+
+
+_ITEM_HEADER_TOKENS = estimate_tokens(_item_header(10, {"type": "marketing", "relevance_score": 0.5}))
+
+
+def pack_context(
+    formatted_context: Union[str, List[Dict[str, Any]]],
+    max_items: int = DEFAULT_CONTEXT_MAX_ITEMS,
+    query: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    filter_type: Optional[str] = None,
+    collection_name: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    model: Optional[str] = None,
+) -> Tuple[str, Optional[Any]]:
+    """Pack formatted items into a prompt-ready string under a token budget.
+
+    The budget defaults to the context budget of `model` (see context_packer.py). Aggregate
+    statistics for the query's slice go in first (capped at AGGREGATE_BUDGET_SHARE of the
+    budget), then records are packed greedily by relevance score with near-duplicates
+    removed. Returns (context, PackResult); the PackResult is None when there were no items.
+    """
+    budget = token_budget or context_token_budget(model)
+    aggregate_context = build_aggregate_context(query or "", filters, filter_type, collection_name) if (query or filters) else ""
+    if aggregate_context:
+        aggregate_context = truncate_to_tokens(aggregate_context, int(budget * AGGREGATE_BUDGET_SHARE), model)
+
+    items = [item for item in formatted_context if isinstance(item, dict)] if not isinstance(formatted_context, str) else []
+    if not items:
+        message = formatted_context if isinstance(formatted_context, str) else "No relevant information found."
+        return (f"{message}\n\n{aggregate_context}" if aggregate_context else message), None
+
+    header = "Retrieved relevant information:"
+    remaining = budget - estimate_tokens(header, model) - estimate_tokens(aggregate_context, model)
+    packed = pack(
+        [(item, _render_item(item), item.get("relevance_score", 0.0), (item.get("metadata") or {}).get("id")) for item in items],
+        budget=max(remaining, 0),
+        model=model,
+        max_items=max_items,
+        overhead=_ITEM_HEADER_TOKENS,
+    )
+
+    parts: List[str] = [header]
+    for rank, (item, text) in enumerate(packed.kept, start=1):
+        parts.append(_item_header(rank, item))
+        parts.append(text)
+    if packed.dropped:
+        logger.info("Context packer: %s", packed.summary())
+        parts.append(
+            f"\n(Note: {packed.dropped} of {len(items)} retrieved items omitted: "
+            f"{packed.dropped_budget} over the context token budget, {packed.dropped_duplicates} near-duplicates.)"
+        )
+    if aggregate_context:
+        parts.append(f"\n{aggregate_context}")
+    return "\n".join(parts), packed
+
+
 # ItThen combines all the formatted retrieval items into a single text string (context), which is then sent to the LLM as part of the prompt.
-def create_context_string(formatted_context: Union[str, List[Dict[str, Any]]], max_items: int = DEFAULT_CONTEXT_MAX_ITEMS) -> str:
-    """Create a single prompt-ready context string for the LLM."""
-    if isinstance(formatted_context, str):
-        return formatted_context
-
-    parts: List[str] = ["Retrieved relevant information:"]
-    count = 0
-
-    for item in formatted_context:
-        if count >= max_items:
-            break
-        if not isinstance(item, dict):
-            continue
+def create_context_string(
+    formatted_context: Union[str, List[Dict[str, Any]]],
+    max_items: int = DEFAULT_CONTEXT_MAX_ITEMS,
+    query: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    filter_type: Optional[str] = None,
+    collection_name: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    model: Optional[str] = None,
+) -> str:
+    """Create a single prompt-ready context string for the LLM.
 
-        count += 1
-        rank = item.get("rank", count)
-        typ = str(item.get("type", "unknown")).upper()
-        score = item.get("relevance_score", 1.0)
-        parts.append(f"\n{rank}. [{typ}] (Relevance: {score:.2f})")
-
-        content = str(item.get("content", ""))
-        if len(content) > DEFAULT_MAX_CONTENT_CHARS:
-            content = content[:DEFAULT_MAX_CONTENT_CHARS] + " ...[truncated]"
-        parts.append(f"   {content}")
-
-        meta = item.get("metadata", {}) or {}
-        meta_parts: List[str] = []
-
-        item_type = str(item.get("type", "")).lower()
-        if item_type == "sales":
-            product = meta.get("product") or meta.get("product_name") or "N/A"
-            revenue = _safe_currency(meta.get("revenue"))
-            region = meta.get("region", "N/A")
-            quarter = meta.get("quarter", "N/A")
-            meta_parts.extend([
-                f"Product: {product}",
-                f"Revenue: {revenue}",
-                f"Region: {region}",
-                f"Quarter: {quarter}",
-            ])
-        elif item_type == "marketing":
-            campaign = meta.get("campaign_name") or meta.get("campaign") or "N/A"
-            channel = meta.get("channel", "N/A")
-            budget = _safe_currency(meta.get("budget"))
-            conversions = meta.get("conversions", "N/A")
-            meta_parts.extend([
-                f"Campaign: {campaign}",
-                f"Channel: {channel}",
-                f"Budget: {budget}",
-                f"Conversions: {conversions}",
-            ])
-        else:
-            if isinstance(meta, dict):
-                if "source" in meta:
-                    meta_parts.append(f"Source: {meta['source']}")
-                if "id" in meta:
-                    meta_parts.append(f"ID: {meta['id']}")
-                if "region" in meta:
-                    meta_parts.append(f"Region: {meta['region']}")
-                if "quarter" in meta:
-                    meta_parts.append(f"Quarter: {meta['quarter']}")
-                if "product" in meta:
-                    meta_parts.append(f"Product: {meta['product']}")
-                if "campaign_name" in meta:
-                    meta_parts.append(f"Campaign: {meta['campaign_name']}")
-
-        if meta_parts:
-            parts.append("   " + " | ".join(meta_parts))
-
-    if count == 0:
-        return "No relevant information found."
-    return "\n".join(parts)
+    Items are packed by relevance under the model's token budget (see pack_context()).
+    When a query or filters are given, the matching precomputed aggregate slices are
+    appended (see build_aggregate_context()).
+    """
+    context, _ = pack_context(
+        formatted_context,
+        max_items=max_items,
+        query=query,
+        filters=filters,
+        filter_type=filter_type,
+        collection_name=collection_name,
+        token_budget=token_budget,
+        model=model,
+    )
+    return context
 
 
 # -------------------------
@@ -331,90 +1271,280 @@ def _wrap_retrieval(
     filter_type: Optional[str] = None,
     analysis_focus: Optional[str] = None,
     collection_name: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    plan: Optional[str] = None,
+    report_type: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    model: Optional[str] = None,
 ) -> str:
+    mmr_lambda = MMR_LAMBDAS.get(report_type or "") if MMR_ENABLED else None
     results = retrieve_relevant_context(
         query,
         n_results=n_results,
         filter_type=filter_type,
         analysis_focus=analysis_focus,
         collection_name=collection_name,
+        filters=filters,
+        plan=plan,
+        mmr_lambda=mmr_lambda,
+    )
+    formatted = format_retrieval_results(results, n_results=n_results, mmr_lambda=mmr_lambda)
+    return create_context_string(
+        formatted,
+        query=_coerce_query(query, analysis_focus=analysis_focus),
+        filters=filters,
+        filter_type=filter_type,
+        collection_name=collection_name,
+        token_budget=token_budget,
+        model=model,
     )
-    formatted = format_retrieval_results(results)
-    return create_context_string(formatted)
 
 
-def retrieve_sales_data(query: str, n_results: int = DEFAULT_N_RESULTS, analysis_focus: Optional[str] = None) -> str:
+def retrieve_sales_data(
+    query: str,
+    n_results: int = DEFAULT_N_RESULTS,
+    analysis_focus: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> str:
     return _wrap_retrieval(
         query,
         n_results=n_results,
         filter_type="sales",
         analysis_focus=analysis_focus,
         collection_name=COLLECTION_OVERRIDES.get("sales"),
+        filters=filters,
+        report_type="sales",
+        model=model,
     )
 
 
-def retrieve_marketing_data(query: str, n_results: int = DEFAULT_N_RESULTS, analysis_focus: Optional[str] = None) -> str:
+def retrieve_marketing_data(
+    query: str,
+    n_results: int = DEFAULT_N_RESULTS,
+    analysis_focus: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> str:
     return _wrap_retrieval(
         query,
         n_results=n_results,
         filter_type="marketing",
         analysis_focus=analysis_focus,
         collection_name=COLLECTION_OVERRIDES.get("marketing"),
+        filters=filters,
+        report_type="marketing",
+        model=model,
     )
 
 
-def retrieve_combined_data(query: str, n_results: int = DEFAULT_N_RESULTS, analysis_focus: Optional[str] = None) -> str:
+def retrieve_combined_data(
+    query: str,
+    n_results: int = DEFAULT_N_RESULTS,
+    analysis_focus: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> str:
     return _wrap_retrieval(
         query,
         n_results=n_results,
         filter_type=None,
         analysis_focus=analysis_focus,
         collection_name=COLLECTION_OVERRIDES.get("combined"),
+        filters=filters,
+        report_type="combined",
+        model=model,
     )
 
 
 # Extra helpers for report_generator.py / app.py compatibility
 
-def retrieve_product_data(query: str, n_results: int = DEFAULT_N_RESULTS, analysis_focus: Optional[str] = None) -> str:
+def retrieve_product_data(
+    query: str,
+    n_results: int = DEFAULT_N_RESULTS,
+    analysis_focus: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> str:
+    """Sales rows for the product plus marketing campaigns named after it."""
     return _wrap_retrieval(
         query,
         n_results=n_results,
-        filter_type="product",
+        filter_type=None,
         analysis_focus=analysis_focus,
         collection_name=COLLECTION_OVERRIDES.get("product"),
+        filters=filters,
+        report_type="product",
+        plan="scoped",
+        model=model,
     )
 
 
-def retrieve_regional_data(query: str, n_results: int = DEFAULT_N_RESULTS, analysis_focus: Optional[str] = None) -> str:
+def retrieve_regional_data(
+    query: str,
+    n_results: int = DEFAULT_N_RESULTS,
+    analysis_focus: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> str:
+    """Sales rows for the region(s); marketing rows are kept (they carry no region) and narrowed by quarter/segment/channel when mentioned."""
     return _wrap_retrieval(
         query,
         n_results=n_results,
-        filter_type="regional",
+        filter_type=None,
         analysis_focus=analysis_focus,
         collection_name=COLLECTION_OVERRIDES.get("regional"),
+        filters=filters,
+        report_type="regional",
+        plan="unscoped",
+        model=model,
     )
 
 
-def retrieve_custom_data(query: str, n_results: int = DEFAULT_N_RESULTS, analysis_focus: Optional[str] = None) -> str:
+def retrieve_custom_data(
+    query: str,
+    n_results: int = DEFAULT_N_RESULTS,
+    analysis_focus: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> str:
+    """Free-form query: mentioned products, regions, quarters, channels, segments and reps become metadata predicates."""
     return _wrap_retrieval(
         query,
         n_results=n_results,
-        filter_type="custom",
+        filter_type=None,
         analysis_focus=analysis_focus,
         collection_name=COLLECTION_OVERRIDES.get("custom"),
+        filters=filters,
+        report_type="custom",
+        plan="scoped",
+        model=model,
     )
 
 
-def retrieve_all_data(query: str, n_results: int = DEFAULT_N_RESULTS, analysis_focus: Optional[str] = None) -> str:
+def retrieve_all_data(
+    query: str,
+    n_results: int = DEFAULT_N_RESULTS,
+    analysis_focus: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> str:
     return _wrap_retrieval(
         query,
         n_results=n_results,
         filter_type=None,
         analysis_focus=analysis_focus,
         collection_name=COLLECTION_OVERRIDES.get("all"),
+        filters=filters,
+        report_type="all",
+        model=model,
     )
 
 
+# -------------------------
+# Async retrieval
+# -------------------------
+# Chroma's embedded client and the embedding model are synchronous, so the async API runs the
+# sync retrievers on a small bounded thread pool instead of blocking the caller's event loop.
+_ASYNC_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_ASYNC_EXECUTOR_LOCK = threading.Lock()
+
+
+def _async_executor() -> ThreadPoolExecutor:
+    global _ASYNC_EXECUTOR
+    with _ASYNC_EXECUTOR_LOCK:
+        if _ASYNC_EXECUTOR is None:
+            _ASYNC_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, ASYNC_RETRIEVAL_WORKERS), thread_name_prefix="rag-retrieval")
+        return _ASYNC_EXECUTOR
+
+
+def shutdown_async_retrieval(wait: bool = True) -> None:
+    """Stop the retrieval worker threads (a new pool is created on the next async call)."""
+    global _ASYNC_EXECUTOR
+    with _ASYNC_EXECUTOR_LOCK:
+        executor, _ASYNC_EXECUTOR = _ASYNC_EXECUTOR, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+async def _run_async(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_async_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def retrieve_relevant_context_async(query: str, **kwargs) -> Optional[Dict[str, Any]]:
+    return await _run_async(retrieve_relevant_context, query, **kwargs)
+
+
+async def retrieve_sales_data_async(query: str, **kwargs) -> str:
+    return await _run_async(retrieve_sales_data, query, **kwargs)
+
+
+async def retrieve_marketing_data_async(query: str, **kwargs) -> str:
+    return await _run_async(retrieve_marketing_data, query, **kwargs)
+
+
+async def retrieve_combined_data_async(query: str, **kwargs) -> str:
+    return await _run_async(retrieve_combined_data, query, **kwargs)
+
+
+async def retrieve_combined_data_split_async(
+    query: str,
+    n_results: int = DEFAULT_N_RESULTS,
+    analysis_focus: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    model: Optional[str] = None,
+) -> str:
+    """Combined context with sales and marketing fetched concurrently, one section each.
+
+    Each domain gets n_results and half of the context token budget, so both are always
+    represented (a single mixed search can return only one record type). The output is
+    two labelled sections, unlike retrieve_combined_data()'s single context.
+    """
+    half_budget = context_token_budget(model) // 2
+    sales, marketing = await asyncio.gather(
+        *(
+            _run_async(
+                _wrap_retrieval,
+                query,
+                n_results=n_results,
+                filter_type=record_type,
+                analysis_focus=analysis_focus,
+                collection_name=COLLECTION_OVERRIDES.get("combined"),
+                filters=_split_filters(filters, record_type),
+                report_type="combined",
+                token_budget=half_budget,
+                model=model,
+            )
+            for record_type in RECORD_TYPES
+        )
+    )
+    return f"=== Sales context ===\n{sales}\n\n=== Marketing context ===\n{marketing}"
+
+
+def _split_filters(filters: Optional[Dict[str, Any]], record_type: str) -> Optional[Dict[str, Any]]:
+    """Only the filters a record type has fields for (a region filter must not empty the marketing side)."""
+    cleaned = _clean_filters(filters)
+    kept = {k: v for k, v in cleaned.items() if record_type in FILTER_FIELDS[k] or (k == "product" and record_type == "marketing")}
+    return kept or None
+
+
+async def retrieve_product_data_async(query: str, **kwargs) -> str:
+    return await _run_async(retrieve_product_data, query, **kwargs)
+
+
+async def retrieve_regional_data_async(query: str, **kwargs) -> str:
+    return await _run_async(retrieve_regional_data, query, **kwargs)
+
+
+async def retrieve_custom_data_async(query: str, **kwargs) -> str:
+    return await _run_async(retrieve_custom_data, query, **kwargs)
+
+
+async def retrieve_all_data_async(query: str, **kwargs) -> str:
+    return await _run_async(retrieve_all_data, query, **kwargs)
+
+
 # Backwards-compatible aliases that some codebases use
 retrieve_context = retrieve_relevant_context
 retrieve_relevant_data = retrieve_relevant_context
@@ -4,7 +4,7 @@ report_generator.py - convenience wrappers and CLI around agent + RAG.
 
 from __future__ import annotations
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
 import argparse
 from datetime import datetime
 import json
@@ -14,10 +14,18 @@ import re
 
 # Prefer the richer multi-agent entrypoint, but keep the legacy wrapper available.
 try:
-    from agent import generate_report_with_autogen_multiagent, generate_report_with_rag, generate_custom_report
+    from agent import (
+        ReportStream,
+        generate_custom_report,
+        generate_report_with_autogen_multiagent,
+        generate_report_with_rag,
+        stream_report_with_autogen_multiagent,
+    )
 except Exception as e:  # pragma: no cover
     raise RuntimeError("Failed to import agent module. Ensure agent.py is present and importable.") from e
 
+from llm_cache import bypass_llm_cache
+
 # Optional direct RAG preview / fallback utilities.
 try:
     from rag_retrieval import (
@@ -28,6 +36,7 @@ try:
         retrieve_regional_data,
         retrieve_custom_data,
         retrieve_all_data,
+        stored_values,
     )
 except Exception:  # pragma: no cover
     retrieve_sales_data = None
@@ -37,6 +46,7 @@ except Exception:  # pragma: no cover
     retrieve_regional_data = None
     retrieve_custom_data = None
     retrieve_all_data = None
+    stored_values = None
 
 # Logging
 logger = logging.getLogger(__name__)
@@ -60,15 +70,43 @@ def _build_focus(query: str, analysis_focus: Optional[str] = None) -> str:
     return f"{query}\n\nUser analysis focus:\n{focus}" if query else f"User analysis focus:\n{focus}"
 
 
-def _generate(query: str, report_type: str, n_results: int = 8, analysis_focus: str = "") -> str:
-    """Single place to call the report engine with consistent arguments."""
+def _range(low: Optional[float], high: Optional[float]):
+    """(low, high) numeric range filter, or None when both ends are open."""
+    if low is None and high is None:
+        return None
+    return (low, high)
+
+
+def _stored_quarter(quarter: str) -> bool:
+    """True when the collection holds records for `quarter` ("Q1 2024", or "Q1" for every year)."""
+    try:
+        known = stored_values("quarter") if stored_values is not None else None
+    except Exception as e:
+        logger.warning("Could not read stored quarters: %s", e)
+        known = None
+    needle = quarter.lower()
+    return bool(quarter) and any(q.lower() == needle or q.lower().startswith(needle + " ") for q in known or [])
+
+
+def _generate(
+    query: str,
+    report_type: str,
+    n_results: int = 8,
+    analysis_focus: str = "",
+    filters: Optional[Dict[str, Any]] = None,
+    stream: bool = False,
+) -> Union[str, ReportStream]:
+    """Single place to call the report engine with consistent arguments (stream=True: a ReportStream of the writer's tokens)."""
     # Keep the older multi-agent wrapper as the primary path because app.py depends on the
     # report_generator layer, not agent.py directly.
-    return generate_report_with_autogen_multiagent(
+    filters = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+    engine = stream_report_with_autogen_multiagent if stream else generate_report_with_autogen_multiagent
+    return engine(
         query,
         report_type=report_type,
         n_results=n_results,
         analysis_focus=analysis_focus,
+        filters=filters or None,
     )
 
 
@@ -104,7 +142,12 @@ def generate_sales_performance_report(
     region: Optional[str] = None,
     quarter: Optional[str] = None,
     analysis_focus: str = "",
-) -> str:
+    product: Optional[str] = None,
+    segment: Optional[str] = None,
+    min_revenue: Optional[float] = None,
+    max_revenue: Optional[float] = None,
+    stream: bool = False,
+) -> Union[str, ReportStream]:
     query_parts = ["Analyze sales performance"]
     if region:
         query_parts.append(f"in {region}")
@@ -113,7 +156,14 @@ def generate_sales_performance_report(
     query = " ".join(query_parts)
     logger.info("Generating sales performance report — Query: %s", query)
     try:
-        return _generate(query, report_type="sales", n_results=8, analysis_focus=analysis_focus)
+        filters = {
+            "region": region,
+            "quarter": quarter,
+            "product": product,
+            "segment": segment,
+            "revenue": _range(min_revenue, max_revenue),
+        }
+        return _generate(query, report_type="sales", n_results=8, analysis_focus=analysis_focus, filters=filters, stream=stream)
     except Exception as e:
         logger.exception("Failed to generate sales performance report: %s", e)
         return f"ERROR: Failed to generate report — {e}"
@@ -123,7 +173,11 @@ def generate_marketing_campaign_report(
     channel: Optional[str] = None,
     quarter: Optional[str] = None,
     analysis_focus: str = "",
-) -> str:
+    segment: Optional[str] = None,
+    min_budget: Optional[float] = None,
+    max_budget: Optional[float] = None,
+    stream: bool = False,
+) -> Union[str, ReportStream]:
     query_parts = ["Analyze marketing campaign performance"]
     if channel:
         query_parts.append(f"for {channel} channel")
@@ -132,52 +186,85 @@ def generate_marketing_campaign_report(
     query = " ".join(query_parts)
     logger.info("Generating marketing campaign report — Query: %s", query)
     try:
-        return _generate(query, report_type="marketing", n_results=8, analysis_focus=analysis_focus)
+        filters = {
+            "channel": channel,
+            "quarter": quarter,
+            "segment": segment,
+            "budget": _range(min_budget, max_budget),
+        }
+        return _generate(query, report_type="marketing", n_results=8, analysis_focus=analysis_focus, filters=filters, stream=stream)
     except Exception as e:
         logger.exception("Failed to generate marketing campaign report: %s", e)
         return f"ERROR: Failed to generate report — {e}"
 
 
-def generate_quarterly_summary_report(quarter: str, analysis_focus: str = "") -> str:
+def generate_quarterly_summary_report(quarter: str, analysis_focus: str = "", stream: bool = False) -> Union[str, ReportStream]:
     quarter = _clean_text(quarter)
     query = f"Provide a comprehensive summary of sales and marketing performance for {quarter}"
+    filters = {"quarter": quarter}
+    if not _stored_quarter(quarter):
+        # e.g. the scheduler's current calendar quarter is past the loaded data: summarise what is stored.
+        logger.warning("No records stored for quarter %r; summarising without a quarter filter", quarter)
+        query = f"Provide a comprehensive summary of sales and marketing performance for the most recent data available (no records are stored for {quarter})"
+        filters = None
     logger.info("Generating quarterly summary report — Query: %s", query)
     try:
-        return _generate(query, report_type="combined", n_results=10, analysis_focus=analysis_focus)
+        return _generate(
+            query,
+            report_type="combined",
+            n_results=10,
+            analysis_focus=analysis_focus,
+            filters=filters,
+            stream=stream,
+        )
     except Exception as e:
         logger.exception("Failed to generate quarterly summary report: %s", e)
         return f"ERROR: Failed to generate report — {e}"
 
 
-def generate_product_analysis_report(product_name: str, analysis_focus: str = "") -> str:
+def generate_product_analysis_report(product_name: str, analysis_focus: str = "", stream: bool = False) -> Union[str, ReportStream]:
     product_name = _clean_text(product_name)
     query = f"Analyze the performance and marketing of {product_name}"
     logger.info("Generating product analysis report — Query: %s", query)
     try:
-        # product-oriented reports benefit from combined context unless you have a dedicated product collection
-        return _generate(query, report_type="combined", n_results=8, analysis_focus=analysis_focus)
+        # Sales rows for the product plus the marketing campaigns named after it.
+        return _generate(
+            query,
+            report_type="product",
+            n_results=8,
+            analysis_focus=analysis_focus,
+            filters={"product": product_name},
+            stream=stream,
+        )
     except Exception as e:
         logger.exception("Failed to generate product analysis report: %s", e)
         return f"ERROR: Failed to generate report — {e}"
 
 
-def generate_regional_analysis_report(region: str, analysis_focus: str = "") -> str:
+def generate_regional_analysis_report(region: str, analysis_focus: str = "", stream: bool = False) -> Union[str, ReportStream]:
     region = _clean_text(region)
     query = f"Analyze sales and marketing performance in {region}"
     logger.info("Generating regional analysis report — Query: %s", query)
     try:
-        return _generate(query, report_type="combined", n_results=8, analysis_focus=analysis_focus)
+        return _generate(
+            query,
+            report_type="regional",
+            n_results=8,
+            analysis_focus=analysis_focus,
+            filters={"region": region},
+            stream=stream,
+        )
     except Exception as e:
         logger.exception("Failed to generate regional analysis report: %s", e)
         return f"ERROR: Failed to generate report — {e}"
 
 
-def generate_custom_analysis_report(custom_query: str, analysis_focus: str = "") -> str:
+def generate_custom_analysis_report(custom_query: str, analysis_focus: str = "", stream: bool = False) -> Union[str, ReportStream]:
     custom_query = _clean_text(custom_query)
     logger.info("Generating custom analysis report — Query: %s", custom_query)
     try:
-        # Preserve the existing behavior of using the report pipeline.
-        return _generate(custom_query, report_type="combined", n_results=8, analysis_focus=analysis_focus)
+        # The custom retriever plans metadata predicates from the free-form query.
+        return _generate(custom_query, report_type="custom", n_results=8, analysis_focus=analysis_focus, stream=stream)
     except Exception as e:
         logger.exception("Failed to generate custom analysis report: %s", e)
         return f"ERROR: Failed to generate report — {e}"
@@ -274,9 +361,24 @@ def _build_report(args) -> str:
     analysis_focus = getattr(args, "analysis_focus", "") or ""
 
     if t == "sales_performance":
-        return generate_sales_performance_report(region=args.region, quarter=args.quarter, analysis_focus=analysis_focus)
+        return generate_sales_performance_report(
+            region=args.region,
+            quarter=args.quarter,
+            analysis_focus=analysis_focus,
+            product=args.product,
+            segment=args.segment,
+            min_revenue=args.min_revenue,
+            max_revenue=args.max_revenue,
+        )
     if t == "marketing_campaign":
-        return generate_marketing_campaign_report(channel=args.channel, quarter=args.quarter, analysis_focus=analysis_focus)
+        return generate_marketing_campaign_report(
+            channel=args.channel,
+            quarter=args.quarter,
+            analysis_focus=analysis_focus,
+            segment=args.segment,
+            min_budget=args.min_budget,
+            max_budget=args.max_budget,
+        )
     if t == "quarterly_summary":
         if not args.quarter:
             raise ValueError("quarter is required for quarterly_summary")
@@ -304,13 +406,20 @@ def _cli():
     p.add_argument("--channel", help="Marketing channel (for marketing report)")
     p.add_argument("--product", help="Product name (for product analysis)")
     p.add_argument("--query", help="Custom query (for custom report)")
+    p.add_argument("--segment", help="Customer / target segment filter (e.g. 'Enterprise')")
+    p.add_argument("--min-revenue", dest="min_revenue", type=float, help="Minimum revenue per sale (sales report)")
+    p.add_argument("--max-revenue", dest="max_revenue", type=float, help="Maximum revenue per sale (sales report)")
+    p.add_argument("--min-budget", dest="min_budget", type=float, help="Minimum campaign budget (marketing report)")
+    p.add_argument("--max-budget", dest="max_budget", type=float, help="Maximum campaign budget (marketing report)")
     p.add_argument("--analysis-focus", dest="analysis_focus", help="Optional analysis focus / instruction")
     p.add_argument("--out", help="Output filename (optional)")
     p.add_argument("--out-folder", help="Output folder (optional)")
+    p.add_argument("--no-cache", dest="no_cache", action="store_true", help="Ignore cached LLM responses (fresh ones are still stored)")
     args = p.parse_args()
 
     try:
-        report = _build_report(args)
+        with bypass_llm_cache(args.no_cache):
+            report = _build_report(args)
         print("\n" + "=" * 80)
         print("REPORT OUTPUT:")
         print("=" * 80 + "\n")
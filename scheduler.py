@@ -7,6 +7,7 @@ import time
 import json
 import logging
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -16,7 +17,9 @@ import schedule
 from config import (
     SCHEDULE_TIME,
     TIMEZONE,
-    RECIPIENT_EMAIL
+    RECIPIENT_EMAIL,
+    SCHEDULER_REPORT_CONCURRENCY,
+    SCHEDULER_REPORT_TIMEOUT_SECONDS
 )
 
 from report_generator import (
@@ -26,6 +29,10 @@ from report_generator import (
     save_report_to_file
 )
 
+import matplotlib
+
+matplotlib.use("Agg")  # charts render on a worker thread; no GUI backend
+
 from visualizations import generate_all_charts
 from email_sender_html import send_html_email_with_charts
 
@@ -121,47 +128,209 @@ def cleanup_old_files(days=30):
 # REPORT GENERATION
 # ==========================================================
 
-def generate_reports():
+def _report_jobs(quarter):
+
+    return [
+        (
+            "sales",
+            generate_sales_performance_report
+        ),
+        (
+            "marketing",
+            generate_marketing_campaign_report
+        ),
+        (
+            "executive_summary",
+            lambda: generate_quarterly_summary_report(quarter)
+        ),
+    ]
+
+
+def _build_and_save(name, build, timestamp):
+
+    report = build()
+
+    # The generate_*_report wrappers return their errors as text
+    # instead of raising.
+    if isinstance(report, str) and report.startswith("ERROR:"):
+        raise RuntimeError(report)
+
+    report_file = REPORT_DIR / f"{name}_{timestamp}.txt"
+
+    save_report_to_file(report, str(report_file))
+
+    return str(report_file)
+
+
+async def _run_report(name, build, timestamp, semaphore, pool):
+    """
+    Generate and save one report on the worker pool.
+
+    Never raises: a failure or timeout is returned as the report's
+    status so the other reports are unaffected.
+    """
+
+    async with semaphore:
+
+        logger.info(f"Generating {name} report...")
+
+        loop = asyncio.get_running_loop()
+
+        started = time.perf_counter()
+
+        result = {
+            "name": name,
+            "status": "success",
+            "file": None
+        }
+
+        try:
+
+            result["file"] = await asyncio.wait_for(
+                loop.run_in_executor(
+                    pool,
+                    _build_and_save,
+                    name,
+                    build,
+                    timestamp
+                ),
+                timeout=SCHEDULER_REPORT_TIMEOUT_SECONDS
+            )
+
+        except asyncio.TimeoutError:
+
+            # The worker thread cannot be interrupted; it finishes in
+            # the background and its output is not delivered.
+            result["status"] = "timeout"
+
+            result["error"] = (
+                f"timed out after "
+                f"{SCHEDULER_REPORT_TIMEOUT_SECONDS:g}s"
+            )
+
+        except Exception as e:
+
+            result["status"] = "failed"
+
+            result["error"] = str(e)
+
+        result["seconds"] = round(
+            time.perf_counter() - started,
+            2
+        )
+
+        if result["status"] == "success":
+            logger.info(
+                f"{name} report done in {result['seconds']}s"
+            )
+        else:
+            logger.error(
+                f"{name} report {result['status']}: "
+                f"{result['error']}"
+            )
+
+        return result
+
+
+def _render_charts():
+
+    charts = generate_all_charts()
+
+    return [
+        os.path.abspath(c)
+        for c in charts
+        if os.path.exists(c)
+    ]
+
+
+async def _generate_all(with_charts=True):
+    """
+    Run the reports concurrently (bounded by
+    SCHEDULER_REPORT_CONCURRENCY) while the charts render on their
+    own thread. Returns (report results, chart paths).
+    """
 
     quarter = f"{get_current_quarter()} {datetime.now().year}"
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    report_files = []
+    loop = asyncio.get_running_loop()
 
-    logger.info("Generating sales report...")
+    concurrency = max(1, SCHEDULER_REPORT_CONCURRENCY)
 
-    sales = generate_sales_performance_report()
+    semaphore = asyncio.Semaphore(concurrency)
 
-    sales_file = REPORT_DIR / f"sales_{timestamp}.txt"
+    pool = ThreadPoolExecutor(
+        max_workers=concurrency,
+        thread_name_prefix="report"
+    )
 
-    save_report_to_file(sales, str(sales_file))
+    chart_pool = ThreadPoolExecutor(
+        max_workers=1,
+        thread_name_prefix="charts"
+    )
 
-    report_files.append(str(sales_file))
+    try:
 
-    logger.info("Generating marketing report...")
+        chart_future = (
+            loop.run_in_executor(chart_pool, _render_charts)
+            if with_charts
+            else None
+        )
 
-    marketing = generate_marketing_campaign_report()
+        results = await asyncio.gather(
+            *[
+                _run_report(
+                    name,
+                    build,
+                    timestamp,
+                    semaphore,
+                    pool
+                )
+                for name, build in _report_jobs(quarter)
+            ]
+        )
 
-    marketing_file = REPORT_DIR / f"marketing_{timestamp}.txt"
+        charts = []
 
-    save_report_to_file(marketing, str(marketing_file))
+        if chart_future is not None:
 
-    report_files.append(str(marketing_file))
+            try:
 
-    logger.info("Generating executive summary...")
+                charts = await chart_future
 
-    summary = generate_quarterly_summary_report(
-        quarter
-    )
+                logger.info(f"{len(charts)} charts generated")
+
+            except Exception as e:
+
+                logger.exception(f"Chart generation failed: {e}")
+
+        return list(results), charts
+
+    finally:
 
-    summary_file = REPORT_DIR / f"executive_summary_{timestamp}.txt"
+        # Don't block on a timed-out report still running in the pool.
+        pool.shutdown(wait=False, cancel_futures=True)
 
-    save_report_to_file(summary, str(summary_file))
+        chart_pool.shutdown(wait=False)
 
-    report_files.append(str(summary_file))
 
-    return report_files
+def generate_reports_and_charts():
+
+    return asyncio.run(_generate_all())
+
+
+def generate_reports():
+
+    results, _ = asyncio.run(
+        _generate_all(with_charts=False)
+    )
+
+    return [
+        r["file"]
+        for r in results
+        if r["status"] == "success"
+    ]
 
 
 # ==========================================================
@@ -217,31 +386,35 @@ def daily_job():
     try:
 
         # --------------------------------------------------
-        # REPORTS
+        # REPORTS + CHARTS (concurrently)
         # --------------------------------------------------
 
-        reports = generate_reports()
-
-        metadata["reports"] = reports
-
-        logger.info("Reports generated")
+        results, charts = generate_reports_and_charts()
 
-        # --------------------------------------------------
-        # CHARTS
-        # --------------------------------------------------
+        reports = [
+            r["file"]
+            for r in results
+            if r["status"] == "success"
+        ]
 
-        charts = generate_all_charts()
+        metadata["reports"] = reports
 
-        charts = [
-            os.path.abspath(c)
-            for c in charts
-            if os.path.exists(c)
-        ]
+        metadata["report_status"] = {
+            r["name"]: {
+                k: v
+                for k, v in r.items()
+                if k not in ("name", "file")
+            }
+            for r in results
+        }
 
         metadata["charts"] = charts
 
+        if not reports:
+            raise RuntimeError("All reports failed")
+
         logger.info(
-            f"{len(charts)} charts generated"
+            f"{len(reports)}/{len(results)} reports generated"
         )
 
         # --------------------------------------------------
@@ -286,7 +459,11 @@ def daily_job():
 
         cleanup_old_files(30)
 
-        metadata["status"] = "success"
+        metadata["status"] = (
+            "success"
+            if len(reports) == len(results)
+            else "partial"
+        )
 
         logger.info("Daily job completed")
 
@@ -0,0 +1,48 @@
+import pytest
+
+from aggregates import Aggregates, build_aggregates
+from metadata_index import MetadataIndex
+
+SALES = [
+    ("sales_S1", {"type": "sales", "region": "Europe", "quarter": "Q1 2024", "product": "Laptop", "customer_segment": "SMB", "revenue": 1000.0, "units_sold": 2}),
+    ("sales_S2", {"type": "sales", "region": "Europe", "quarter": "Q2 2024", "product": "Phone", "customer_segment": "SMB", "revenue": 300.0, "units_sold": 3}),
+    ("sales_S3", {"type": "sales", "region": "Asia", "quarter": "Q1 2024", "product": "Laptop", "customer_segment": "Enterprise", "revenue": 500.0, "units_sold": 1}),
+]
+MARKETING = [
+    ("marketing_M1", {"type": "marketing", "channel": "Email", "quarter": "Q1 2024", "target_segment": "SMB", "budget": 100.0, "impressions": 1000, "clicks": 50, "conversions": 5}),
+]
+
+
+@pytest.fixture
+def aggregates():
+    return build_aggregates(MetadataIndex.from_records(SALES + MARKETING))
+
+
+def test_totals_and_rollup(aggregates):
+    sales = aggregates.get("sales")
+    assert sales.totals() == {"count": 3, "revenue": 1800.0, "units_sold": 6.0}
+    assert sales.totals({"region": ["Europe"]})["revenue"] == 1300.0
+    assert sales.totals({"region": ["Atlantis"]})["count"] == 0
+    rollup = dict(sales.rollup("product"))
+    assert rollup["Laptop"]["revenue"] == 1500.0 and rollup["Phone"]["count"] == 1
+
+
+def test_unknown_dimension_is_rejected(aggregates):
+    with pytest.raises(KeyError):
+        aggregates.get("marketing").mask({"region": ["Europe"]})
+
+
+def test_summarize_skips_pinned_dimensions(aggregates):
+    summary = aggregates.summarize("sales", {"region": ["Europe"]})
+    assert summary.startswith("SALES [region=Europe] (2 records)")
+    assert "by region" not in summary
+    assert "by product" in summary
+    assert aggregates.summarize("sales", {"region": ["Atlantis"]}) is None
+
+
+def test_save_load_round_trip(aggregates, tmp_path):
+    path = str(tmp_path / "c.aggregates.npz")
+    aggregates.save(path)
+    loaded = Aggregates.load(path)
+    assert loaded.summarize("marketing") == aggregates.summarize("marketing")
+    assert loaded.get("sales").totals({"quarter": ["Q1 2024"]}) == aggregates.get("sales").totals({"quarter": ["Q1 2024"]})
@@ -0,0 +1,53 @@
+from context_packer import estimate_tokens, pack, truncate_to_tokens
+
+RECORDS = "\n".join(f"Sale S{i:04d}: Laptop in Europe, revenue $21,{i:03d}, units {i}" for i in range(200))
+
+
+def test_estimate_tokens_grows_with_text():
+    assert estimate_tokens("") == 0
+    assert 0 < estimate_tokens("revenue $21,691") < estimate_tokens(RECORDS)
+
+
+def test_truncate_keeps_whole_lines_from_head_and_tail():
+    lines = set(RECORDS.splitlines())
+    truncated = truncate_to_tokens(RECORDS, 300)
+    assert estimate_tokens(truncated) <= 300
+    head, tail = truncated.split("[...context truncated...]")
+    kept = head.strip().splitlines() + tail.strip().splitlines()
+    assert kept and all(line in lines for line in kept)
+    assert kept[0] == RECORDS.splitlines()[0] and kept[-1] == RECORDS.splitlines()[-1]
+
+
+def test_truncate_single_line_on_word_boundary_within_budget():
+    text = " ".join(f"$21,{i:03d}" for i in range(500))
+    words = set(text.split())
+    for budget in (5, 20, 100):
+        truncated = truncate_to_tokens(text, budget)
+        assert estimate_tokens(truncated) <= budget
+        assert all(word in words for word in truncated.replace("[...context truncated...]", "").split())
+
+
+def test_truncate_returns_text_that_fits_unchanged():
+    assert truncate_to_tokens("short text", 100) == "short text"
+    assert truncate_to_tokens("a b c d e f", 0) == ""
+
+
+def test_pack_by_score_with_dedup_and_budget():
+    items = [
+        ("low", "low score record about phones in Asia", 0.1, "S3"),
+        ("best", "best record about laptops in Europe", 0.9, "S1"),
+        ("dup-key", "another render of the best record", 0.8, "S1"),
+        ("dup-text", "best record about laptops in Europe", 0.7, "S2"),
+    ]
+    result = pack(items, budget=1000)
+    assert [item for item, _ in result.kept] == ["best", "low"]
+    assert result.dropped_duplicates == 2
+
+    capped = pack(items, budget=1000, max_items=1)
+    assert [item for item, _ in capped.kept] == ["best"] and capped.dropped_budget == 1
+
+
+def test_pack_truncates_the_best_item_when_nothing_fits():
+    result = pack([("big", RECORDS, 1.0, None)], budget=100)
+    assert len(result.kept) == 1
+    assert result.tokens_used <= 100
@@ -0,0 +1,32 @@
+import embedding_cache
+from embedding_cache import EmbeddingCache
+
+
+def test_hits_are_touched_in_memory_until_the_next_put(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: now[0])
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+
+    cache.put_many("model", ["a", "b"], [[1.0], [2.0]])
+    now[0] += 1
+    changes = cache._conn.total_changes
+    assert cache.get_many("model", ["a"]) == [[1.0]]
+    assert cache._conn.total_changes == changes  # no write on a hit
+
+    now[0] += 1
+    cache.put_many("model", ["c"], [[3.0]])  # flushes "a"'s touch first, so "b" is evicted
+    assert cache.get_many("model", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_eviction_counts_rows_written_by_other_processes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = EmbeddingCache(path, max_entries=3)
+    second = EmbeddingCache(path, max_entries=3)
+
+    first.put_many("model", ["a", "b"], [[1.0], [2.0]])
+    second.put_many("model", ["c", "d"], [[3.0], [4.0]])
+    assert first.stats()["entries"] == second.stats()["entries"] == 3
+
+    first.close()
+    second.close()
@@ -0,0 +1,60 @@
+from lexical_index import LexicalIndex, LexicalIndexBuilder, tokenize
+from metadata_index import MetadataIndex
+
+
+def _index(records):
+    builder = LexicalIndexBuilder()
+    for record_id, text, extra in records:
+        builder.add(record_id, text, extra=extra)
+    return builder.build()
+
+
+RECORDS = [
+    ("sales_S0001", "Laptop sold in Europe for $21,691", "S0001"),
+    ("sales_S0002", "Phone sold in Asia for $450", "S0002"),
+    ("marketing_M0001", "Email campaign in Europe", "M0001"),
+]
+
+
+def test_tokenize_strips_thousands_separators():
+    assert tokenize("Revenue $21,691 in EU-West") == ["revenue", "21691", "in", "eu", "west"]
+
+
+def test_search_ranks_matches_and_indexes_extra_terms():
+    index = _index(RECORDS)
+    assert index.search("21,691")[0][0] == "sales_S0001"
+    assert index.search("s0002")[0][0] == "sales_S0002"
+    assert index.text("sales_S0002") == "Phone sold in Asia for $450"
+    assert index.search("nothing here") == []
+
+
+def test_search_respects_mask():
+    index = _index(RECORDS)
+    hits = index.search("europe", mask=[False, True, True])
+    assert [rid for rid, _ in hits] == ["marketing_M0001"]
+
+
+def test_save_load_round_trip(tmp_path):
+    index = _index(RECORDS)
+    path = str(tmp_path / "c.bm25.npz")
+    index.save(path)
+    loaded = LexicalIndex.load(path)
+    assert loaded.ids == index.ids
+    assert loaded.search("laptop") == index.search("laptop")
+
+
+def test_alignment_is_rechecked_for_a_new_metadata_index():
+    index = _index(RECORDS)
+    aligned = MetadataIndex.from_records((rid, {}) for rid, _, _ in RECORDS)
+    reordered = MetadataIndex.from_records((rid, {}) for rid, _, _ in reversed(RECORDS))
+    assert index.aligned_with(aligned)
+    assert not index.aligned_with(reordered)
+    assert index.aligned_with(aligned)
+
+
+def test_indexed_text_includes_extra_terms_after_reload(tmp_path):
+    path = str(tmp_path / "c.bm25.npz")
+    _index(RECORDS).save(path)
+    loaded = LexicalIndex.load(path)
+    assert "S0001" in loaded.indexed_text("sales_S0001")
+    assert loaded.text("sales_S0001") == "Laptop sold in Europe for $21,691"
@@ -0,0 +1,81 @@
+import llm_cache
+from llm_cache import LLMResponseCache, response_key
+
+
+def test_key_covers_sampling_settings():
+    base = response_key("model", "system", "prompt", 0.4, 2000)
+    assert base == response_key("model", "system", "prompt", 0.4, 2000)
+    assert base != response_key("model", "system", "prompt", 0.0, 2000)
+    assert base != response_key("model", "system", "prompt", 0.4, 100)
+    assert base != response_key("other", "system", "prompt", 0.4, 2000)
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60, max_entries=10)
+
+    cache.put("k", "model", "answer")
+    now[0] += 59
+    assert cache.get("k") == "answer"
+    now[0] += 2
+    assert cache.get("k") is None
+    assert cache.stats()["expired"] == 1 and cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0, max_entries=2)
+
+    for key in ("a", "b"):
+        now[0] += 1
+        cache.put(key, "model", key.upper())
+    now[0] += 1
+    assert cache.get("a") == "A"  # "b" is now the least recently used
+    now[0] += 1
+    cache.put("c", "model", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_bypass_skips_lookups_but_still_stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_CACHE", LLMResponseCache(str(tmp_path / "cache.sqlite3")))
+
+    llm_cache.store_response("k", "model", "old")
+    with llm_cache.bypass_llm_cache():
+        assert llm_cache.cached_response("k") is None
+        llm_cache.store_response("k", "model", "new")
+    assert llm_cache.cached_response("k") == "new"
+
+
+def test_autogen_agent_is_cached_only_without_history(tmp_path, monkeypatch):
+    import asyncio
+    import types
+
+    import agent
+
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_CACHE", LLMResponseCache(str(tmp_path / "cache.sqlite3")))
+
+    class FakeAgent:
+        def __init__(self):
+            self.history = []
+
+        async def save_state(self):
+            return {"llm_context": {"messages": list(self.history)}}
+
+        async def run(self, task):
+            self.history += [task, f"answer {len(self.history) // 2}"]
+            return types.SimpleNamespace(messages=[types.SimpleNamespace(content=self.history[-1])])
+
+    async def two_turns():
+        bot = FakeAgent()
+        return [await agent._run_autogen_agent(bot, task, "model", "system") for task in ("first", "second")]
+
+    assert asyncio.run(two_turns()) == ["answer 0", "answer 1"]
+    # The first turn is served from the cache; the second is keyed as single-turn, not on the old history.
+    assert asyncio.run(two_turns()) == ["answer 0", "answer 0"]
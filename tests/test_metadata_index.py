@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from metadata_index import MetadataIndex, MetadataIndexBuilder
+from vector_backends import _matches
+
+RECORDS = [
+    ("sales_S1", {"type": "sales", "region": "Europe", "quarter": "Q1 2024", "product": "Laptop", "revenue": 1000.0, "units_sold": 2}),
+    ("sales_S2", {"type": "sales", "region": "Asia", "quarter": "Q2 2024", "product": "Phone", "revenue": 300.0, "units_sold": 3}),
+    ("sales_S3", {"type": "sales", "region": "Europe", "quarter": "Q2 2024", "product": "Phone", "revenue": 450.5}),
+    ("marketing_M1", {"type": "marketing", "channel": "Email", "quarter": "Q1 2024", "budget": 100.0, "clicks": 5}),
+]
+
+WHERES = [
+    {"type": "sales"},
+    {"region": {"$ne": "Europe"}},
+    {"quarter": {"$in": ["Q1 2024", "Q3 2024"]}},
+    {"product": {"$nin": ["Phone"]}},
+    {"revenue": {"$gt": 400}},
+    {"revenue": {"$lte": 450.5}},
+    {"units_sold": {"$gte": 2, "$lt": 3}},
+    {"revenue": {"$in": [300, 1000]}},
+    {"$and": [{"type": "sales"}, {"region": "Europe"}]},
+    {"$or": [{"channel": "Email"}, {"revenue": {"$lt": 400}}]},
+    {"region": "Atlantis"},
+]
+
+
+@pytest.fixture
+def index():
+    return MetadataIndex.from_records(RECORDS)
+
+
+@pytest.mark.parametrize("where", WHERES)
+def test_mask_agrees_with_row_by_row_evaluation(index, where):
+    expected = [rid for rid, meta in RECORDS if _matches(meta, where)]
+    assert index.candidate_ids(where) == expected
+    assert index.count(where) == len(expected)
+
+
+def test_missing_values_never_match_comparisons(index):
+    assert "sales_S3" not in index.candidate_ids({"units_sold": {"$gte": 0}})
+    assert "marketing_M1" not in index.candidate_ids({"region": "Europe"})
+
+
+def test_unsupported_operator_raises(index):
+    with pytest.raises(ValueError):
+        index.mask({"region": {"$gt": "A"}})
+
+
+def test_breakdown_vocabulary_and_metadata(index):
+    assert index.breakdown("region") == {"Europe": 2, "Asia": 1}
+    assert index.breakdown("quarter", {"type": "sales"}) == {"Q1 2024": 1, "Q2 2024": 2}
+    assert sorted(index.vocabulary("product")) == ["Laptop", "Phone"]
+    assert index.get_metadata("sales_S1") == RECORDS[0][1]
+    assert index.get_metadata("missing") is None
+
+
+def test_builder_overwrites_repeated_ids():
+    builder = MetadataIndexBuilder()
+    builder.add("a", {"region": "Europe"})
+    builder.add("a", {"region": "Asia"})
+    index = builder.build()
+    assert index.ids == ["a"] and index.breakdown("region") == {"Asia": 1}
+
+
+def test_save_load_round_trip(index, tmp_path):
+    path = str(tmp_path / "c.metadata.npz")
+    index.save(path)
+    loaded = MetadataIndex.load(path)
+    for where in WHERES:
+        np.testing.assert_array_equal(loaded.mask(where), index.mask(where))
+    assert loaded.get_metadata("sales_S3") == index.get_metadata("sales_S3")
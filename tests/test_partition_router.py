@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+rag_retrieval = pytest.importorskip("rag_retrieval")
+from vector_backends import NumpyVectorBackend  # noqa: E402
+
+QUARTERS = ("Q1 2024", "Q2 2024", "Q3 2024")
+
+
+@pytest.fixture
+def router(monkeypatch, tmp_path):
+    partitions, opened = {}, []
+    for qi, quarter in enumerate(QUARTERS):
+        name = f"records__{quarter.lower().replace(' ', '_')}"
+        store = NumpyVectorBackend(name, str(tmp_path / name)).initialize()
+        vectors = np.array([[float(qi), 0.0], [float(qi), 1.0]], dtype=np.float32)
+        store.upsert([f"{quarter}-a", f"{quarter}-b"], documents=["a", "b"], metadatas=[{"quarter": quarter}] * 2, embeddings=vectors)
+        partitions[quarter] = store
+
+    def pooled(name):
+        store = next(s for s in partitions.values() if s.name == name)
+        opened.append(name)
+        return store
+
+    monkeypatch.setattr(rag_retrieval, "get_pooled_collection", pooled)
+    router = rag_retrieval.PartitionRouter("records", "quarter", {q: s.name for q, s in partitions.items()})
+    router.opened = opened
+    return router
+
+
+def test_route_prunes_by_quarter_predicates(router):
+    assert router.route(None) == list(QUARTERS)
+    assert router.route({"quarter": "Q2 2024"}) == ["Q2 2024"]
+    assert router.route({"quarter": {"$in": ["Q1 2024", "Q3 2024"]}}) == ["Q1 2024", "Q3 2024"]
+    assert router.route({"$and": [{"type": "sales"}, {"quarter": {"$eq": "Q3 2024"}}]}) == ["Q3 2024"]
+    assert router.route({"$or": [{"quarter": "Q1 2024"}, {"region": "Europe"}]}) == list(QUARTERS)
+    assert router.route({"quarter": {"$ne": "Q1 2024"}}) == list(QUARTERS)
+    assert router.route({"quarter": "Q4 2030"}) == []
+
+
+def test_query_visits_only_routed_partitions_and_merges_by_distance(router):
+    result = router.query(query_embeddings=[[0.9, 0.0]], n_results=3)
+    assert result["ids"] == [["Q2 2024-a", "Q1 2024-a", "Q2 2024-b"]]
+    assert result["distances"][0] == sorted(result["distances"][0])
+
+    router.opened.clear()
+    result = router.query(query_embeddings=[[1.0, 0.0]], n_results=3, where={"quarter": "Q3 2024"})
+    assert router.opened == ["records__q3_2024"]
+    assert result["ids"] == [["Q3 2024-a", "Q3 2024-b"]]
+
+
+def test_count_spans_all_partitions(router):
+    assert router.count() == 6
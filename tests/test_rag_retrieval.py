@@ -0,0 +1,114 @@
+import pytest
+
+rag_retrieval = pytest.importorskip("rag_retrieval")
+
+
+def test_unmatched_filters_are_reported_not_dropped():
+    where = {"$and": [{"type": {"$eq": "sales"}}, {"region": {"$eq": "Atlantis"}}]}
+    results = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]], "no_match_filters": where}
+
+    formatted = rag_retrieval.format_retrieval_results(results)
+
+    assert isinstance(formatted, str)
+    assert formatted.startswith("No records match the requested filters")
+    assert "Atlantis" in formatted
+
+
+def _lexical(records):
+    from lexical_index import LexicalIndexBuilder
+
+    builder = LexicalIndexBuilder()
+    for record_id, text, extra in records:
+        builder.add(record_id, text, extra=extra)
+    return builder.build()
+
+
+def test_quoted_record_id_matches_indexed_id(monkeypatch):
+    index = _lexical([
+        ("sales_S0001", "Laptop sold in Europe", "S0001"),
+        ("sales_S0002", "Laptop sold in Asia", "S0002"),
+    ])
+    monkeypatch.setattr(rag_retrieval, "get_lexical_index", lambda name: index)
+    monkeypatch.setattr(rag_retrieval, "get_metadata_index", lambda name: None)
+    collection = type("Collection", (), {"name": "records"})()
+
+    assert rag_retrieval._lexical_search(collection, '"S0001"', 5)["ids"] == [["sales_S0001"]]
+    assert rag_retrieval._lexical_search(collection, 'laptop "sold in asia"', 5)["ids"] == [["sales_S0002"]]
+
+
+def test_reciprocal_rank_fusion_prefers_ids_found_by_both():
+    vector = {"ids": [["a", "b", "c"]], "documents": [["A", "B", "C"]], "metadatas": [[{}, {}, {}]]}
+    lexical = {"ids": [["c", "b", "d"]], "documents": [["C", "B", "D"]], "metadatas": [[{}, {}, {}]]}
+
+    fused = rag_retrieval._reciprocal_rank_fusion([vector, lexical], 3)
+
+    assert fused["ids"] == [["c", "b", "a"]]
+    assert fused["documents"] == [["C", "B", "A"]]
+    assert fused["distances"][0][0] == 0.0
+
+
+@pytest.fixture
+def aggregate_store(monkeypatch):
+    from aggregates import build_aggregates
+    from metadata_index import MetadataIndex
+
+    index = MetadataIndex.from_records([
+        ("sales_S1", {"type": "sales", "region": "Europe", "quarter": "Q1 2024", "product": "Laptop", "revenue": 1000.0, "units_sold": 2}),
+        ("sales_S2", {"type": "sales", "region": "Asia", "quarter": "Q1 2024", "product": "Phone", "revenue": 300.0, "units_sold": 3}),
+        ("marketing_M1", {"type": "marketing", "channel": "Email", "quarter": "Q1 2024", "budget": 100.0, "clicks": 5, "impressions": 50}),
+    ])
+    aggregates = build_aggregates(index)
+    monkeypatch.setattr(rag_retrieval, "_get_collection", lambda name=None: type("Collection", (), {"name": "records"})())
+    monkeypatch.setattr(rag_retrieval, "get_aggregates", lambda name: aggregates)
+    monkeypatch.setattr(rag_retrieval, "get_metadata_index", lambda name: index)
+    monkeypatch.setattr(rag_retrieval, "AGGREGATES_ENABLED", True)
+
+
+def test_aggregates_skipped_for_unfiltered_lookup_questions(aggregate_store):
+    assert rag_retrieval.build_aggregate_context("Tell me about the laptop customer feedback") != ""  # planned product
+    assert rag_retrieval.build_aggregate_context("What happened with customer feedback?") == ""
+
+
+def test_aggregates_cover_only_types_in_scope(aggregate_store):
+    context = rag_retrieval.build_aggregate_context("What is the total revenue?")
+    assert "SALES [all records]" in context and "MARKETING" not in context
+
+    context = rag_retrieval.build_aggregate_context("Overall performance summary")
+    assert "SALES" in context and "MARKETING" in context
+
+    context = rag_retrieval.build_aggregate_context("Sales in Europe")
+    assert "SALES [region=Europe]" in context and "MARKETING" not in context
+
+
+def test_combined_async_matches_sync_and_split_is_opt_in(monkeypatch):
+    import asyncio
+
+    def fake_wrap(query, filter_type=None, **kwargs):
+        return f"{filter_type or 'all'} context for {query}"
+
+    monkeypatch.setattr(rag_retrieval, "_wrap_retrieval", fake_wrap)
+
+    sync = rag_retrieval.retrieve_combined_data("revenue")
+    assert asyncio.run(rag_retrieval.retrieve_combined_data_async("revenue")) == sync == "all context for revenue"
+
+    split = asyncio.run(rag_retrieval.retrieve_combined_data_split_async("revenue"))
+    assert split == "=== Sales context ===\nsales context for revenue\n\n=== Marketing context ===\nmarketing context for revenue"
+
+
+def test_wrappers_pack_context_to_the_model_budget(monkeypatch):
+    from context_packer import MODEL_PROMPT_BUDGETS, context_token_budget
+
+    budgets = []
+
+    def fake_pack(formatted, token_budget=None, model=None, **kwargs):
+        budgets.append(token_budget or context_token_budget(model))
+        return "packed", None
+
+    monkeypatch.setitem(MODEL_PROMPT_BUDGETS, "small-model", 2000)
+    monkeypatch.setattr(rag_retrieval, "retrieve_relevant_context", lambda query, **kwargs: None)
+    monkeypatch.setattr(rag_retrieval, "pack_context", fake_pack)
+
+    rag_retrieval.retrieve_sales_data("revenue")
+    rag_retrieval.retrieve_sales_data("revenue", model="small-model")
+    assert budgets == [context_token_budget(), context_token_budget("small-model")]
+    assert budgets[1] < budgets[0]
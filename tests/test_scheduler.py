@@ -0,0 +1,44 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+
+scheduler = pytest.importorskip("scheduler")
+
+
+def _run(name, build):
+    async def main():
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            return await scheduler._run_report(name, build, "test", asyncio.Semaphore(1), pool)
+
+    return asyncio.run(main())
+
+
+def test_error_text_from_report_wrapper_counts_as_failure():
+    result = _run("bad", lambda: "ERROR: Failed to generate report — boom")
+    assert result["status"] == "failed"
+    assert "boom" in result["error"]
+    assert result["file"] is None
+
+
+def test_exception_counts_as_failure():
+    def build():
+        raise ValueError("no data")
+
+    result = _run("raises", build)
+    assert result["status"] == "failed"
+    assert result["error"] == "no data"
+
+
+def test_summary_for_a_quarter_without_data_is_unfiltered(monkeypatch):
+    import report_generator
+
+    calls = []
+    monkeypatch.setattr(report_generator, "stored_values", lambda field, report_type="combined": ["Q1 2023", "Q4 2024"])
+    monkeypatch.setattr(report_generator, "_generate", lambda query, **kwargs: calls.append(kwargs["filters"]) or "report")
+
+    for quarter in ("Q4 2026", "Q4 2024"):
+        summary = dict(scheduler._report_jobs(quarter))["executive_summary"]
+        assert summary() == "report"
+
+    assert calls == [None, {"quarter": "Q4 2024"}]
@@ -0,0 +1,133 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from vector_backends import NumpyVectorBackend, VectorBackend, quantize_int8
+
+
+def _store(tmp_path, dtype="float32", **kwargs):
+    return NumpyVectorBackend("test", str(tmp_path / "store"), dtype=dtype, **kwargs).initialize()
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def _generations(store):
+    return sorted(e for e in os.listdir(store.directory) if e.startswith("gen-"))
+
+
+def test_vector_backend_is_abstract():
+    with pytest.raises(TypeError):
+        VectorBackend()
+
+
+def test_upsert_overwrite_and_delete(tmp_path):
+    store = _store(tmp_path)
+    vectors = _vectors(4)
+    ids = ["a", "b", "c", "d"]
+    store.upsert(ids, documents=["A", "B", "C", "D"], metadatas=[{"type": "sales", "id": i} for i in ids], embeddings=vectors)
+
+    store.upsert(["b", "e"], documents=["B2", "E"], metadatas=[{"type": "hr"}, {"type": "hr"}], embeddings=_vectors(2, seed=1))
+    assert store.count() == 5
+    got = store.get(ids=["b", "e"], include=["documents", "metadatas", "embeddings"])
+    assert got["documents"] == ["B2", "E"]
+    assert got["metadatas"][0] == {"type": "hr"}
+    np.testing.assert_allclose(got["embeddings"][0], _vectors(2, seed=1)[0])
+
+    store.delete(ids=["a"])
+    store.delete(where={"type": "hr"})
+    assert sorted(store.get()["ids"]) == ["c", "d"]
+    assert store.get(where={"type": "sales"}, include=[])["ids"] == ["c", "d"]
+
+
+def test_batch_writes_commit_one_generation(tmp_path):
+    store = _store(tmp_path)
+    before = _generations(store)
+    vectors = _vectors(30)
+
+    with store.batch_writes():
+        for start in range(0, 30, 10):
+            ids = [f"r{i}" for i in range(start, start + 10)]
+            store.upsert(ids, documents=ids, metadatas=[{"n": i} for i in range(10)], embeddings=vectors[start : start + 10])
+        assert store.count() == 0  # staged rows are not visible yet
+        store.upsert(["r0"], documents=["again"], embeddings=vectors[:1])
+        store.delete(ids=["r1"])
+        store.delete(where={"n": 9})
+
+    assert store.count() == 26
+    assert store.get(ids=["r0"])["documents"] == ["again"]
+    assert not store.get(ids=["r1", "r9", "r19", "r29"])["ids"]
+    assert len(set(_generations(store)) - set(before)) == 1
+    assert not [e for e in os.listdir(store.directory) if e.startswith("staging-")]
+
+
+def test_batch_writes_discard_on_error(tmp_path):
+    store = _store(tmp_path)
+    store.upsert(["a"], documents=["A"], embeddings=_vectors(1))
+    with pytest.raises(RuntimeError):
+        with store.batch_writes():
+            store.upsert(["b"], documents=["B"], embeddings=_vectors(1, seed=1))
+            raise RuntimeError("boom")
+    assert store.get()["ids"] == ["a"]
+
+
+def test_quantize_int8_round_trip():
+    vectors = _vectors(100, dim=64)
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8 and scales.dtype == np.float32
+    assert np.abs(codes).max() <= 127
+    error = np.abs(codes.astype(np.float32) * scales[:, None] - vectors)
+    assert (error <= scales[:, None] / 2 + 1e-6).all()
+
+    zero_codes, zero_scales = quantize_int8(np.zeros((2, 4), dtype=np.float32))
+    assert not zero_codes.any() and (zero_scales == 1.0).all()
+
+
+@pytest.mark.parametrize("rerank_factor", [0, 4])
+def test_int8_query_matches_float32(tmp_path, rerank_factor):
+    vectors = _vectors(500, dim=32)
+    ids = [f"r{i}" for i in range(500)]
+    exact = _store(tmp_path / "f32")
+    quantized = _store(tmp_path / "i8", dtype="int8", rerank_factor=rerank_factor)
+    for store in (exact, quantized):
+        store.upsert(ids, documents=ids, embeddings=vectors)
+
+    queries = vectors[:20] + 0.01 * _vectors(20, dim=32, seed=3)
+    expected = exact.query(query_embeddings=queries, n_results=1)["ids"]
+    got = quantized.query(query_embeddings=queries, n_results=1)["ids"]
+    assert got == expected
+    assert ("rerank.npy" in quantized.footprint()) == bool(rerank_factor)
+
+
+def test_write_streams_in_blocks(tmp_path):
+    store = _store(tmp_path)
+    store.SCAN_BLOCK_ROWS = 7
+    vectors = _vectors(50)
+    ids = [f"r{i}" for i in range(50)]
+    store.upsert(ids, documents=ids, metadatas=[{"i": i} for i in range(50)], embeddings=vectors)
+    store.delete(ids=ids[::3])
+
+    kept = [i for i in range(50) if i % 3]
+    got = store.get(include=["documents", "metadatas", "embeddings"])
+    assert got["ids"] == [ids[i] for i in kept]
+    assert got["metadatas"] == [{"i": i} for i in kept]
+    np.testing.assert_array_equal(got["embeddings"], vectors[kept])
+    with open(os.path.join(store.directory, "manifest.json")) as f:
+        assert json.load(f)["count"] == len(kept)
+
+
+def test_dtype_change_reencodes_on_next_write(tmp_path):
+    store = _store(tmp_path)
+    vectors = _vectors(10)
+    store.upsert([str(i) for i in range(10)], documents=["x"] * 10, embeddings=vectors)
+
+    reopened = NumpyVectorBackend("test", store.directory, dtype="int8").initialize()
+    reopened.upsert(["10"], documents=["y"], embeddings=_vectors(1, seed=1))
+    assert reopened.count() == 11
+    with open(os.path.join(store.directory, "manifest.json")) as f:
+        assert json.load(f)["dtype"] == "int8"
+    embeddings = reopened.get(ids=["3"], include=["embeddings"])["embeddings"]
+    np.testing.assert_allclose(embeddings[0], vectors[3], atol=1e-2)
@@ -0,0 +1,96 @@
+"""
+Collections created before the lazy embedding function (chromadb's own
+SentenceTransformerEmbeddingFunction) must keep opening.
+"""
+
+import importlib.machinery
+import sys
+import types
+
+import numpy as np
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+
+
+class _FakeSentenceTransformer:
+    def __init__(self, model_name_or_path=None, device=None, **kwargs):
+        pass
+
+    def encode(self, sentences, **kwargs):
+        return np.ones((len(sentences), 4), dtype=np.float32)
+
+
+@pytest.fixture
+def fake_sentence_transformers(monkeypatch):
+    module = types.ModuleType("sentence_transformers")
+    module.__spec__ = importlib.machinery.ModuleSpec("sentence_transformers", None)
+    module.SentenceTransformer = _FakeSentenceTransformer
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    return module
+
+
+@pytest.fixture
+def vector_db(monkeypatch, fake_sentence_transformers):
+    import vector_db
+
+    monkeypatch.setattr(vector_db, "EMBEDDING_FUNCTION", vector_db.LazySentenceTransformerEmbedding())
+    return vector_db
+
+
+def test_opens_collection_created_by_chroma_sentence_transformer(tmp_path, vector_db):
+    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    baseline = client.create_collection("sales_marketing_data", embedding_function=SentenceTransformerEmbeddingFunction())
+    baseline.add(ids=["S0001"], documents=["Laptop revenue in Q1 2024"])
+
+    collection = vector_db._get_or_create_collection(client, "sales_marketing_data")
+
+    assert collection.count() == 1
+    assert collection.query(query_texts=["laptop"], n_results=1)["ids"] == [["S0001"]]
+
+
+def test_new_collection_opens_with_chroma_sentence_transformer(tmp_path, vector_db):
+    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    vector_db._get_or_create_collection(client, "fresh")
+
+    reopened = client.get_collection("fresh", embedding_function=SentenceTransformerEmbeddingFunction())
+    assert reopened.configuration_json["embedding_function"]["name"] == "sentence_transformer"
+
+
+def test_embedding_function_conflict_is_raised(tmp_path, vector_db, monkeypatch):
+    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+    class OtherEmbedding(vector_db.LazySentenceTransformerEmbedding):
+        @staticmethod
+        def name():
+            return "openai"
+
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    client.create_collection("sales_marketing_data", embedding_function=SentenceTransformerEmbeddingFunction())
+    monkeypatch.setattr(vector_db, "EMBEDDING_FUNCTION", OtherEmbedding())
+
+    with pytest.raises(ValueError, match="conflict"):
+        vector_db._get_or_create_collection(client, "sales_marketing_data")
+
+
+def test_initialize_chromadb_reuses_the_pooled_client(tmp_path, vector_db, monkeypatch):
+    monkeypatch.setattr(vector_db, "CHROMA_DB_PATH", str(tmp_path))
+    try:
+        client, collection = vector_db.initialize_chromadb()
+        again, same = vector_db.initialize_chromadb()
+
+        assert again is client
+        assert same is collection
+        assert vector_db.initialize_pooled_chromadb()[0] is client
+    finally:
+        vector_db.close_pooled_clients(str(tmp_path))
+
+
+def test_embedding_rebuilt_from_config_uses_the_configured_batch_size(vector_db, monkeypatch):
+    monkeypatch.setattr(vector_db, "EMBEDDING_BATCH_SIZE", 7)
+    rebuilt = vector_db.LazySentenceTransformerEmbedding.build_from_config(vector_db.EMBEDDING_FUNCTION.get_config())
+    assert rebuilt.batch_size == 7
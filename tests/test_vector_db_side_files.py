@@ -0,0 +1,84 @@
+"""The version counter and partition catalog are cached until their files change."""
+
+import json
+import os
+
+import pytest
+
+pytest.importorskip("chromadb")
+import vector_db  # noqa: E402
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(vector_db, "CHROMA_DB_PATH", str(tmp_path))
+    monkeypatch.setattr(vector_db, "_SIDE_FILES", {})
+    return tmp_path
+
+
+def _count_calls(monkeypatch, name):
+    calls = []
+    original = getattr(vector_db, name)
+
+    def counted(path):
+        calls.append(path)
+        return original(path)
+
+    monkeypatch.setattr(vector_db, name, counted)
+    return calls
+
+
+def _rewrite(path, text):
+    stat = os.stat(path)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_version_is_read_once_until_the_file_changes(store, monkeypatch):
+    calls = _count_calls(monkeypatch, "_parse_version")
+    assert vector_db.get_collection_version("c") == 0
+
+    assert vector_db.bump_collection_version("c") == 1
+    assert vector_db.get_collection_version("c") == 1
+    assert vector_db.get_collection_version("c") == 1
+    assert len(calls) == 0  # bump stored what it wrote
+
+    _rewrite(vector_db._version_path("c"), "7")  # another process
+    assert vector_db.get_collection_version("c") == 7
+    assert vector_db.get_collection_version("c") == 7
+    assert len(calls) == 1
+
+
+def test_catalog_is_cached_and_copies_are_independent(store, monkeypatch):
+    calls = _count_calls(monkeypatch, "_parse_json_file")
+    assert vector_db.get_partition_catalog("c") is None
+
+    vector_db._save_partition_catalog("c", {"collection": "c", "partitions": {"Q1 2024": {"state": "active"}}})
+    catalog = vector_db.get_partition_catalog("c")
+    catalog["partitions"]["Q1 2024"]["state"] = "archived"
+    assert vector_db.get_partition_catalog("c")["partitions"]["Q1 2024"]["state"] == "active"
+    assert len(calls) == 0
+
+    path = vector_db._partition_catalog_path("c")
+    _rewrite(path, json.dumps({"collection": "c", "partitions": {}}))
+    assert vector_db.get_partition_catalog("c")["partitions"] == {}
+    assert len(calls) == 1
+
+    os.remove(path)
+    assert vector_db.get_partition_catalog("c") is None
+
+
+def test_dropping_a_partition_removes_its_version_file(store, monkeypatch):
+    monkeypatch.setattr(vector_db, "load_manifest", lambda: {"collections": {}})
+    client = vector_db.get_pooled_client()
+    try:
+        client.get_or_create_collection("c__q1_2024")
+        assert vector_db.bump_collection_version("c__q1_2024") == 1
+
+        vector_db._drop_partition_collection("c__q1_2024")
+
+        assert not os.path.exists(vector_db._version_path("c__q1_2024"))
+        assert vector_db.get_collection_version("c__q1_2024") == 0
+    finally:
+        vector_db.close_pooled_clients(str(store))
@@ -0,0 +1,808 @@
+"""
+vector_backends.py - pluggable vector stores behind vector_db.
+
+vector_db talks to its store through the Chroma collection API (upsert /
+query / get / count / delete), so any object with those methods is a backend.
+Chroma's own Collection is the default; NumpyVectorBackend is an in-process
+alternative for datasets that fit in memory: vectors live in a float32,
+float16 or int8-quantized .npy file opened with mmap_mode="r" and a query is
+a blocked matrix product over the candidate rows instead of a round-trip
+through Chroma's SQLite/HNSW layers. Its files are all memory-mapped, so
+worker processes share them through the page cache and startup deserializes
+nothing.
+
+NumpyStoreClient mimics the PersistentClient calls vector_db makes
+(get_collection / create_collection / delete_collection / heartbeat), so the
+pool and initialization code stay backend-agnostic.
+"""
+
+from __future__ import annotations
+
+import abc
+import contextlib
+import itertools
+import json
+import logging
+import tempfile
+import os
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metadata_index import CATEGORICAL_FIELDS, NUMERIC_FIELDS, MetadataIndex, MetadataIndexBuilder
+
+logger = logging.getLogger(__name__)
+
+_INDEXED_FIELDS = set(CATEGORICAL_FIELDS) | set(NUMERIC_FIELDS)
+_DEFAULT_QUERY_INCLUDE = ("metadatas", "documents", "distances")
+_DEFAULT_GET_INCLUDE = ("metadatas", "documents")
+
+
+class VectorBackend(abc.ABC):
+    """Interface of a vector store (Chroma's Collection satisfies it as-is).
+
+    Shapes follow Chroma: query() returns {"ids": [[...]], "documents": [[...]], ...} with one
+    inner list per query vector, get() returns flat lists. Distances are squared L2, Chroma's
+    default space, so relevance scores mean the same thing whichever backend answered.
+    """
+
+    name: str = ""
+    metadata: Optional[Dict[str, Any]] = None
+
+    def initialize(self) -> "VectorBackend":
+        return self
+
+    @abc.abstractmethod
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None) -> None: ...
+
+    @abc.abstractmethod
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 10, where=None, include=None) -> Dict[str, Any]: ...
+
+    @abc.abstractmethod
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None) -> Dict[str, Any]: ...
+
+    @abc.abstractmethod
+    def count(self) -> int: ...
+
+    @abc.abstractmethod
+    def delete(self, ids=None, where=None) -> None: ...
+
+
+# -------------------------
+# Where-clause evaluation
+# -------------------------
+def _where_fields(where: Dict[str, Any]) -> set:
+    fields = set()
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            for sub in cond:
+                fields |= _where_fields(sub)
+        else:
+            fields.add(key)
+    return fields
+
+
+def _compare(value: Any, op: str, operand: Any) -> bool:
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported operator {op}")
+
+
+def _matches(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, sub) for sub in cond):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, sub) for sub in cond):
+                return False
+        else:
+            ops = cond if isinstance(cond, dict) else {"$eq": cond}
+            if not all(_compare(metadata.get(key), op, operand) for op, operand in ops.items()):
+                return False
+    return True
+
+
+# -------------------------
+# In-process NumPy backend
+# -------------------------
+STORE_DTYPES = ("float32", "float16", "int8")
+DEFAULT_RERANK_FACTOR = 4
+
+
+def _open_blob(path: str) -> Any:
+    """Read-only byte view of a file (np.memmap cannot map empty files)."""
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+class _BlobWriter:
+    """Appends byte strings to `<stem>.bin` and records their offsets for `<stem>.offsets.npy`."""
+
+    def __init__(self, directory: str, stem: str, count: int):
+        self._directory = directory
+        self._stem = stem
+        self._file = open(os.path.join(directory, f"{stem}.bin"), "wb")
+        self._offsets = np.zeros(count + 1, dtype=np.int64)
+        self._row = 0
+
+    def write(self, value: bytes) -> None:
+        self._file.write(value)
+        self._offsets[self._row + 1] = self._offsets[self._row] + len(value)
+        self._row += 1
+
+    def close(self) -> None:
+        self._file.close()
+        np.save(os.path.join(self._directory, f"{self._stem}.offsets.npy"), self._offsets)
+
+
+def _blob_slice(blob: Any, offsets: np.ndarray, row: int) -> bytes:
+    return bytes(blob[offsets[row] : offsets[row + 1]])
+
+
+def _document_bytes(document: Optional[str]) -> bytes:
+    return ("" if document is None else document).encode("utf-8")
+
+
+def _metadata_bytes(metadata: Optional[Dict[str, Any]]) -> bytes:
+    return json.dumps(dict(metadata or {}), ensure_ascii=False).encode("utf-8")
+
+
+class _WriteBatch:
+    """Writes staged on disk until the outermost NumpyVectorBackend.batch_writes() block exits.
+
+    Upserted rows are appended to spool files (float32 vectors, encoded documents and
+    metadata); only the id -> latest spooled row map and the deleted ids stay in memory.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = tempfile.mkdtemp(prefix="staging-", dir=directory)
+        self.dim: Optional[int] = None
+        self.rows = 0
+        self.latest: Dict[str, int] = {}
+        self.deleted: set = set()
+        self._vectors = open(os.path.join(self.directory, "vectors.f32"), "wb")
+        self._documents = open(os.path.join(self.directory, "documents.bin"), "wb")
+        self._metadatas = open(os.path.join(self.directory, "metadatas.bin"), "wb")
+        self._document_offsets = [0]
+        self._metadata_offsets = [0]
+
+    def add(self, ids: List[str], documents: List[Optional[str]], metadatas: List[Dict[str, Any]], vectors: np.ndarray) -> None:
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self.dim}")
+        self._vectors.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        for record_id, document, metadata in zip(ids, documents, metadatas):
+            document, metadata = _document_bytes(document), _metadata_bytes(metadata)
+            self._documents.write(document)
+            self._metadatas.write(metadata)
+            self._document_offsets.append(self._document_offsets[-1] + len(document))
+            self._metadata_offsets.append(self._metadata_offsets[-1] + len(metadata))
+            self.latest[record_id] = self.rows
+            self.deleted.discard(record_id)
+            self.rows += 1
+
+    def remove(self, ids: Iterable[str]) -> None:
+        for record_id in ids:
+            self.latest.pop(record_id, None)
+            self.deleted.add(record_id)
+
+    def flush(self) -> None:
+        for f in (self._vectors, self._documents, self._metadatas):
+            f.flush()
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        self._metadatas.flush()
+        start, stop = self._metadata_offsets[row], self._metadata_offsets[row + 1]
+        with open(os.path.join(self.directory, "metadatas.bin"), "rb") as f:
+            f.seek(start)
+            return json.loads(f.read(stop - start).decode("utf-8"))
+
+    def chunks(self, block_rows: int) -> Iterator[Tuple[List[str], np.ndarray, List[bytes], List[bytes]]]:
+        """(ids, float32 vectors, document bytes, metadata bytes) for the live spooled rows, in blocks."""
+        self.flush()
+        if not self.latest:
+            return
+        vectors = np.memmap(os.path.join(self.directory, "vectors.f32"), dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        documents = _open_blob(os.path.join(self.directory, "documents.bin"))
+        metadatas = _open_blob(os.path.join(self.directory, "metadatas.bin"))
+        live = list(self.latest.items())
+        for start in range(0, len(live), block_rows):
+            block = live[start : start + block_rows]
+            rows = np.asarray([row for _, row in block], dtype=np.int64)
+            yield (
+                [record_id for record_id, _ in block],
+                np.asarray(vectors[rows], dtype=np.float32),
+                [_blob_slice(documents, self._document_offsets, r) for r in rows],
+                [_blob_slice(metadatas, self._metadata_offsets, r) for r in rows],
+            )
+
+    def close(self) -> None:
+        for f in (self._vectors, self._documents, self._metadatas):
+            f.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 codes and float32 scales (v ~= scale * code)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or not len(vectors):
+        return np.zeros(vectors.shape if vectors.ndim == 2 else (0, 0), dtype=np.int8), np.zeros(0, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class NumpyVectorBackend(VectorBackend):
+    """Flat (brute-force) vector index over memory-mapped files; nothing is deserialized at startup.
+
+    Each write produces a new generation directory under `directory`:
+
+        vectors.npy                contiguous float32 / float16 / int8 matrix (row = record)
+        scales.npy                 int8 only: float32 per-row scale, v ~= scale * code
+        rerank.npy                 int8 only: float16 copy used to re-rank the shortlist
+        sq_norms.npy               float32 |v|^2 per row, so queries never scan all pages
+        ids.npy                    fixed-width unicode ids
+        documents.bin / .offsets   UTF-8 documents, sliced out per returned row
+        metadatas.bin / .offsets   JSON metadata per row, decoded per returned row
+        metadata.npz               columnar where-clause index (metadata_index.py)
+
+    manifest.json names the live generation and is replaced last, so readers (in any
+    process) always open a complete generation; every file is opened with mmap, so
+    processes share one copy in the page cache.
+
+    A new generation is written by streaming: surviving rows are copied from the live
+    one block by block and the staged rows appended, so peak memory is one block plus
+    the id list rather than the corpus. Wrap bulk loads in batch_writes() so a whole
+    ingest is staged on disk and commits one generation instead of one per upsert.
+
+    int8 stores symmetric per-row scalar quantization (4x smaller than float32). A query
+    scores every candidate on the codes, keeps the best rerank_factor * n_results and
+    re-scores those against rerank.npy, so only the shortlist's float pages are touched.
+    With rerank_factor=0 no float copy is written and int8 distances are returned as-is.
+    """
+
+    FORMAT = 2
+    SCAN_BLOCK_ROWS = 16384
+    MANIFEST_FILE = "manifest.json"
+    LEGACY_RECORDS_FILE = "records.json"
+
+    def __init__(
+        self,
+        name: str,
+        directory: str,
+        embedding_function: Optional[Callable[[List[str]], Any]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        dtype: str = "float32",
+        rerank_factor: int = DEFAULT_RERANK_FACTOR,
+    ):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unsupported store dtype '{dtype}'. Supported: {STORE_DTYPES}")
+        self.name = name
+        self.directory = directory
+        self.metadata = metadata or {}
+        self.dtype = dtype
+        self.rerank_factor = max(0, int(rerank_factor))
+        self._embedding_function = embedding_function
+        self._lock = threading.RLock()
+        self._stamp: Optional[int] = None
+        self._generation = 0
+        self._count = 0
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._scales: Optional[np.ndarray] = None
+        self._rerank: Optional[np.ndarray] = None
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._ids = np.zeros(0, dtype=str)
+        self._documents = self._document_offsets = None
+        self._metadatas = self._metadata_offsets = None
+        self._positions: Optional[Dict[str, int]] = None
+        self._index: Optional[MetadataIndex] = None
+        self._layout: Optional[Tuple[str, bool]] = None
+        self._batch: Optional[_WriteBatch] = None
+
+    def __repr__(self) -> str:
+        return f"NumpyVectorBackend(name={self.name!r}, directory={self.directory!r}, count={self._count}, dtype={self.dtype!r})"
+
+    # -------------------------
+    # Storage
+    # -------------------------
+    def _path(self, filename: str, generation: Optional[int] = None) -> str:
+        if generation is None:
+            return os.path.join(self.directory, filename)
+        return os.path.join(self.directory, f"gen-{generation:06d}", filename)
+
+    def _manifest_stamp(self) -> Optional[int]:
+        try:
+            return os.stat(self._path(self.MANIFEST_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    def initialize(self) -> "NumpyVectorBackend":
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if self._manifest_stamp() is None:
+                if os.path.exists(self._path(self.LEGACY_RECORDS_FILE)):
+                    self._migrate_legacy()
+                else:
+                    self._write(0, 0, ())
+            self._load()
+        return self
+
+    def _migrate_legacy(self) -> None:
+        """Convert a single records.json + vectors.npy store into a generation."""
+        with open(self._path(self.LEGACY_RECORDS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        vectors = np.load(self._path("vectors.npy"))
+        self.metadata = records.get("collection_metadata") or self.metadata
+        ids = records["ids"]
+        chunks = [(ids, self._encode(vectors), [_document_bytes(d) for d in records["documents"]], [_metadata_bytes(m) for m in records["metadatas"]])]
+        self._write(len(ids), vectors.shape[1] if vectors.ndim == 2 else 0, chunks if ids else ())
+        for filename in (self.LEGACY_RECORDS_FILE, "vectors.npy"):
+            os.remove(self._path(filename))
+        logger.info("Migrated %s to memory-mapped store format %s", self.directory, self.FORMAT)
+
+    def _load(self) -> None:
+        stamp = self._manifest_stamp()
+        with open(self._path(self.MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        generation = manifest["generation"]
+        path = lambda filename: self._path(filename, generation)  # noqa: E731
+
+        vectors = np.load(path("vectors.npy"), mmap_mode="r")
+        if vectors.shape[0] != manifest["count"]:
+            raise RuntimeError(f"{self.directory}: {vectors.shape[0]} vectors for {manifest['count']} records")
+
+        self.metadata = manifest.get("collection_metadata") or self.metadata
+        self._generation = generation
+        self._count = manifest["count"]
+        self._vectors = vectors
+        # The generation's own manifest decides the layout, so a store written before a
+        # VECTOR_STORE_DTYPE change stays readable until the next write converts it.
+        quantized = manifest.get("dtype") == "int8"
+        self._scales = np.load(path("scales.npy"), mmap_mode="r") if quantized else None
+        self._rerank = np.load(path("rerank.npy"), mmap_mode="r") if quantized and manifest.get("rerank") else None
+        self._layout = (manifest.get("dtype"), self._rerank is not None)
+        self._sq_norms = np.load(path("sq_norms.npy"), mmap_mode="r")
+        self._ids = np.load(path("ids.npy"), mmap_mode="r")
+        self._documents = _open_blob(path("documents.bin"))
+        self._document_offsets = np.load(path("documents.offsets.npy"), mmap_mode="r")
+        self._metadatas = _open_blob(path("metadatas.bin"))
+        self._metadata_offsets = np.load(path("metadatas.offsets.npy"), mmap_mode="r")
+        self._positions = None
+        self._index = None
+        self._stamp = stamp
+
+    def _refresh(self) -> None:
+        """Reload if another process rewrote the store since we last read it."""
+        stamp = self._manifest_stamp()
+        if stamp is not None and stamp != self._stamp:
+            with self._lock:
+                if self._manifest_stamp() != self._stamp:
+                    self._load()
+
+    def _target_layout(self) -> Tuple[str, bool]:
+        """(dtype, has rerank copy) that the next generation is written with."""
+        return self.dtype, self.dtype == "int8" and self.rerank_factor > 0
+
+    def _encode(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        """Stored arrays (vectors, sq_norms, and scales / rerank for int8) for float32 rows."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dtype, rerank = self._target_layout()
+        if dtype == "int8":
+            stored, scales = quantize_int8(vectors)
+            encoded = {"vectors": stored, "scales": scales}
+            wide = stored.astype(np.float32) * scales[:, None]
+            if rerank:
+                encoded["rerank"] = vectors.astype(np.float16)
+                wide = encoded["rerank"].astype(np.float32)
+        else:
+            encoded = {"vectors": vectors.astype(dtype)}
+            wide = encoded["vectors"].astype(np.float32)
+        encoded["sq_norms"] = np.einsum("ij,ij->i", wide, wide).astype(np.float32)
+        return encoded
+
+    def _encoded_rows(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        """Stored arrays for live rows: copied verbatim unless the target layout changed."""
+        if self._layout != self._target_layout():
+            return self._encode(self._dense(rows))
+        encoded = {"vectors": np.asarray(self._vectors[rows]), "sq_norms": np.asarray(self._sq_norms[rows])}
+        if self._scales is not None:
+            encoded["scales"] = np.asarray(self._scales[rows])
+        if self._rerank is not None:
+            encoded["rerank"] = np.asarray(self._rerank[rows])
+        return encoded
+
+    def _live_chunks(self, rows: np.ndarray) -> Iterator[Tuple[List[str], Dict[str, np.ndarray], List[bytes], List[bytes]]]:
+        for start in range(0, len(rows), self.SCAN_BLOCK_ROWS):
+            block = rows[start : start + self.SCAN_BLOCK_ROWS]
+            yield (
+                self._ids[block].tolist(),
+                self._encoded_rows(block),
+                [_blob_slice(self._documents, self._document_offsets, r) for r in block],
+                [_blob_slice(self._metadatas, self._metadata_offsets, r) for r in block],
+            )
+
+    def _write(self, count: int, dim: int, chunks: Iterable[Tuple[List[str], Dict[str, np.ndarray], List[bytes], List[bytes]]]) -> None:
+        """Stream `count` rows from `chunks` (ids, encoded arrays, document / metadata bytes) into a new generation."""
+        generation = self._generation + 1
+        while os.path.exists(self._path("", generation)):
+            generation += 1
+        directory = self._path("", generation)
+        os.makedirs(directory)
+        dtype, rerank = self._target_layout()
+
+        def column(filename: str, column_dtype: Any, shape: Tuple[int, ...]) -> np.ndarray:
+            return np.lib.format.open_memmap(os.path.join(directory, filename), mode="w+", dtype=column_dtype, shape=shape)
+
+        try:
+            arrays = {"vectors": column("vectors.npy", dtype, (count, dim)), "sq_norms": column("sq_norms.npy", np.float32, (count,))}
+            if dtype == "int8":
+                arrays["scales"] = column("scales.npy", np.float32, (count,))
+                if rerank:
+                    arrays["rerank"] = column("rerank.npy", np.float16, (count, dim))
+            ids: List[str] = []
+            documents = _BlobWriter(directory, "documents", count)
+            metadatas = _BlobWriter(directory, "metadatas", count)
+            index = MetadataIndexBuilder()
+            try:
+                for chunk_ids, encoded, chunk_documents, chunk_metadatas in chunks:
+                    start, stop = len(ids), len(ids) + len(chunk_ids)
+                    for key, target in arrays.items():
+                        target[start:stop] = encoded[key]
+                    for record_id, document, metadata in zip(chunk_ids, chunk_documents, chunk_metadatas):
+                        documents.write(document)
+                        metadatas.write(metadata)
+                        index.add(record_id, json.loads(metadata))
+                    ids.extend(chunk_ids)
+            finally:
+                documents.close()
+                metadatas.close()
+            if len(ids) != count:
+                raise RuntimeError(f"{self.directory}: wrote {len(ids)} rows for {count} records")
+            for target in arrays.values():
+                target.flush()
+            del arrays
+            np.save(os.path.join(directory, "ids.npy"), np.asarray(ids, dtype=str))
+            index.build().save(os.path.join(directory, "metadata.npz"))
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        manifest = {
+            "format": self.FORMAT,
+            "generation": generation,
+            "count": count,
+            "dim": dim,
+            "dtype": dtype,
+            "rerank": rerank,
+            "collection_metadata": self.metadata,
+        }
+        tmp_path = self._path(self.MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path(self.MANIFEST_FILE))
+        self._prune(keep=(generation, self._generation))
+
+    def _prune(self, keep: Sequence[int]) -> None:
+        """Drop old generations (the previous one stays for readers still opening it)."""
+        wanted = {f"gen-{g:06d}" for g in keep}
+        for entry in os.listdir(self.directory):
+            if entry.startswith("gen-") and entry not in wanted:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        if self._embedding_function is None:
+            raise ValueError(f"Collection '{self.name}' has no embedding function; pass embeddings explicitly")
+        return np.asarray(self._embedding_function(list(texts)), dtype=np.float32)
+
+    # -------------------------
+    # Row access
+    # -------------------------
+    @property
+    def ids(self) -> List[str]:
+        return self._ids.tolist()
+
+    def _id(self, row: int) -> str:
+        return str(self._ids[row])
+
+    def _document(self, row: int) -> str:
+        start, stop = self._document_offsets[row], self._document_offsets[row + 1]
+        return bytes(self._documents[start:stop]).decode("utf-8")
+
+    def _metadata(self, row: int) -> Dict[str, Any]:
+        start, stop = self._metadata_offsets[row], self._metadata_offsets[row + 1]
+        return json.loads(bytes(self._metadatas[start:stop]).decode("utf-8"))
+
+    def _row_positions(self) -> Dict[str, int]:
+        if self._positions is None:
+            self._positions = {record_id: i for i, record_id in enumerate(self.ids)}
+        return self._positions
+
+    def _dense(self, rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """float32 vectors for rows (all rows if None), from the most precise copy stored."""
+        source = self._rerank if self._rerank is not None else self._vectors
+        picked = source if rows is None else source[np.asarray(rows, dtype=np.int64)]
+        dense = np.asarray(picked, dtype=np.float32)
+        if self._rerank is None and self._scales is not None:
+            scales = self._scales if rows is None else self._scales[np.asarray(rows, dtype=np.int64)]
+            dense = dense * np.asarray(scales)[:, None]
+        return dense
+
+    def footprint(self) -> Dict[str, int]:
+        """Bytes on disk per file of the live generation."""
+        directory = self._path("", self._generation)
+        return {entry: os.path.getsize(os.path.join(directory, entry)) for entry in sorted(os.listdir(directory))}
+
+    def _where_index(self) -> MetadataIndex:
+        if self._index is None:
+            self._index = MetadataIndex.load(self._path("metadata.npz", self._generation))
+        return self._index
+
+    # -------------------------
+    # Writes
+    # -------------------------
+    @contextlib.contextmanager
+    def batch_writes(self) -> Iterator["NumpyVectorBackend"]:
+        """Stage the upserts / deletes made inside the block and commit them as one generation.
+
+        Staged rows are not visible to reads until the outermost block exits; if it raises,
+        nothing is committed. Other threads' writes wait for the block.
+        """
+        with self._lock:
+            if self._batch is not None:
+                yield self
+                return
+            self._batch = _WriteBatch(self.directory)
+            try:
+                yield self
+                self._commit(self._batch)
+            finally:
+                batch, self._batch = self._batch, None
+                batch.close()
+
+    def _commit(self, batch: _WriteBatch) -> None:
+        self._refresh()
+        positions = self._row_positions()
+        replaced = [positions[i] for i in itertools.chain(batch.deleted, batch.latest) if i in positions]
+        if not replaced and not batch.latest:
+            return
+        dim = self._vectors.shape[1] if self._count else (batch.dim or 0)
+        if batch.latest and batch.dim != dim:
+            raise ValueError(f"Embedding dimension {batch.dim} does not match collection dimension {dim}")
+        keep = np.setdiff1d(np.arange(self._count, dtype=np.int64), np.asarray(replaced, dtype=np.int64), assume_unique=True)
+        staged = ((ids, self._encode(vectors), documents, metadatas) for ids, vectors, documents, metadatas in batch.chunks(self.SCAN_BLOCK_ROWS))
+        self._write(len(keep) + len(batch.latest), dim, itertools.chain(self._live_chunks(keep), staged))
+        self._load()
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None) -> None:
+        ids = list(ids)
+        if not ids:
+            return
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = [dict(m or {}) for m in metadatas] if metadatas is not None else [{} for _ in ids]
+        vectors = np.asarray(embeddings, dtype=np.float32) if embeddings is not None else self._embed(documents)
+
+        with self.batch_writes():
+            self._refresh()
+            if self._count and self._vectors.shape[1] != vectors.shape[1]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self._vectors.shape[1]}")
+            self._batch.add(ids, documents, metadatas, vectors)
+
+    add = upsert
+
+    def delete(self, ids=None, where=None) -> None:
+        if ids is None and not where:
+            return
+        with self.batch_writes():
+            self._refresh()
+            batch = self._batch
+            positions = self._row_positions()
+            mask = self._mask(where) if where else None
+
+            def live_match(record_id: str) -> bool:
+                if record_id in batch.latest:
+                    return not where or _matches(batch.metadata(batch.latest[record_id]), where)
+                row = positions.get(record_id)
+                return row is not None and record_id not in batch.deleted and (mask is None or bool(mask[row]))
+
+            if ids is not None:
+                candidates = [ids] if isinstance(ids, str) else list(ids)
+            else:
+                candidates = list(dict.fromkeys(itertools.chain((self._id(r) for r in np.flatnonzero(mask)), batch.latest)))
+            batch.remove([record_id for record_id in candidates if live_match(record_id)])
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def _mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        if not where:
+            return np.ones(self._count, dtype=bool)
+        if _where_fields(where) <= _INDEXED_FIELDS:
+            return self._where_index().mask(where)
+        return np.fromiter((_matches(self._metadata(r), where) for r in range(self._count)), dtype=bool, count=self._count)
+
+    def _rows(self, rows: Sequence[int], include: Sequence[str]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"ids": [self._id(r) for r in rows]}
+        out["documents"] = [self._document(r) for r in rows] if "documents" in include else None
+        out["metadatas"] = [self._metadata(r) for r in rows] if "metadatas" in include else None
+        out["embeddings"] = self._dense(rows) if "embeddings" in include else None
+        return out
+
+    def count(self) -> int:
+        self._refresh()
+        return self._count
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None) -> Dict[str, Any]:
+        self._refresh()
+        include = tuple(include) if include is not None else _DEFAULT_GET_INCLUDE
+        if ids is not None:
+            positions = self._row_positions()
+            rows = [positions[i] for i in ([ids] if isinstance(ids, str) else ids) if i in positions]
+            if where:
+                mask = self._mask(where)
+                rows = [r for r in rows if mask[r]]
+        else:
+            rows = np.flatnonzero(self._mask(where)).tolist()
+        rows = rows[offset or 0 :]
+        if limit is not None:
+            rows = rows[:limit]
+        out = self._rows(rows, include)
+        out["included"] = list(include)
+        return out
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 10, where=None, include=None) -> Dict[str, Any]:
+        self._refresh()
+        include = tuple(include) if include is not None else _DEFAULT_QUERY_INCLUDE
+        if query_embeddings is None:
+            if query_texts is None:
+                raise ValueError("query() needs query_embeddings or query_texts")
+            queries = self._embed([query_texts] if isinstance(query_texts, str) else query_texts)
+        else:
+            queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+
+        candidates = np.flatnonzero(self._mask(where))
+        k = min(int(n_results), len(candidates))
+        out: Dict[str, Any] = {key: [] for key in ("ids", "documents", "metadatas", "distances", "embeddings")}
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        rerank = self._rerank is not None and self.rerank_factor > 0
+        shortlist = min(k * self.rerank_factor, len(candidates)) if rerank else k
+        if k:
+            distances = self._scan(queries, q_norms, candidates)
+        for qi in range(len(queries)):
+            if k:
+                top = np.argpartition(distances[qi], shortlist - 1)[:shortlist] if shortlist < len(candidates) else np.arange(len(candidates))
+                scores = distances[qi][top]
+                if rerank:
+                    rows = candidates[top]
+                    scores = q_norms[qi] + np.asarray(self._sq_norms)[rows] - 2.0 * (np.asarray(self._rerank[rows], dtype=np.float32) @ queries[qi])
+                    np.maximum(scores, 0.0, out=scores)
+                    best = np.argpartition(scores, k - 1)[:k] if k < len(top) else np.arange(len(top))
+                    top, scores = top[best], scores[best]
+                order = np.argsort(scores, kind="stable")
+                rows = candidates[top[order]].tolist()
+                dists = scores[order].tolist()
+            else:
+                rows, dists = [], []
+            block = self._rows(rows, include)
+            out["ids"].append(block["ids"])
+            out["documents"].append(block["documents"])
+            out["metadatas"].append(block["metadatas"])
+            out["embeddings"].append(block["embeddings"])
+            out["distances"].append(dists if "distances" in include else None)
+        for key in ("documents", "metadatas", "embeddings", "distances"):
+            if key not in include:
+                out[key] = None
+        out["included"] = list(include)
+        return out
+
+    def _scan(self, queries: np.ndarray, q_norms: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        """Squared L2 = |q|^2 + |v|^2 - 2 q.v against the stored (possibly quantized) vectors.
+
+        Rows are widened to float32 one block at a time, so a float16 / int8 store never
+        materializes a full-size float32 copy.
+        """
+        full = len(candidates) == self._count
+        dots = np.empty((len(queries), len(candidates)), dtype=np.float32)
+        for start in range(0, len(candidates), self.SCAN_BLOCK_ROWS):
+            stop = min(start + self.SCAN_BLOCK_ROWS, len(candidates))
+            rows = slice(start, stop) if full else candidates[start:stop]
+            block = queries @ np.asarray(self._vectors[rows], dtype=np.float32).T
+            if self._scales is not None:
+                block *= np.asarray(self._scales[rows])[None, :]
+            dots[:, start:stop] = block
+        distances = q_norms[:, None] + np.asarray(self._sq_norms)[candidates][None, :] - 2.0 * dots
+        np.maximum(distances, 0.0, out=distances)
+        return distances
+
+
+class NumpyStoreClient:
+    """PersistentClient look-alike for NumpyVectorBackend collections under one directory."""
+
+    SUFFIX = ".npstore"
+
+    def __init__(
+        self,
+        path: str,
+        default_embedding_function: Optional[Callable[[List[str]], Any]] = None,
+        dtype: str = "float32",
+        rerank_factor: int = DEFAULT_RERANK_FACTOR,
+    ):
+        self.path = path
+        self.dtype = dtype
+        self.rerank_factor = rerank_factor
+        self._default_embedding_function = default_embedding_function
+        self._collections: Dict[str, NumpyVectorBackend] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _directory(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}{self.SUFFIX}")
+
+    def _open(self, name: str, embedding_function=None, metadata=None) -> NumpyVectorBackend:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = NumpyVectorBackend(
+                    name,
+                    self._directory(name),
+                    embedding_function=embedding_function or self._default_embedding_function,
+                    metadata=metadata,
+                    dtype=self.dtype,
+                    rerank_factor=self.rerank_factor,
+                ).initialize()
+                self._collections[name] = collection
+            return collection
+
+    def get_collection(self, name: str, embedding_function=None) -> NumpyVectorBackend:
+        if not os.path.isdir(self._directory(name)):
+            raise ValueError(f"Collection {name} does not exist.")
+        return self._open(name, embedding_function)
+
+    def create_collection(self, name: str, embedding_function=None, metadata=None) -> NumpyVectorBackend:
+        if os.path.isdir(self._directory(name)):
+            raise ValueError(f"Collection {name} already exists.")
+        return self._open(name, embedding_function, metadata)
+
+    def get_or_create_collection(self, name: str, embedding_function=None, metadata=None) -> NumpyVectorBackend:
+        return self._open(name, embedding_function, metadata)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+        directory = self._directory(name)
+        if not os.path.isdir(directory):
+            raise ValueError(f"Collection {name} does not exist.")
+        shutil.rmtree(directory)
+
+    def list_collections(self) -> List[str]:
+        return sorted(n[: -len(self.SUFFIX)] for n in os.listdir(self.path) if n.endswith(self.SUFFIX))
+
+    def heartbeat(self) -> int:
+        if not os.path.isdir(self.path):
+            raise RuntimeError(f"Vector store directory {self.path} is missing")
+        return time.time_ns()
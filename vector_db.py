@@ -1,257 +1,2203 @@
 from __future__ import annotations
+import argparse
+import concurrent.futures
+import contextlib
+import copy
+import hashlib
+import importlib.util
+import itertools
+import json
 import logging
-from typing import Any, Dict, List, Optional
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import chromadb
+import numpy as np
 from chromadb.config import Settings
 
-from config import CHROMA_DB_PATH, COLLECTION_NAME
+from config import (
+    CHROMA_DB_PATH,
+    COLLECTION_NAME,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_DEVICE,
+    EMBEDDING_MODEL_NAME,
+    INGEST_BATCH_SIZE,
+    INGEST_EMBED_MODE,
+    INGEST_EMBED_WORKERS,
+    INGEST_MANIFEST_PATH,
+    MARKETING_DATA_PATH,
+    PARTITION_ARCHIVE_PATH,
+    PARTITION_FIELDS,
+    SALES_DATA_PATH,
+    VECTOR_BACKEND,
+    VECTOR_PARTITION_BY,
+    VECTOR_RERANK_FACTOR,
+    VECTOR_STORE_DTYPE,
+)
+
+from aggregates import build_aggregates, save_aggregates
+from embedding_cache import get_embedding_cache
+from lexical_index import LexicalIndexBuilder, save_lexical_index
+from metadata_index import (
+    MetadataIndexBuilder,
+    get_metadata_index,
+    save_metadata_index,
+)
+from vector_backends import NumpyStoreClient
 
-# Optional embedding model
 try:
-    from chromadb.utils import embedding_functions
+    from chromadb.api.types import EmbeddingFunction
+except Exception:
+    EmbeddingFunction = object
+
+try:
+    from chromadb.errors import NotFoundError
+except Exception:
+    NotFoundError = None
+
+
+# ------------------------------------------------------------------
+# Logging
+# ------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+if not logger.handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+
+
+# ------------------------------------------------------------------
+# Embedding model (loaded lazily)
+# ------------------------------------------------------------------
+
+class LazySentenceTransformerEmbedding(EmbeddingFunction):
+    """
+    Chroma embedding function that defers the torch / SentenceTransformer
+    load until the first query or upsert actually needs a vector.
+
+    Registers under the same name and config keys as chromadb's
+    SentenceTransformerEmbeddingFunction, so collections created by
+    either one open with the other without an embedding-function
+    conflict.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        device: Optional[str] = EMBEDDING_DEVICE,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def _load(self):
+
+        if self._model is None:
+
+            with self._lock:
+
+                if self._model is None:
+
+                    from sentence_transformers import SentenceTransformer
+
+                    self._model = SentenceTransformer(
+                        self.model_name,
+                        device=self.device,
+                    )
+
+                    logger.info(
+                        "Loaded embedding model: %s",
+                        self.model_name,
+                    )
+
+        return self._model
+
+    def __call__(self, input):
+
+        vectors = self._load().encode(
+            list(input),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=False,
+        )
+
+        return [v.tolist() for v in vectors]
+
+    @staticmethod
+    def name() -> str:
+        return "sentence_transformer"
+
+    def default_space(self) -> str:
+        return "cosine"
+
+    def supported_spaces(self) -> List[str]:
+        return ["cosine", "l2", "ip"]
+
+    def get_config(self) -> Dict[str, Any]:
+        # chromadb's own class requires a device when it rebuilds
+        # from this config; None (auto-select) is persisted as "cpu".
+        return {
+            "model_name": self.model_name,
+            "device": self.device or "cpu",
+            "normalize_embeddings": False,
+            "kwargs": {},
+        }
+
+    @staticmethod
+    def build_from_config(
+        config: Dict[str, Any],
+    ) -> "LazySentenceTransformerEmbedding":
+        # The persisted config has no batch size (chromadb's schema
+        # does not carry one): use the configured encode batch size.
+        return LazySentenceTransformerEmbedding(
+            model_name=config.get("model_name") or EMBEDDING_MODEL_NAME,
+            device=config.get("device") or EMBEDDING_DEVICE,
+            batch_size=EMBEDDING_BATCH_SIZE,
+        )
+
+
+# Without sentence-transformers installed Chroma falls back to its own
+# default embedding function (None), as before.
+if importlib.util.find_spec("sentence_transformers") is not None:
+    EMBEDDING_FUNCTION = LazySentenceTransformerEmbedding()
+else:
+    EMBEDDING_FUNCTION = None
+
+
+def get_embedding_function():
+    """
+    Shared embedding function (model loads on first call).
+    """
+
+    return EMBEDDING_FUNCTION
+
+
+# ------------------------------------------------------------------
+# Parallel embedding (ingestion)
+# ------------------------------------------------------------------
+
+_WORKER_EMBEDDING: Optional[LazySentenceTransformerEmbedding] = None
+
+
+def _init_embedding_worker(
+    model_name: str,
+    device: Optional[str],
+    batch_size: int,
+    torch_threads: int,
+) -> None:
+
+    global _WORKER_EMBEDDING
+
+    try:
+        import torch
+
+        torch.set_num_threads(torch_threads)
+    except Exception:
+        pass
+
+    _WORKER_EMBEDDING = LazySentenceTransformerEmbedding(
+        model_name=model_name,
+        device=device,
+        batch_size=batch_size,
+    )
+
+
+def _embed_in_worker(texts: List[str]) -> List[List[float]]:
+    return _WORKER_EMBEDDING(texts)
+
+
+class ParallelEmbedder:
+    """
+    Compute embeddings for ingestion across a worker pool.
+
+    mode="thread" shares the process-wide model between threads
+    (torch releases the GIL inside encode); mode="process" loads one
+    model per worker process and splits the CPU threads between them.
+    """
+
+    def __init__(
+        self,
+        workers: int = INGEST_EMBED_WORKERS,
+        mode: str = INGEST_EMBED_MODE,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ):
+
+        if EMBEDDING_FUNCTION is None:
+            raise RuntimeError(
+                "sentence-transformers is not installed; "
+                "parallel embedding is unavailable."
+            )
+
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown embedding mode: {mode}")
+
+        self.workers = max(1, int(workers))
+        self.mode = mode
+        self.batch_size = max(1, int(batch_size))
+
+        if mode == "process":
+
+            torch_threads = max(
+                1,
+                (os.cpu_count() or 1) // self.workers,
+            )
+
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_embedding_worker,
+                initargs=(
+                    EMBEDDING_FUNCTION.model_name,
+                    EMBEDDING_FUNCTION.device,
+                    self.batch_size,
+                    torch_threads,
+                ),
+            )
+            self._embed = _embed_in_worker
+
+        else:
+
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="embed",
+            )
+            self._embed = EMBEDDING_FUNCTION
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+
+        batches = [
+            texts[i:i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+
+        vectors: List[List[float]] = []
+
+        for result in self._pool.map(self._embed, batches):
+            vectors.extend(result)
+
+        return vectors
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ------------------------------------------------------------------
+# Cached embedding
+# ------------------------------------------------------------------
+
+def embed_texts(
+    texts: List[str],
+    embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+) -> Optional[List[List[float]]]:
+    """
+    Embed `texts`, serving repeats from the persistent embedding cache.
+
+    Only cache misses reach `embed_fn` (default: the shared model).
+    Returns None when no local model is configured, in which case the
+    caller should let Chroma embed.
+    """
+
+    if EMBEDDING_FUNCTION is None:
+        return None
+
+    texts = list(texts)
+    embed_fn = embed_fn or EMBEDDING_FUNCTION
+
+    if not texts:
+        return []
+
+    if not EMBEDDING_CACHE_ENABLED:
+        return embed_fn(texts)
+
+    model = EMBEDDING_FUNCTION.model_name
+
+    try:
+        cache = get_embedding_cache()
+        vectors = cache.get_many(model, texts)
+    except Exception as e:
+        logger.warning(
+            "Embedding cache unavailable: %s",
+            e,
+        )
+        return embed_fn(texts)
+
+    missing = [
+        i
+        for i, vector in enumerate(vectors)
+        if vector is None
+    ]
+
+    if missing:
+
+        missing_texts = [texts[i] for i in missing]
+        fresh = embed_fn(missing_texts)
+
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+
+        try:
+            cache.put_many(model, missing_texts, fresh)
+        except Exception as e:
+            logger.warning(
+                "Failed to store embeddings in cache: %s",
+                e,
+            )
+
+    return vectors
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+
+    if not EMBEDDING_CACHE_ENABLED:
+        return {"enabled": False}
+
+    return {
+        "enabled": True,
+        **get_embedding_cache().stats(),
+    }
+
+
+# ------------------------------------------------------------------
+# Helpers
+# ------------------------------------------------------------------
+
+def safe_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Chroma metadata only supports primitive values int float bool and strings.
+    """
+
+    cleaned = {}
+
+    for key, value in metadata.items():
+
+        if value is None:
+            cleaned[key] = ""
+
+        elif isinstance(value, (str, int, float, bool)):
+            cleaned[key] = value
+
+        else:
+            cleaned[key] = str(value)
+
+    return cleaned
+
+
+def _is_missing_collection(exc: Exception) -> bool:
+    """
+    True when get_collection failed only because the collection does
+    not exist (NotFoundError on Chroma 1.x, ValueError before that and
+    on the numpy backend).
+    """
+
+    if NotFoundError is not None and isinstance(exc, NotFoundError):
+        return True
+
+    return isinstance(exc, ValueError) and "does not exist" in str(exc)
+
+
+def _get_or_create_collection(
+    client,
+    collection_name: str = COLLECTION_NAME,
+):
+    """
+    Create or load collection.
+
+    Only a missing collection is created; any other error (e.g. an
+    embedding-function conflict) is raised as is.
+    """
+
+    try:
+
+        collection = client.get_collection(
+            name=collection_name,
+            embedding_function=EMBEDDING_FUNCTION,
+        )
+
+        logger.info(
+            "Loaded existing collection: %s",
+            collection_name,
+        )
+
+        return collection
+
+    except Exception as e:
+
+        if not _is_missing_collection(e):
+            raise
+
+        collection = client.create_collection(
+            name=collection_name,
+            embedding_function=EMBEDDING_FUNCTION,
+            metadata={
+                "description": (
+                    "Sales and marketing data "
+                    "for AI report generation"
+                )
+            },
+        )
+
+        logger.info(
+            "Created collection: %s",
+            collection_name,
+        )
+
+        return collection
+
+
+# ------------------------------------------------------------------
+# Initialization
+# ------------------------------------------------------------------
+
+def _default_embedding_function():
+    """
+    Embedding function for backends that cannot embed on their own.
+    """
+
+    if EMBEDDING_FUNCTION is not None:
+        return EMBEDDING_FUNCTION
+
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+    return DefaultEmbeddingFunction()
+
+
+def _new_chroma_client(path: str):
+    return chromadb.PersistentClient(
+        path=path,
+        settings=Settings(
+            anonymized_telemetry=False
+        ),
+    )
+
+
+def _new_numpy_client(path: str):
+    return NumpyStoreClient(
+        path,
+        default_embedding_function=_default_embedding_function(),
+        dtype=VECTOR_STORE_DTYPE,
+        rerank_factor=VECTOR_RERANK_FACTOR,
+    )
+
+
+# Backend name -> client factory. Every client exposes the
+# PersistentClient calls used here (get/create/delete_collection,
+# heartbeat) and hands out collections implementing
+# vector_backends.VectorBackend, so the rest of this module and
+# rag_retrieval work unchanged against any of them.
+BACKENDS: Dict[str, Callable[[str], Any]] = {
+    "chroma": _new_chroma_client,
+    "numpy": _new_numpy_client,
+}
+
+
+def _new_client(
+    path: str,
+    backend: Optional[str] = None,
+):
+    backend = backend or VECTOR_BACKEND
+
+    factory = BACKENDS.get(backend)
+
+    if factory is None:
+        raise ValueError(
+            f"Unknown VECTOR_BACKEND '{backend}'. "
+            f"Available: {sorted(BACKENDS)}"
+        )
+
+    return factory(path)
+
+
+def initialize_chromadb():
+    """
+    Initialize the configured vector store client and collection.
+
+    Despite the name this honours VECTOR_BACKEND, so callers get the
+    memory-mapped store when it is selected. The client and collection
+    come from the process-wide pool, so repeated calls share them.
+
+    Returns:
+        (client, collection)
+    """
+
+    return initialize_pooled_chromadb()
+
+
+def initialize_vector_store(
+    collection_name: Optional[str] = None,
+    path: Optional[str] = None,
+    backend: Optional[str] = None,
+):
+    """
+    Open a (non-pooled) client for `backend` and its collection.
+
+    Returns:
+        (client, collection)
+    """
+
+    client = _new_client(
+        path or CHROMA_DB_PATH,
+        backend=backend,
+    )
+
+    collection = _get_or_create_collection(
+        client,
+        collection_name or COLLECTION_NAME,
+    )
+
+    return client, collection
+
+
+def export_vector_store(
+    source_backend: str = "chroma",
+    target_backend: str = "numpy",
+    collection_name: Optional[str] = None,
+    path: Optional[str] = None,
+    page_size: int = 1000,
+) -> int:
+    """
+    Copy ids, documents, metadatas and stored embeddings from one
+    backend to another without re-embedding.
+
+    Typical use: build the memory-mapped NumPy store from an existing
+    Chroma collection, then switch VECTOR_BACKEND=numpy.
+
+    Returns:
+        number of records copied
+    """
+
+    _, source = initialize_vector_store(
+        collection_name,
+        path,
+        backend=source_backend,
+    )
+
+    _, target = initialize_vector_store(
+        collection_name,
+        path,
+        backend=target_backend,
+    )
+
+    copied = set()
+    offset = 0
+
+    # Pages are copied as they are read; the target commits once at the end.
+    with _write_batch(target):
+
+        while True:
+
+            page = source.get(
+                limit=page_size,
+                offset=offset,
+                include=["documents", "metadatas", "embeddings"],
+            )
+
+            page_ids = page.get("ids") or []
+
+            if not page_ids:
+                break
+
+            target.upsert(
+                ids=page_ids,
+                documents=page.get("documents") or [None] * len(page_ids),
+                metadatas=page.get("metadatas") or [{}] * len(page_ids),
+                embeddings=page["embeddings"],
+            )
+
+            copied.update(page_ids)
+            offset += len(page_ids)
+
+        stale = set(target.get(include=[])["ids"]) - copied
+
+        if stale:
+            _delete_chunked(
+                target,
+                list(stale),
+                INGEST_BATCH_SIZE,
+            )
+
+    bump_collection_version(
+        collection_name or COLLECTION_NAME
+    )
+
+    logger.info(
+        "Exported %s records from %s to %s",
+        len(copied),
+        source_backend,
+        target_backend,
+    )
+
+    return len(copied)
+
+
+# ------------------------------------------------------------------
+# Process-wide client / collection pool
+# ------------------------------------------------------------------
+# Opening a PersistentClient re-reads the SQLite + HNSW files, so
+# retrieval should share one client per path and one collection
+# handle per (path, collection name) for the life of the process.
+
+_POOL_LOCK = threading.RLock()
+_CLIENTS: Dict[str, Any] = {}
+_COLLECTIONS: Dict[Tuple[str, str], Any] = {}
+
+
+def get_pooled_client(path: Optional[str] = None):
+    """
+    Return the shared client for `path`, creating it on first use.
+    """
+
+    path = path or CHROMA_DB_PATH
+
+    with _POOL_LOCK:
+
+        client = _CLIENTS.get(path)
+
+        if client is None:
+
+            client = _new_client(path)
+            _CLIENTS[path] = client
+
+            logger.info(
+                "Opened pooled %s client: %s",
+                VECTOR_BACKEND,
+                path,
+            )
+
+        return client
+
+
+def get_pooled_collection(
+    collection_name: Optional[str] = None,
+    path: Optional[str] = None,
+):
+    """
+    Return the shared collection handle for (path, collection_name).
+    """
+
+    path = path or CHROMA_DB_PATH
+    collection_name = collection_name or COLLECTION_NAME
+    key = (path, collection_name)
+
+    with _POOL_LOCK:
+
+        collection = _COLLECTIONS.get(key)
+
+        if collection is None:
+
+            collection = _get_or_create_collection(
+                get_pooled_client(path),
+                collection_name,
+            )
+            _COLLECTIONS[key] = collection
+
+        return collection
+
+
+def initialize_pooled_chromadb(
+    collection_name: Optional[str] = None,
+    path: Optional[str] = None,
+):
+    """
+    Pooled client and collection for an explicit name and path.
+
+    Returns:
+        (client, collection)
+    """
+
+    collection = get_pooled_collection(
+        collection_name,
+        path=path,
+    )
+
+    return get_pooled_client(path), collection
+
+
+def _close_client(client) -> None:
+    # Chroma has no public close() on every release; stop the
+    # underlying system when it is exposed so file handles go away.
+    system = getattr(client, "_system", None)
+
+    if system is not None and hasattr(system, "stop"):
+        system.stop()
+
+    clear_cache = getattr(client, "clear_system_cache", None)
+
+    if callable(clear_cache):
+        clear_cache()
+
+
+def close_pooled_clients(path: Optional[str] = None) -> None:
+    """
+    Close pooled clients (all of them, or only the one for `path`)
+    and drop their cached collection handles.
+    """
+
+    with _POOL_LOCK:
+
+        paths = [path] if path else list(_CLIENTS)
+
+        for p in paths:
+
+            for key in [k for k in _COLLECTIONS if k[0] == p]:
+                _COLLECTIONS.pop(key, None)
+
+            client = _CLIENTS.pop(p, None)
+
+            if client is None:
+                continue
+
+            try:
+                _close_client(client)
+            except Exception as e:
+                logger.warning(
+                    "Error while closing ChromaDB client %s: %s",
+                    p,
+                    e,
+                )
+
+
+def reset_pool() -> None:
+    """
+    Forget every pooled handle; the next call reopens lazily.
+    """
+
+    close_pooled_clients()
+
+
+def pool_health_check() -> Dict[str, Any]:
+    """
+    Heartbeat every pooled client and count every pooled collection.
+
+    Unhealthy entries are evicted so the next call reconnects.
+    """
+
+    report: Dict[str, Any] = {
+        "healthy": True,
+        "clients": {},
+        "collections": {},
+    }
+
+    with _POOL_LOCK:
+
+        for path, client in list(_CLIENTS.items()):
+
+            try:
+                client.heartbeat()
+                report["clients"][path] = "ok"
+
+            except Exception as e:
+                report["healthy"] = False
+                report["clients"][path] = f"error: {e}"
+                close_pooled_clients(path)
+
+        for (path, name), collection in list(_COLLECTIONS.items()):
+
+            try:
+                report["collections"][f"{path}:{name}"] = (
+                    collection.count()
+                )
+
+            except Exception as e:
+                report["healthy"] = False
+                report["collections"][f"{path}:{name}"] = (
+                    f"error: {e}"
+                )
+                _COLLECTIONS.pop((path, name), None)
+
+    return report
+
+
+# ------------------------------------------------------------------
+# Records
+# ------------------------------------------------------------------
+
+def _sales_record(sale: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+
+    metadata = safe_metadata(
+        {
+            "type": "sales",
+            "id": sale.get("id"),
+            "product": sale.get("product"),
+            "category": sale.get("category"),
+            "revenue": sale.get("revenue"),
+            "units_sold": sale.get("units_sold"),
+            "region": sale.get("region"),
+            "quarter": sale.get("quarter"),
+            "customer_segment": sale.get(
+                "customer_segment"
+            ),
+            "sales_rep": sale.get(
+                "sales_rep"
+            ),
+        }
+    )
+
+    return (
+        f"sales_{sale.get('id')}",
+        sale.get("description", ""),
+        metadata,
+    )
+
+
+def _marketing_record(campaign: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+
+    metadata = safe_metadata(
+        {
+            "type": "marketing",
+            "id": campaign.get("id"),
+            "campaign_name": campaign.get(
+                "campaign_name"
+            ),
+            "channel": campaign.get(
+                "channel"
+            ),
+            "budget": campaign.get(
+                "budget"
+            ),
+            "impressions": campaign.get(
+                "impressions"
+            ),
+            "clicks": campaign.get(
+                "clicks"
+            ),
+            "conversions": campaign.get(
+                "conversions"
+            ),
+            "quarter": campaign.get(
+                "quarter"
+            ),
+            "target_segment": campaign.get(
+                "target_segment"
+            ),
+        }
+    )
+
+    return (
+        f"marketing_{campaign.get('id')}",
+        campaign.get(
+            "description",
+            "",
+        ),
+        metadata,
+    )
+
+
+# ------------------------------------------------------------------
+# Ingestion manifest
+# ------------------------------------------------------------------
+# {"collections": {collection_name: {record_id: content_hash}}}
+# stored inside CHROMA_DB_PATH so it lives on the same disk as the
+# index it describes.
+
+def record_hash(
+    document: str,
+    metadata: Dict[str, Any],
+) -> str:
+    """
+    Stable hash of a record's description + metadata.
+    """
+
+    payload = json.dumps(
+        [document, metadata],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+
+    return hashlib.sha256(
+        payload.encode("utf-8")
+    ).hexdigest()
+
+
+def load_manifest(path: str = INGEST_MANIFEST_PATH) -> Dict[str, Any]:
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"collections": {}}
+    except Exception as e:
+        logger.warning(
+            "Ignoring unreadable ingestion manifest %s: %s",
+            path,
+            e,
+        )
+        return {"collections": {}}
+
+    manifest.setdefault("collections", {})
+
+    return manifest
+
+
+def save_manifest(
+    manifest: Dict[str, Any],
+    path: str = INGEST_MANIFEST_PATH,
+) -> None:
+
+    os.makedirs(
+        os.path.dirname(path) or ".",
+        exist_ok=True,
+    )
+
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    os.replace(tmp_path, path)
+
+
+def _previous_hashes(
+    manifest: Dict[str, Any],
+    collection,
+) -> Dict[str, str]:
+
+    previous = dict(
+        manifest["collections"].get(
+            collection.name,
+            {},
+        )
+    )
+
+    # A wiped / recreated collection invalidates the manifest.
+    if previous and collection.count() == 0:
+        logger.info(
+            "Collection %s is empty; ignoring its manifest.",
+            collection.name,
+        )
+        return {}
+
+    return previous
+
+
+# ------------------------------------------------------------------
+# Side-file cache
+# ------------------------------------------------------------------
+# The version counter and the partition catalog are read on every
+# retrieval. Parsed contents are cached per path and re-read only when
+# the file's mtime or size changes (another process wrote it); writers
+# in this process store what they wrote.
+
+_SIDE_FILES: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+_SIDE_FILES_LOCK = threading.Lock()
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_side_file(path: str, parse: Callable[[str], Any]) -> Any:
+    """
+    parse(path), reused until the file changes. Raises
+    FileNotFoundError if the file is missing.
+    """
+
+    signature = _file_signature(path)
+
+    with _SIDE_FILES_LOCK:
+
+        if signature is None:
+            _SIDE_FILES.pop(path, None)
+            raise FileNotFoundError(path)
+
+        cached = _SIDE_FILES.get(path)
+
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    value = parse(path)
+
+    with _SIDE_FILES_LOCK:
+        _SIDE_FILES[path] = (signature, value)
+
+    return value
+
+
+def _remember_side_file(path: str, value: Any) -> None:
+
+    signature = _file_signature(path)
+
+    with _SIDE_FILES_LOCK:
+
+        if signature is None:
+            _SIDE_FILES.pop(path, None)
+        else:
+            _SIDE_FILES[path] = (signature, value)
+
+
+# ------------------------------------------------------------------
+# Collection version
+# ------------------------------------------------------------------
+# A counter bumped whenever ingestion changes a collection, so readers
+# (e.g. the rag_retrieval result cache) can tell their data is stale.
+
+def _version_path(collection_name: str) -> str:
+    return os.path.join(
+        CHROMA_DB_PATH,
+        f"{collection_name}.version",
+    )
+
+
+def _parse_version(path: str) -> int:
+
+    with open(path, "r", encoding="utf-8") as f:
+        return int(f.read().strip() or 0)
+
+
+def get_collection_version(collection_name: str) -> int:
+
+    try:
+        return _read_side_file(
+            _version_path(collection_name),
+            _parse_version,
+        )
+    except (OSError, ValueError):
+        return 0
+
+
+def bump_collection_version(collection_name: str) -> int:
+
+    version = get_collection_version(collection_name) + 1
+    path = _version_path(collection_name)
+
+    os.makedirs(
+        os.path.dirname(path) or ".",
+        exist_ok=True,
+    )
+
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(version))
+
+    os.replace(tmp_path, path)
+    _remember_side_file(path, version)
+
+    return version
+
+
+# ------------------------------------------------------------------
+# Streaming sources
+# ------------------------------------------------------------------
+
+def _iter_json_array(
+    f,
+    chunk_size: int = 1 << 16,
+) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array one at a time,
+    keeping at most one element plus one read chunk in memory.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+
+    while True:
+
+        buffer = buffer.lstrip()
+
+        if not started:
+
+            if not buffer and not eof:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer += chunk
+                continue
+
+            if not buffer.startswith("["):
+                raise ValueError("Expected a top-level JSON array")
+
+            buffer = buffer[1:]
+            started = True
+            continue
+
+        if buffer.startswith(","):
+            buffer = buffer[1:]
+            continue
+
+        if buffer.startswith("]"):
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer)
+
+        except json.JSONDecodeError:
+
+            if eof:
+                raise
+
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+
+        rest = buffer[end:].lstrip()
+
+        if rest[:1] not in (",", "]") and not eof:
+            # A scalar may continue in the next chunk; re-parse.
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+
+        buffer = buffer[end:]
+
+        yield item
+
+
+def iter_json_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily read records from a JSON array file or a JSONL file.
+
+    Uses ijson when it is installed, otherwise a chunked stdlib parser.
+    """
+
+    if path.endswith(".jsonl"):
+
+        with open(path, "r", encoding="utf-8") as f:
+
+            for line in f:
+
+                line = line.strip()
+
+                if line:
+                    yield json.loads(line)
+
+        return
+
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    if ijson is not None:
+
+        with open(path, "rb") as f:
+            yield from ijson.items(
+                f,
+                "item",
+                use_float=True,
+            )
+
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        yield from _iter_json_array(f)
+
+
+# ------------------------------------------------------------------
+# Batched writes
+# ------------------------------------------------------------------
+
+def _max_batch_size(collection) -> Optional[int]:
+    """
+    Largest batch the underlying Chroma client accepts, if it says.
+    """
+
+    client = getattr(collection, "_client", None)
+
+    for source in (client, collection):
+
+        getter = getattr(source, "get_max_batch_size", None)
+
+        if callable(getter):
+            try:
+                return int(getter())
+            except Exception:
+                pass
+
+        value = getattr(source, "max_batch_size", None)
+
+        if isinstance(value, int) and value > 0:
+            return value
+
+    return None
+
+
+def _chunk_size(
+    collection,
+    batch_size: int,
+) -> int:
+
+    limit = _max_batch_size(collection)
+
+    if limit:
+        return max(1, min(batch_size, limit))
+
+    return max(1, batch_size)
+
+
+def _write_batch(collection):
+    """
+    Group a run of writes where the backend supports it: the NumPy
+    store stages them on disk and commits one generation when the
+    block exits. Chroma writes through, so this is a no-op there.
+    """
+
+    batch_writes = getattr(collection, "batch_writes", None)
+
+    return batch_writes() if batch_writes else contextlib.nullcontext(collection)
+
+
+def _upsert_chunked(
+    collection,
+    ids: List[str],
+    documents: List[str],
+    metadatas: List[Dict[str, Any]],
+    batch_size: int = INGEST_BATCH_SIZE,
+    embeddings: Optional[List[List[float]]] = None,
+) -> None:
+
+    size = _chunk_size(collection, batch_size)
+
+    for start in range(0, len(ids), size):
+
+        chunk = slice(start, start + size)
+
+        params: Dict[str, Any] = {
+            "documents": documents[chunk],
+            "metadatas": metadatas[chunk],
+            "ids": ids[chunk],
+        }
+
+        if embeddings is not None:
+            params["embeddings"] = embeddings[chunk]
+
+        try:
+
+            collection.upsert(
+                **params
+            )
+
+        except AttributeError:
+
+            collection.add(
+                **params
+            )
+
+
+def _delete_chunked(
+    collection,
+    ids: List[str],
+    batch_size: int = INGEST_BATCH_SIZE,
+) -> None:
+
+    size = _chunk_size(collection, batch_size)
+
+    for start in range(0, len(ids), size):
+
+        collection.delete(
+            ids=ids[start:start + size]
+        )
+
+
+# ------------------------------------------------------------------
+# Data Loading
+# ------------------------------------------------------------------
+
+def _save_side_indexes(
+    collection_name: str,
+    index_builder: MetadataIndexBuilder,
+    lexical_builder: LexicalIndexBuilder,
+) -> None:
+
+    metadata_index = index_builder.build()
+
+    save_metadata_index(
+        collection_name,
+        metadata_index,
+    )
+
+    save_aggregates(
+        collection_name,
+        build_aggregates(metadata_index),
+    )
+
+    save_lexical_index(
+        collection_name,
+        lexical_builder.build(),
+    )
+
+
+def _ingest_records(
+    collection,
+    records: Iterable[Tuple[str, str, Dict[str, Any]]],
+    incremental: bool = True,
+    batch_size: int = INGEST_BATCH_SIZE,
+    embedder: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    side_indexes: bool = True,
+) -> Dict[str, Any]:
+    """
+    Hash, diff against the manifest and upsert `records` in batches.
+
+    When a local model is configured, vectors are computed up front
+    through the embedding cache (with `embedder` for cache misses, if
+    given) and passed to Chroma via embeddings=; otherwise Chroma embeds
+    inside upsert().
+
+    Writes go through _write_batch(), so the NumPy store commits one
+    generation per ingest rather than one per batch.
+
+    Only one batch of documents is held in memory at a time; the
+    manifest (id -> hash) and the side indexes (columnar metadata,
+    BM25) are the only structures that grow with the dataset. The side
+    indexes are rebuilt from every record seen, in the same order, so
+    they mirror the source data and share row positions. Partitions
+    pass side_indexes=False: their parent collection owns the side
+    indexes (see rebuild_partition_indexes()).
+    """
+
+    manifest = load_manifest()
+
+    previous = (
+        _previous_hashes(manifest, collection)
+        if incremental
+        else {}
+    )
+
+    current: Dict[str, str] = {}
+
+    stats: Dict[str, Any] = {
+        "seen": 0,
+        "upserted": 0,
+        "unchanged": 0,
+        "deleted": 0,
+    }
+
+    documents: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    ids: List[str] = []
+
+    index_builder = MetadataIndexBuilder()
+    lexical_builder = LexicalIndexBuilder()
+
+    started = time.perf_counter()
+
+    def flush():
+
+        if not ids:
+            return
+
+        _upsert_chunked(
+            collection,
+            ids,
+            documents,
+            metadatas,
+            batch_size=batch_size,
+            embeddings=embed_texts(documents, embed_fn=embedder),
+        )
+
+        stats["upserted"] += len(ids)
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+
+        logger.info(
+            "Ingest progress: %s seen, %s upserted (%.1f docs/sec)",
+            stats["seen"],
+            stats["upserted"],
+            stats["upserted"] / elapsed,
+        )
+
+        ids.clear()
+        documents.clear()
+        metadatas.clear()
+
+    with _write_batch(collection):
+
+        for record_id, document, metadata in records:
+
+            stats["seen"] += 1
+
+            digest = record_hash(document, metadata)
+            current[record_id] = digest
+
+            index_builder.add(record_id, metadata)
+            lexical_builder.add(
+                record_id,
+                document,
+                extra=str(metadata.get("id", "")),
+            )
+
+            if previous.get(record_id) == digest:
+                stats["unchanged"] += 1
+                continue
+
+            documents.append(document)
+            metadatas.append(metadata)
+            ids.append(record_id)
+
+            if len(ids) >= batch_size:
+                flush()
+
+        if not stats["seen"]:
+            # Still reconcile: an empty source removes every stale record.
+            logger.warning(
+                "No documents supplied for indexing."
+            )
+
+        flush()
+
+        stale_ids = [
+            record_id
+            for record_id in previous
+            if record_id not in current
+        ]
+
+        if stale_ids:
+
+            _delete_chunked(
+                collection,
+                stale_ids,
+                batch_size=batch_size,
+            )
+
+            stats["deleted"] = len(stale_ids)
+
+    manifest["collections"][collection.name] = current
+    save_manifest(manifest)
+
+    if side_indexes:
+        _save_side_indexes(
+            collection.name,
+            index_builder,
+            lexical_builder,
+        )
+
+    if stats["upserted"] or stats["deleted"]:
+        stats["version"] = bump_collection_version(collection.name)
+    else:
+        stats["version"] = get_collection_version(collection.name)
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    stats["docs_per_sec"] = round(
+        stats["upserted"] / max(stats["seconds"], 1e-9),
+        1,
+    )
+
+    logger.info(
+        "Indexed %s documents (%s unchanged, %s deleted) in %.2fs.",
+        stats["upserted"],
+        stats["unchanged"],
+        stats["deleted"],
+        stats["seconds"],
+    )
+
+    return stats
+
+
+def load_data_to_vectordb(
+    collection,
+    sales_data: List[Dict[str, Any]],
+    marketing_data: List[Dict[str, Any]],
+    incremental: bool = True,
+    batch_size: int = INGEST_BATCH_SIZE,
+):
+    """
+    Load sales + marketing records into ChromaDB.
+
+    With incremental=True only records whose description/metadata
+    hash changed since the last run are embedded and upserted, and ids
+    missing from sales_data + marketing_data are deleted.
+
+    Returns:
+        number of documents upserted
+    """
+
+    records = itertools.chain(
+        (_sales_record(sale) for sale in sales_data),
+        (_marketing_record(campaign) for campaign in marketing_data),
+    )
+
+    stats = _ingest_records(
+        collection,
+        records,
+        incremental=incremental,
+        batch_size=batch_size,
+    )
+
+    return stats["upserted"]
+
+
+def ingest_data_files(
+    collection,
+    sales_path: str = SALES_DATA_PATH,
+    marketing_path: str = MARKETING_DATA_PATH,
+    incremental: bool = True,
+    batch_size: int = INGEST_BATCH_SIZE,
+    embed_workers: int = INGEST_EMBED_WORKERS,
+    embed_mode: str = INGEST_EMBED_MODE,
+) -> Dict[str, Any]:
+    """
+    Stream sales + marketing records from disk into the collection.
+
+    Files may be JSON arrays or JSONL; memory stays bounded by
+    `batch_size` regardless of file size. With embed_workers > 0 the
+    embeddings are computed by a ParallelEmbedder (embed_mode "thread"
+    or "process") before each upsert.
+
+    Returns:
+        ingestion stats (seen / upserted / unchanged / deleted /
+        seconds / docs_per_sec)
+    """
+
+    records = itertools.chain(
+        (_sales_record(sale) for sale in iter_json_records(sales_path)),
+        (
+            _marketing_record(campaign)
+            for campaign in iter_json_records(marketing_path)
+        ),
+    )
+
+    if embed_workers <= 0 or EMBEDDING_FUNCTION is None:
+
+        return _ingest_records(
+            collection,
+            records,
+            incremental=incremental,
+            batch_size=batch_size,
+        )
+
+    # Each upsert batch (`batch_size` records) is split into encode
+    # batches of EMBEDDING_BATCH_SIZE texts spread across the workers.
+    with ParallelEmbedder(
+        workers=embed_workers,
+        mode=embed_mode,
+        batch_size=EMBEDDING_BATCH_SIZE,
+    ) as embedder:
+
+        return _ingest_records(
+            collection,
+            records,
+            incremental=incremental,
+            batch_size=batch_size,
+            embedder=embedder,
+        )
+
+
+# ------------------------------------------------------------------
+# Partitions
+# ------------------------------------------------------------------
+# With VECTOR_PARTITION_BY=quarter every quarter gets its own
+# collection "<collection>__q1_2024". The parent name keeps the side
+# indexes (metadata, aggregates, BM25), the version counter and a
+# catalog <collection>.partitions.json:
+#
+#   {"collection": "<collection>", "partition_by": "quarter",
+#    "partitions": {"Q1 2024": {"collection": "...__q1_2024",
+#                               "records": 160,
+#                               "state": "active" | "archived",
+#                               "archive": null | "<path>.npz"}}}
+#
+# rag_retrieval reads the catalog and only searches the partitions a
+# query's where clause can match. Archived quarters keep their records
+# (documents, metadata, float16 vectors) in a compressed .npz under
+# PARTITION_ARCHIVE_PATH instead of a live collection.
+
+def _partition_catalog_path(collection_name: str) -> str:
+    return os.path.join(
+        CHROMA_DB_PATH,
+        f"{collection_name}.partitions.json",
+    )
+
+
+def partition_collection_name(
+    collection_name: str,
+    value: Any,
+) -> str:
+
+    slug = re.sub(
+        r"[^a-z0-9]+",
+        "_",
+        str(value or "").lower(),
+    ).strip("_")
+
+    return f"{collection_name}__{slug or 'unassigned'}"
+
+
+def _parse_json_file(path: str) -> Any:
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_partition_catalog(
+    collection_name: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    The partition catalog of a collection, or None if it is not
+    partitioned.
+    """
+
+    path = _partition_catalog_path(
+        collection_name or COLLECTION_NAME
+    )
+
+    try:
+        catalog = _read_side_file(path, _parse_json_file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(
+            "Ignoring unreadable partition catalog %s: %s",
+            path,
+            e,
+        )
+        return None
+
+    # Callers edit the catalog before saving it; keep the cached copy intact.
+    catalog = copy.deepcopy(catalog)
+    catalog.setdefault("partitions", {})
+
+    return catalog
+
+
+def _save_partition_catalog(
+    collection_name: str,
+    catalog: Dict[str, Any],
+) -> None:
+
+    path = _partition_catalog_path(collection_name)
+
+    os.makedirs(
+        os.path.dirname(path) or ".",
+        exist_ok=True,
+    )
+
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2, sort_keys=True)
+
+    os.replace(tmp_path, path)
+    _remember_side_file(path, copy.deepcopy(catalog))
+
+
+def _drop_partition_collection(
+    partition_name: str,
+) -> None:
+
+    clear_collection(
+        get_pooled_client(),
+        partition_name,
+    )
+
+    # The partition is gone for good: don't leave its version counter
+    # (bumped by ingestion and by clear_collection) behind.
+    version_path = _version_path(partition_name)
+
+    if os.path.exists(version_path):
+        os.remove(version_path)
+
+    _remember_side_file(version_path, None)
+
+    manifest = load_manifest()
+
+    if manifest["collections"].pop(partition_name, None) is not None:
+        save_manifest(manifest)
+
+
+def _spool_partitions(
+    records: Iterable[Tuple[str, str, Dict[str, Any]]],
+    field: str,
+    directory: str,
+    skip: Iterable[str] = (),
+) -> Tuple[Dict[str, str], int]:
+    """
+    Split a record stream into one JSONL file per partition value,
+    so each partition can be ingested as its own bounded stream.
+
+    Returns:
+        ({value: spool path}, number of records skipped)
+    """
+
+    skip = set(skip)
+    handles: Dict[str, Any] = {}
+    paths: Dict[str, str] = {}
+    skipped = 0
+
+    try:
+
+        for record in records:
+
+            value = str(record[2].get(field) or "")
+
+            if value in skip:
+                skipped += 1
+                continue
+
+            handle = handles.get(value)
+
+            if handle is None:
+                paths[value] = os.path.join(
+                    directory,
+                    f"part-{len(paths):04d}.jsonl",
+                )
+                handle = open(paths[value], "w", encoding="utf-8")
+                handles[value] = handle
+
+            handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    finally:
+
+        for handle in handles.values():
+            handle.close()
+
+    return paths, skipped
+
+
+def _iter_spool(path: str) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+
+    with open(path, "r", encoding="utf-8") as f:
+
+        for line in f:
+            record_id, document, metadata = json.loads(line)
+            yield record_id, document, metadata
+
+
+def ingest_partitioned_files(
+    collection_name: Optional[str] = None,
+    sales_path: str = SALES_DATA_PATH,
+    marketing_path: str = MARKETING_DATA_PATH,
+    partition_by: str = "quarter",
+    incremental: bool = True,
+    batch_size: int = INGEST_BATCH_SIZE,
+    embed_workers: int = INGEST_EMBED_WORKERS,
+    embed_mode: str = INGEST_EMBED_MODE,
+) -> Dict[str, Any]:
+    """
+    Stream sales + marketing records into one collection per
+    `partition_by` value (quarter).
+
+    Records are first spooled to one temporary JSONL file per
+    partition, then each partition goes through the usual manifest
+    diff + batched upsert. Records of archived partitions are skipped;
+    partitions that no longer occur in the source are dropped.
+
+    Returns:
+        totals plus per-partition ingestion stats
+    """
+
+    collection_name = collection_name or COLLECTION_NAME
+
+    if partition_by not in PARTITION_FIELDS:
+        raise ValueError(
+            f"Unsupported partition field '{partition_by}'. "
+            f"Supported: {list(PARTITION_FIELDS)}"
+        )
+
+    catalog = get_partition_catalog(collection_name) or {"partitions": {}}
+
+    if catalog.get("partition_by", partition_by) != partition_by:
+        raise ValueError(
+            f"{collection_name} is partitioned by "
+            f"{catalog['partition_by']}, not {partition_by}"
+        )
+
+    catalog["partition_by"] = partition_by
+    catalog["collection"] = collection_name
+    partitions = catalog["partitions"]
+
+    archived = [
+        value
+        for value, entry in partitions.items()
+        if entry.get("state") == "archived"
+    ]
+
+    records = itertools.chain(
+        (_sales_record(sale) for sale in iter_json_records(sales_path)),
+        (
+            _marketing_record(campaign)
+            for campaign in iter_json_records(marketing_path)
+        ),
+    )
+
+    started = time.perf_counter()
+
+    totals: Dict[str, Any] = {
+        "seen": 0,
+        "upserted": 0,
+        "unchanged": 0,
+        "deleted": 0,
+        "skipped_archived": 0,
+        "partitions": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="partition-spool-") as spool_dir, contextlib.ExitStack() as stack:
+
+        spools, totals["skipped_archived"] = _spool_partitions(
+            records,
+            partition_by,
+            spool_dir,
+            skip=archived,
+        )
+
+        embedder = None
+
+        if embed_workers > 0 and EMBEDDING_FUNCTION is not None:
+            embedder = stack.enter_context(
+                ParallelEmbedder(
+                    workers=embed_workers,
+                    mode=embed_mode,
+                )
+            )
+
+        for value in sorted(spools):
+
+            partition_name = partition_collection_name(
+                collection_name,
+                value,
+            )
+
+            stats = _ingest_records(
+                get_pooled_collection(partition_name),
+                _iter_spool(spools[value]),
+                incremental=incremental,
+                batch_size=batch_size,
+                embedder=embedder,
+                side_indexes=False,
+            )
+
+            partitions[value] = {
+                "collection": partition_name,
+                "records": stats["seen"],
+                "state": "active",
+                "archive": None,
+            }
+
+            totals["partitions"][value] = stats
+
+            for key in ("seen", "upserted", "unchanged", "deleted"):
+                totals[key] += stats[key]
 
-    EMBEDDING_FUNCTION = (
-        embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
+    for value in [
+        v
+        for v, entry in partitions.items()
+        if entry.get("state") == "active" and v not in spools
+    ]:
+
+        logger.info(
+            "Partition %s no longer occurs in the source; dropping it.",
+            value,
         )
-    )
-except Exception:
-    EMBEDDING_FUNCTION = None
 
+        _drop_partition_collection(partitions[value]["collection"])
+        totals["deleted"] += partitions.pop(value)["records"]
 
-# ------------------------------------------------------------------
-# Logging
-# ------------------------------------------------------------------
+    _save_partition_catalog(collection_name, catalog)
+    rebuild_partition_indexes(collection_name)
 
-logger = logging.getLogger(__name__)
+    if totals["upserted"] or totals["deleted"]:
+        totals["version"] = bump_collection_version(collection_name)
+    else:
+        totals["version"] = get_collection_version(collection_name)
 
-if not logger.handlers:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(message)s",
+    totals["seconds"] = round(time.perf_counter() - started, 3)
+    totals["docs_per_sec"] = round(
+        totals["upserted"] / max(totals["seconds"], 1e-9),
+        1,
     )
 
+    logger.info(
+        "Indexed %s documents into %s partitions in %.2fs.",
+        totals["upserted"],
+        len(spools),
+        totals["seconds"],
+    )
 
-# ------------------------------------------------------------------
-# Helpers
-# ------------------------------------------------------------------
+    return totals
 
-def safe_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+
+def _iter_collection(
+    collection,
+    include: Iterable[str] = ("documents", "metadatas"),
+    page_size: int = 1000,
+) -> Iterator[Tuple[str, Any, Dict[str, Any], Any]]:
     """
-    Chroma metadata only supports primitive values int float bool and strings.
+    Yield (id, document, metadata, embedding) for every stored record.
     """
 
-    cleaned = {}
+    include = list(include)
+    offset = 0
 
-    for key, value in metadata.items():
+    while True:
 
-        if value is None:
-            cleaned[key] = ""
+        page = collection.get(
+            limit=page_size,
+            offset=offset,
+            include=include,
+        )
 
-        elif isinstance(value, (str, int, float, bool)):
-            cleaned[key] = value
+        ids = page.get("ids") or []
 
-        else:
-            cleaned[key] = str(value)
+        if not ids:
+            return
 
-    return cleaned
+        documents = page.get("documents")
+        metadatas = page.get("metadatas")
+        embeddings = page.get("embeddings")
 
+        for i, record_id in enumerate(ids):
+            yield (
+                record_id,
+                documents[i] if documents is not None else None,
+                metadatas[i] if metadatas is not None else {},
+                embeddings[i] if embeddings is not None else None,
+            )
+
+        offset += len(ids)
 
-def _get_or_create_collection(client):
+
+def rebuild_partition_indexes(
+    collection_name: Optional[str] = None,
+) -> int:
     """
-    Create or load collection.
+    Rebuild the parent collection's side indexes (metadata,
+    aggregates, BM25) from its active partitions.
+
+    Returns:
+        number of records indexed
     """
 
-    try:
+    collection_name = collection_name or COLLECTION_NAME
+    catalog = get_partition_catalog(collection_name) or {"partitions": {}}
 
-        collection = client.get_collection(
-            name=COLLECTION_NAME,
-            embedding_function=EMBEDDING_FUNCTION,
-        )
+    index_builder = MetadataIndexBuilder()
+    lexical_builder = LexicalIndexBuilder()
+    indexed = 0
 
-        logger.info(
-            "Loaded existing collection: %s",
-            COLLECTION_NAME,
-        )
+    for value in sorted(catalog["partitions"]):
 
-        return collection
+        entry = catalog["partitions"][value]
 
-    except Exception:
+        if entry.get("state") != "active":
+            continue
 
-        collection = client.create_collection(
-            name=COLLECTION_NAME,
-            embedding_function=EMBEDDING_FUNCTION,
-            metadata={
-                "description": (
-                    "Sales and marketing data "
-                    "for AI report generation"
-                )
-            },
-        )
+        for record_id, document, metadata, _ in _iter_collection(
+            get_pooled_collection(entry["collection"])
+        ):
 
-        logger.info(
-            "Created collection: %s",
-            COLLECTION_NAME,
-        )
+            index_builder.add(record_id, metadata)
+            lexical_builder.add(
+                record_id,
+                document or "",
+                extra=str(metadata.get("id", "")),
+            )
+            indexed += 1
 
-        return collection
+    _save_side_indexes(
+        collection_name,
+        index_builder,
+        lexical_builder,
+    )
 
+    return indexed
 
-# ------------------------------------------------------------------
-# Initialization
-# ------------------------------------------------------------------
 
-def initialize_chromadb():
+def _partition_entry(
+    collection_name: str,
+    value: str,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+
+    catalog = get_partition_catalog(collection_name)
+
+    if catalog is None or value not in catalog["partitions"]:
+        raise ValueError(
+            f"{collection_name} has no partition '{value}'"
+        )
+
+    return catalog, catalog["partitions"][value]
+
+
+def archive_partition(
+    value: str,
+    collection_name: Optional[str] = None,
+    archive_dir: str = PARTITION_ARCHIVE_PATH,
+) -> str:
     """
-    Initialize ChromaDB client and collection.
+    Move a partition (e.g. an old quarter) out of the live store into
+    a compressed archive: documents + metadata as JSON, vectors as
+    float16. Later ingestions skip its records until it is restored.
 
     Returns:
-        (client, collection)
+        archive path
     """
 
-    client = chromadb.PersistentClient(
-        path=CHROMA_DB_PATH,
-        settings=Settings(
-            anonymized_telemetry=False
-        ),
+    collection_name = collection_name or COLLECTION_NAME
+    catalog, entry = _partition_entry(collection_name, value)
+
+    if entry.get("state") == "archived":
+        return entry["archive"]
+
+    rows = list(
+        _iter_collection(
+            get_pooled_collection(entry["collection"]),
+            include=("documents", "metadatas", "embeddings"),
+        )
     )
 
-    collection = _get_or_create_collection(client)
+    os.makedirs(archive_dir, exist_ok=True)
 
-    return client, collection
+    path = os.path.join(
+        archive_dir,
+        f"{entry['collection']}.npz",
+    )
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            ids=np.asarray([r[0] for r in rows], dtype=str),
+            documents=np.asarray(json.dumps([r[1] for r in rows], ensure_ascii=False)),
+            metadatas=np.asarray(json.dumps([r[2] for r in rows], ensure_ascii=False)),
+            embeddings=np.asarray([r[3] for r in rows], dtype=np.float16),
+        )
 
+    os.replace(tmp_path, path)
 
-# ------------------------------------------------------------------
-# Data Loading
-# ------------------------------------------------------------------
+    _drop_partition_collection(entry["collection"])
 
-def load_data_to_vectordb(
-    collection,
-    sales_data: List[Dict[str, Any]],
-    marketing_data: List[Dict[str, Any]],
-):
+    entry.update(
+        state="archived",
+        archive=path,
+        records=len(rows),
+    )
+
+    _save_partition_catalog(collection_name, catalog)
+    rebuild_partition_indexes(collection_name)
+    bump_collection_version(collection_name)
+
+    logger.info(
+        "Archived partition %s (%s records) to %s",
+        value,
+        len(rows),
+        path,
+    )
+
+    return path
+
+
+def restore_partition(
+    value: str,
+    collection_name: Optional[str] = None,
+) -> int:
     """
-    Load sales + marketing records into ChromaDB.
+    Load an archived partition back into the live store (no
+    re-embedding).
+
+    Returns:
+        number of records restored
     """
-    documents = []
-    
-    metadatas = []
-    ids = []
-
-    # ----------------------------------------------------------
-    # Sales records
-    # ----------------------------------------------------------
-
-    for sale in sales_data:
-
-        documents.append(
-            sale.get("description", "")
-        )
-
-        metadatas.append(
-            safe_metadata(
-                {
-                    "type": "sales",
-                    "id": sale.get("id"),
-                    "product": sale.get("product"),
-                    "category": sale.get("category"),
-                    "revenue": sale.get("revenue"),
-                    "units_sold": sale.get("units_sold"),
-                    "region": sale.get("region"),
-                    "quarter": sale.get("quarter"),
-                    "customer_segment": sale.get(
-                        "customer_segment"
-                    ),
-                    "sales_rep": sale.get(
-                        "sales_rep"
-                    ),
-                }
+
+    collection_name = collection_name or COLLECTION_NAME
+    catalog, entry = _partition_entry(collection_name, value)
+
+    if entry.get("state") != "archived":
+        return 0
+
+    with np.load(entry["archive"], allow_pickle=False) as data:
+        ids = data["ids"].tolist()
+        documents = json.loads(str(data["documents"]))
+        metadatas = json.loads(str(data["metadatas"]))
+        embeddings = data["embeddings"].astype(np.float32).tolist()
+
+    collection = get_pooled_collection(entry["collection"])
+
+    if ids:
+        with _write_batch(collection):
+            _upsert_chunked(
+                collection,
+                ids,
+                documents,
+                metadatas,
+                embeddings=embeddings,
             )
-        )
 
-        ids.append(
-            f"sales_{sale.get('id')}"
-        )
+    manifest = load_manifest()
+    manifest["collections"][entry["collection"]] = {
+        record_id: record_hash(document, metadata)
+        for record_id, document, metadata in zip(ids, documents, metadatas)
+    }
+    save_manifest(manifest)
 
-    # ----------------------------------------------------------
-    # Marketing records
-    # ----------------------------------------------------------
+    os.remove(entry["archive"])
 
-    for campaign in marketing_data:
+    entry.update(
+        state="active",
+        archive=None,
+        records=len(ids),
+    )
 
-        documents.append(
-            campaign.get(
-                "description",
-                "",
-            )
-        )
+    _save_partition_catalog(collection_name, catalog)
+    rebuild_partition_indexes(collection_name)
+    bump_collection_version(collection_name)
 
-        metadatas.append(
-            safe_metadata(
-                {
-                    "type": "marketing",
-                    "id": campaign.get("id"),
-                    "campaign_name": campaign.get(
-                        "campaign_name"
-                    ),
-                    "channel": campaign.get(
-                        "channel"
-                    ),
-                    "budget": campaign.get(
-                        "budget"
-                    ),
-                    "impressions": campaign.get(
-                        "impressions"
-                    ),
-                    "clicks": campaign.get(
-                        "clicks"
-                    ),
-                    "conversions": campaign.get(
-                        "conversions"
-                    ),
-                    "quarter": campaign.get(
-                        "quarter"
-                    ),
-                    "target_segment": campaign.get(
-                        "target_segment"
-                    ),
-                }
-            )
-        )
+    logger.info(
+        "Restored partition %s (%s records)",
+        value,
+        len(ids),
+    )
 
-        ids.append(
-            f"marketing_{campaign.get('id')}"
-        )
+    return len(ids)
 
-    if not documents:
-        logger.warning(
-            "No documents supplied for indexing."
-        )
-        return 0
 
-    try:
+def drop_partition(
+    value: str,
+    collection_name: Optional[str] = None,
+) -> None:
+    """
+    Delete a partition and its archive. The next ingestion recreates
+    it if the source still contains its records.
+    """
 
-        collection.upsert(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids,
-        )
+    collection_name = collection_name or COLLECTION_NAME
+    catalog, entry = _partition_entry(collection_name, value)
 
-    except AttributeError:
+    if entry.get("state") == "active":
+        _drop_partition_collection(entry["collection"])
 
-        collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids,
-        )
+    elif entry.get("archive") and os.path.exists(entry["archive"]):
+        os.remove(entry["archive"])
+
+    catalog["partitions"].pop(value)
+
+    _save_partition_catalog(collection_name, catalog)
+    rebuild_partition_indexes(collection_name)
+    bump_collection_version(collection_name)
 
     logger.info(
-        "Indexed %s documents.",
-        len(documents),
+        "Dropped partition %s",
+        value,
     )
 
-    return len(documents)
-
 
 # ------------------------------------------------------------------
 # Querying
@@ -278,11 +2224,17 @@ def query_vectordb(
         filter_dict or where
     )
 
-    query_params = {
-        "query_texts": [query_text],
+    query_params: Dict[str, Any] = {
         "n_results": n_results,
     }
 
+    query_embeddings = embed_texts([query_text])
+
+    if query_embeddings is not None:
+        query_params["query_embeddings"] = query_embeddings
+    else:
+        query_params["query_texts"] = [query_text]
+
     if effective_filter:
         query_params["where"] = (
             effective_filter
@@ -295,6 +2247,147 @@ def query_vectordb(
     return results
 
 
+def get_embeddings(
+    collection,
+    ids: List[str],
+) -> Optional[List[List[float]]]:
+    """
+    Stored embeddings for ids, in the same order.
+
+    None when any id is missing or the collection
+    has no stored vectors.
+    """
+
+    if not ids:
+        return []
+
+    stored = collection.get(
+        ids=list(ids),
+        include=["embeddings"],
+    )
+
+    vectors = stored.get("embeddings")
+
+    if vectors is None or len(vectors) != len(stored.get("ids") or []):
+        return None
+
+    by_id = {
+        record_id: vector
+        for record_id, vector in zip(stored["ids"], vectors)
+    }
+
+    if any(record_id not in by_id for record_id in ids):
+        return None
+
+    return [
+        list(by_id[record_id])
+        for record_id in ids
+    ]
+
+
+def _split_query_results(
+    results: Dict[str, Any],
+    index: int,
+) -> Dict[str, Any]:
+    """
+    Slice one query's answer out of a multi-query Chroma result.
+    """
+
+    single: Dict[str, Any] = {}
+
+    for key, value in (results or {}).items():
+
+        if isinstance(value, list) and len(value) > index and (
+            value[index] is None or isinstance(value[index], list)
+        ):
+            single[key] = [value[index]]
+
+        elif key == "included" or not isinstance(value, list):
+            single[key] = value
+
+        else:
+            single[key] = None
+
+    return single
+
+
+def query_vectordb_many(
+    collection,
+    queries: List[str],
+    filters: Optional[Any] = None,
+    n_results: int = 5,
+) -> List[Dict[str, Any]]:
+    """
+    Answer several queries with one embedding batch and as few Chroma
+    calls as possible.
+
+    `filters` is either one where-dict applied to every query or a list
+    aligned with `queries` (None entries mean unfiltered). Queries that
+    share a filter go to Chroma in a single call.
+
+    Returns:
+        one result dict per query, shaped like query_vectordb() output
+    """
+
+    if not queries:
+        return []
+
+    if filters is None or isinstance(filters, dict):
+        filters = [filters] * len(queries)
+
+    if len(filters) != len(queries):
+        raise ValueError(
+            "filters must align with queries"
+        )
+
+    embeddings = embed_texts(list(queries))
+
+    groups: Dict[str, List[int]] = {}
+
+    for i, where in enumerate(filters):
+
+        key = json.dumps(
+            where or None,
+            sort_keys=True,
+            default=str,
+        )
+        groups.setdefault(key, []).append(i)
+
+    answers: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+
+    for positions in groups.values():
+
+        query_params: Dict[str, Any] = {
+            "n_results": n_results,
+        }
+
+        if embeddings is not None:
+            query_params["query_embeddings"] = [
+                embeddings[i] for i in positions
+            ]
+        else:
+            query_params["query_texts"] = [
+                queries[i] for i in positions
+            ]
+
+        where = filters[positions[0]]
+
+        if where:
+            query_params["where"] = where
+
+        results = collection.query(
+            **query_params
+        )
+
+        for offset, i in enumerate(positions):
+            answers[i] = _split_query_results(
+                results,
+                offset,
+            )
+
+    return answers
+
+
 # ------------------------------------------------------------------
 # Statistics
 # ------------------------------------------------------------------
@@ -315,8 +2408,29 @@ def get_collection_stats(collection):
 def get_collection_breakdown(collection):
     """
     Counts docs by type.
+
+    Served from the columnar metadata index when it is in step with
+    the collection; falls back to scanning Chroma metadata otherwise.
     """
 
+    index = get_metadata_index(collection.name)
+
+    if index is not None and len(index) == collection.count():
+
+        by_type = index.breakdown("type")
+
+        sales_count = by_type.get("sales", 0)
+        marketing_count = by_type.get("marketing", 0)
+
+        return {
+            "sales_documents": sales_count,
+            "marketing_documents": marketing_count,
+            "total_documents": (
+                sales_count
+                + marketing_count
+            ),
+        }
+
     data = collection.get(
         include=["metadatas"]
     )
@@ -369,6 +2483,12 @@ def clear_collection(
             name=collection_name
         )
 
+        with _POOL_LOCK:
+            for key in [k for k in _COLLECTIONS if k[1] == collection_name]:
+                _COLLECTIONS.pop(key, None)
+
+        bump_collection_version(collection_name)
+
         logger.info(
             "Deleted collection: %s",
             collection_name,
@@ -431,15 +2551,180 @@ def search_and_preview(
 
 
 # ------------------------------------------------------------------
-# Test
+# CLI
 # ------------------------------------------------------------------
 
-if __name__ == "__main__":
+def _cli():
+
+    parser = argparse.ArgumentParser(
+        description="Vector DB maintenance"
+    )
+
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser(
+        "stats",
+        help="Show collection stats (default)",
+    )
+
+    ingest = sub.add_parser(
+        "ingest",
+        help="Ingest data/*.json and report documents/sec",
+    )
+    ingest.add_argument("--sales", default=SALES_DATA_PATH)
+    ingest.add_argument("--marketing", default=MARKETING_DATA_PATH)
+    ingest.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    ingest.add_argument(
+        "--workers",
+        type=int,
+        default=INGEST_EMBED_WORKERS,
+        help="Embedding workers (0 = embed inside Chroma upsert)",
+    )
+    ingest.add_argument(
+        "--mode",
+        choices=["thread", "process"],
+        default=INGEST_EMBED_MODE,
+    )
+    ingest.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the manifest and re-embed every record",
+    )
+    ingest.add_argument(
+        "--partition-by",
+        choices=list(PARTITION_FIELDS),
+        default=VECTOR_PARTITION_BY or None,
+        help="Write one collection per value (default: VECTOR_PARTITION_BY)",
+    )
+
+    sub.add_parser(
+        "partitions",
+        help="List the partitions of the collection",
+    )
+
+    for command, help_text in (
+        ("archive-partition", "Move a partition into a compressed archive"),
+        ("restore-partition", "Load an archived partition back"),
+        ("drop-partition", "Delete a partition and its archive"),
+    ):
+        maintenance = sub.add_parser(
+            command,
+            help=help_text,
+        )
+        maintenance.add_argument(
+            "value",
+            help='Partition value, e.g. "Q1 2023"',
+        )
+
+    export = sub.add_parser(
+        "export-store",
+        help="Copy stored vectors between backends (default chroma -> numpy)",
+    )
+    export.add_argument(
+        "--source",
+        choices=sorted(BACKENDS),
+        default="chroma",
+    )
+    export.add_argument(
+        "--target",
+        choices=sorted(BACKENDS),
+        default="numpy",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "export-store":
+
+        copied = export_vector_store(
+            source_backend=args.source,
+            target_backend=args.target,
+        )
+
+        print(
+            f"\nExported {copied} records "
+            f"from {args.source} to {args.target}"
+        )
+
+        return
+
+    if args.command == "partitions":
+
+        catalog = get_partition_catalog()
+
+        if catalog is None:
+            print(f"\n{COLLECTION_NAME} is not partitioned")
+            return
+
+        print(f"\nPartitions of {COLLECTION_NAME} by {catalog.get('partition_by')}:")
+
+        for value, entry in sorted(catalog["partitions"].items()):
+            print(f"  {value:<12} {entry['state']:<9} {entry['records']:>8} records  {entry['collection']}")
+
+        return
+
+    if args.command in ("archive-partition", "restore-partition", "drop-partition"):
+
+        action = {
+            "archive-partition": archive_partition,
+            "restore-partition": restore_partition,
+            "drop-partition": drop_partition,
+        }[args.command]
+
+        print(action(args.value))
+
+        return
+
+    if args.command == "ingest" and args.partition_by:
+
+        stats = ingest_partitioned_files(
+            sales_path=args.sales,
+            marketing_path=args.marketing,
+            partition_by=args.partition_by,
+            incremental=not args.full,
+            batch_size=args.batch_size,
+            embed_workers=args.workers,
+            embed_mode=args.mode,
+        )
+
+        print(
+            "\nPartitioned ingestion:"
+        )
+        print(
+            {k: v for k, v in stats.items() if k != "partitions"}
+        )
+        print(
+            f"{len(stats['partitions'])} partitions, "
+            f"{stats.get('docs_per_sec', 0.0)} documents/sec"
+        )
+
+        return
 
     client, collection = (
         initialize_chromadb()
     )
 
+    if args.command == "ingest":
+
+        stats = ingest_data_files(
+            collection,
+            sales_path=args.sales,
+            marketing_path=args.marketing,
+            incremental=not args.full,
+            batch_size=args.batch_size,
+            embed_workers=args.workers,
+            embed_mode=args.mode,
+        )
+
+        print(
+            "\nIngestion:"
+        )
+        print(stats)
+        print(
+            f"{stats.get('docs_per_sec', 0.0)} documents/sec"
+        )
+
+        return
+
     print(
         "\nCollection Stats:"
     )
@@ -457,4 +2742,7 @@ if __name__ == "__main__":
             collection
         )
     )
-```
+
+
+if __name__ == "__main__":
+    _cli()